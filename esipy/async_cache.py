@@ -0,0 +1,223 @@
+# -*- encoding: utf-8 -*-
+""" Cache implementations for asyncio code.
+
+The methods of these caches are coroutines, so cache I/O does not block
+the event loop. Synchronous caches (esipy.cache) can be used through
+AsyncCacheAdapter, that runs them in an executor.
+"""
+import asyncio
+import datetime
+import functools
+import logging
+
+from .cache import DictCache
+from .cache import FileCache
+from .cache import _hash
+
+try:
+    import pickle
+except ImportError:  # pragma: no cover
+    import cPickle as pickle
+
+LOGGER = logging.getLogger(__name__)
+
+
+class AsyncBaseCache(object):
+    """ Base async cache 'abstract' object that defines the cache methods.
+    Same methods as esipy.cache.BaseCache, as coroutines. """
+
+    async def set(self, key, value, expire=300):
+        """ Set a value in the cache. """
+        raise NotImplementedError
+
+    async def get(self, key, default=None):
+        """ Get a value in the cache, return default if not exist """
+        raise NotImplementedError
+
+    async def invalidate(self, key):
+        """ Invalidate a cache key """
+        raise NotImplementedError
+
+    async def get_many(self, keys, default=None):
+        """ Get multiple values from the cache.
+
+        Default implementation runs the get() concurrently, backends able
+        to do better (pipelines, multi gets) should override it.
+
+        :param keys: iterable of cache keys
+        :param default: value to use for missing keys
+        :return: a list of values, in the same order as keys
+        """
+        return list(await asyncio.gather(
+            *[self.get(key, default) for key in keys]
+        ))
+
+    async def set_many(self, items):
+        """ Set multiple values in the cache.
+
+        :param items: iterable of (key, value, expire) tuples
+        """
+        await asyncio.gather(
+            *[self.set(key, value, expire) for key, value, expire in items]
+        )
+
+    async def invalidate_many(self, keys):
+        """ Invalidate multiple cache keys """
+        await asyncio.gather(*[self.invalidate(key) for key in keys])
+
+
+class AsyncCacheAdapter(AsyncBaseCache):
+    """ Run a synchronous BaseCache in an executor, so its I/O (disk,
+    network...) runs in threads while the event loop keeps running.
+
+    The bulk methods run the sync bulk methods as one executor call, to
+    keep their optimizations (pipelines, transactions...).
+    """
+
+    def __init__(self, cache, executor=None):
+        """ Constructor
+
+        :param cache: the esipy.cache.BaseCache to wrap
+        :param executor: (optional) the concurrent.futures executor used
+        to run the cache methods. Default: the event loop default executor
+        """
+        self.cache = cache
+        self.executor = executor
+
+    def _run(self, method, *args):
+        """ run a method of the wrapped cache in the executor """
+        return asyncio.get_event_loop().run_in_executor(
+            self.executor,
+            functools.partial(method, *args)
+        )
+
+    async def set(self, key, value, expire=300):
+        return await self._run(self.cache.set, key, value, expire)
+
+    async def get(self, key, default=None):
+        return await self._run(self.cache.get, key, default)
+
+    async def invalidate(self, key):
+        return await self._run(self.cache.invalidate, key)
+
+    async def get_many(self, keys, default=None):
+        return await self._run(self.cache.get_many, list(keys), default)
+
+    async def set_many(self, items):
+        return await self._run(self.cache.set_many, list(items))
+
+    async def invalidate_many(self, keys):
+        return await self._run(self.cache.invalidate_many, list(keys))
+
+
+class AsyncDictCache(AsyncBaseCache):
+    """ In-process async cache, using a DictCache to store the data.
+    Nothing blocks, so no executor is used.
+
+    Caution: like DictCache, it does not expire keys !"""
+
+    def __init__(self, cache=None):
+        """ Constructor
+
+        :param cache: (optional) the DictCache used to store the data, to
+        share it with synchronous code. Default: a new DictCache
+        """
+        self.cache = DictCache() if cache is None else cache
+
+    async def set(self, key, value, expire=300):
+        self.cache.set(key, value, expire)
+
+    async def get(self, key, default=None):
+        return self.cache.get(key, default)
+
+    async def invalidate(self, key):
+        self.cache.invalidate(key)
+
+    async def get_many(self, keys, default=None):
+        return self.cache.get_many(keys, default)
+
+    async def set_many(self, items):
+        self.cache.set_many(items)
+
+    async def invalidate_many(self, keys):
+        self.cache.invalidate_many(keys)
+
+
+class AsyncFileCache(AsyncCacheAdapter):
+    """ Async cache storing the data in files, using FileCache (diskcache)
+    in an executor, as diskcache has no asyncio API.
+
+    This cache requires you to install diskcache using `pip install diskcache`
+    """
+
+    def __init__(self, path, executor=None, **settings):
+        """ Constructor
+
+        :param path: the path on the disk to save the data
+        :param executor: (optional) the executor running the disk I/O
+        :param settings: the settings values for diskcache
+        """
+        super(AsyncFileCache, self).__init__(
+            FileCache(path, **settings),
+            executor
+        )
+
+
+class AsyncRedisCache(AsyncBaseCache):
+    """ Async cache for Redis, using the asyncio client of redis-py.
+    Keys and values are stored the same way as RedisCache, so both can
+    share the same redis database.
+
+    This cache handler requires the redis package (>= 4.2) to be installed
+    `pip install redis`
+    """
+
+    def __init__(self, redis_client):
+        """ redis_client must be an instance of redis.asyncio.Redis"""
+        from redis.asyncio import Redis
+        if not isinstance(redis_client, Redis):
+            raise TypeError('cache must be an instance of redis.asyncio.Redis')
+        self._r = redis_client
+
+    async def get(self, key, default=None):
+        value = await self._r.get(_hash(key))
+        return pickle.loads(value) if value is not None else default
+
+    async def set(self, key, value, expire=300):
+        if expire is None or expire == 0:
+            return await self._r.set(_hash(key), pickle.dumps(value))
+        return await self._r.setex(
+            name=_hash(key),
+            value=pickle.dumps(value),
+            time=datetime.timedelta(seconds=int(expire)),
+        )
+
+    async def invalidate(self, key):
+        return await self._r.delete(_hash(key))
+
+    async def get_many(self, keys, default=None):
+        keys = list(keys)
+        if not keys:
+            return []
+        values = await self._r.mget([_hash(key) for key in keys])
+        return [
+            pickle.loads(value) if value is not None else default
+            for value in values
+        ]
+
+    async def set_many(self, items):
+        pipe = self._r.pipeline(transaction=False)
+        for key, value, expire in items:
+            if expire is None or expire == 0:
+                pipe.set(_hash(key), pickle.dumps(value))
+            else:
+                pipe.setex(
+                    name=_hash(key),
+                    value=pickle.dumps(value),
+                    time=datetime.timedelta(seconds=int(expire)),
+                )
+        await pipe.execute()
+
+    async def invalidate_many(self, keys):
+        keys = [_hash(key) for key in keys]
+        return await self._r.delete(*keys) if keys else 0
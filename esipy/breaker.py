@@ -0,0 +1,103 @@
+# -*- encoding: utf-8 -*-
+""" Circuit breaker used to stop calling something that keeps failing """
+import logging
+import threading
+import time
+
+LOGGER = logging.getLogger(__name__)
+
+
+class CircuitBreaker(object):
+    """ Circuit breaker with the 3 usual states:
+
+    - closed: everything is allowed, consecutive failures are counted.
+    - open: after `failure_threshold` consecutive failures, nothing is
+      allowed for `reset_timeout` seconds.
+    - half-open: after that delay, up to `half_open_calls` trial calls
+      are allowed. A success closes the circuit, a failure opens it again.
+    """
+
+    CLOSED = 'closed'
+    OPEN = 'open'
+    HALF_OPEN = 'half-open'
+
+    def __init__(self, failure_threshold=5, reset_timeout=30,
+                 half_open_calls=1, name=None):
+        """ Constructor
+
+        :param failure_threshold: consecutive failures that open the circuit
+        :param reset_timeout: time (in s) before trying again after opening
+        :param half_open_calls: trial calls allowed in half-open state
+        :param name: (optional) name used in logs
+        """
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.half_open_calls = half_open_calls
+        self.name = name
+
+        self._lock = threading.Lock()
+        self._state = self.CLOSED
+        self._failures = 0
+        self._opened_at = 0
+        self._trials = 0
+        self.stats = {
+            'successes': 0,
+            'failures': 0,
+            'rejected': 0,
+            'opened': 0,
+        }
+
+    @property
+    def state(self):
+        """ Return the current state of the circuit """
+        with self._lock:
+            self._update_state()
+            return self._state
+
+    def _update_state(self):
+        """ switch from open to half-open once reset_timeout is over.
+        Must be called with the lock acquired """
+        if (self._state == self.OPEN
+                and time.time() - self._opened_at >= self.reset_timeout):
+            self._state = self.HALF_OPEN
+            self._trials = 0
+
+    def allow(self):
+        """ Return True if a call is allowed, False if it must be
+        short-circuited. In half-open state, this reserves a trial call. """
+        with self._lock:
+            self._update_state()
+            if self._state == self.CLOSED:
+                return True
+            if (self._state == self.HALF_OPEN
+                    and self._trials < self.half_open_calls):
+                self._trials += 1
+                return True
+            self.stats['rejected'] += 1
+            return False
+
+    def success(self):
+        """ Record a successful call """
+        with self._lock:
+            self.stats['successes'] += 1
+            self._failures = 0
+            if self._state != self.CLOSED:
+                LOGGER.info('Circuit "%s" closed.', self.name)
+            self._state = self.CLOSED
+
+    def failure(self):
+        """ Record a failed call """
+        with self._lock:
+            self.stats['failures'] += 1
+            self._failures += 1
+            if (self._state == self.HALF_OPEN
+                    or self._failures >= self.failure_threshold):
+                if self._state != self.OPEN:
+                    self.stats['opened'] += 1
+                    LOGGER.warning(
+                        'Circuit "%s" opened after %d failures.',
+                        self.name,
+                        self._failures
+                    )
+                self._state = self.OPEN
+                self._opened_at = time.time()
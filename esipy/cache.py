@@ -1,8 +1,27 @@
 # -*- encoding: utf-8 -*-
 """ Cache objects for EsiPy """
+import bisect
 import hashlib
 import logging
 import datetime
+import math
+import mmap
+import os
+import re
+import sqlite3
+import struct
+import tempfile
+import threading
+import time
+import uuid
+
+from collections import OrderedDict
+from contextlib import contextmanager
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+from concurrent.futures import TimeoutError as FutureTimeoutError
+
+from .breaker import CircuitBreaker
 
 try:
     import pickle
@@ -11,11 +30,47 @@ except ImportError:  # pragma: no cover
 
 LOGGER = logging.getLogger(__name__)
 
+# value wrapper used by TaggedCache, tags is a tuple of (tag, generation)
+_TaggedValue = namedtuple('_TaggedValue', ['value', 'tags'])
+
+# snapshot file header and record header (expire timestamp, length)
+_SNAPSHOT_MAGIC = b'ESIPYSNP\x01'
+_SNAPSHOT_RECORD = struct.Struct('<dI')
+
+
+class _HashedKey(str):
+    """ Key already hashed by _hash, used to restore entries of backends
+    storing hashed keys """
+
+
+# content placeholder used by BlobCache, filename is relative to the path
+_BlobRef = namedtuple('_BlobRef', ['filename', 'size'])
+
+
+def _canonical(data):
+    """ return data with sets and dicts replaced by sorted tuples, so the
+    pickled value does not depend on the process hash seed """
+    if isinstance(data, (set, frozenset)):
+        return ('__set__', tuple(sorted(
+            (_canonical(item) for item in data), key=repr
+        )))
+    if isinstance(data, dict):
+        return ('__dict__', tuple(sorted(
+            (_canonical(item) for item in data.items()), key=repr
+        )))
+    if isinstance(data, (tuple, list)):
+        return tuple(_canonical(item) for item in data)
+    return data
+
 
 def _hash(data):
     """ generate a hash from data object to be used as cache key """
+    if isinstance(data, _HashedKey):
+        return str(data)
     hash_algo = hashlib.new('md5')
-    hash_algo.update(pickle.dumps(data))
+    # fixed protocol and canonical form: the hash must be the same in every
+    # process using the same (shared) cache
+    hash_algo.update(pickle.dumps(_canonical(data), 2))
     # prefix allows possibility of multiple applications
     # sharing same keyspace
     return 'esi_' + hash_algo.hexdigest()
@@ -38,6 +93,104 @@ class BaseCache(object):
         """ Invalidate a cache key """
         raise NotImplementedError
 
+    def get_many(self, keys, default=None):
+        """ Get multiple values from the cache.
+
+        Default implementation loops over get(), backends able to do
+        better (pipelines, multi gets) should override it.
+
+        :param keys: iterable of cache keys
+        :param default: value to use for missing keys
+        :return: a list of values, in the same order as keys
+        """
+        return [self.get(key, default) for key in keys]
+
+    def set_many(self, items):
+        """ Set multiple values in the cache.
+
+        :param items: iterable of (key, value, expire) tuples
+        """
+        for key, value, expire in items:
+            self.set(key, value, expire)
+
+    def invalidate_many(self, keys):
+        """ Invalidate multiple cache keys """
+        for key in keys:
+            self.invalidate(key)
+
+    def iter_items(self):
+        """ Iterate over the entries of the cache, as tuples of
+        (key, value, expire_at), expire_at being a timestamp or 0 if the
+        entry never expires. Required for snapshots. """
+        raise NotImplementedError
+
+    def dump_snapshot(self, path):
+        """ Write all the entries not expired in a snapshot file.
+
+        :param path: the path of the snapshot file
+        :return: the number of entries written
+        """
+        count = 0
+        now = time.time()
+        tmp_path = '%s.%s.tmp' % (path, uuid.uuid4().hex)
+        with open(tmp_path, 'wb') as snapshot:
+            snapshot.write(_SNAPSHOT_MAGIC)
+            for key, value, expire_at in self.iter_items():
+                if expire_at and expire_at <= now:
+                    continue
+                data = pickle.dumps((key, value), pickle.HIGHEST_PROTOCOL)
+                snapshot.write(_SNAPSHOT_RECORD.pack(expire_at, len(data)))
+                snapshot.write(data)
+                count += 1
+        os.rename(tmp_path, path)
+        return count
+
+    def load_snapshot(self, path, batch_size=500):
+        """ Load the entries of a snapshot file in the cache, with
+        set_many() by batches. The file is read through a memory map and
+        entries expired since the dump are skipped without being unpickled.
+
+        :param path: the path of the snapshot file
+        :param batch_size: the number of entries in each set_many call
+        :return: the number of entries loaded
+        """
+        count = 0
+        with open(path, 'rb') as snapshot:
+            if os.fstat(snapshot.fileno()).st_size < len(_SNAPSHOT_MAGIC):
+                raise ValueError('%s is not an esipy snapshot' % path)
+            mapped = mmap.mmap(snapshot.fileno(), 0, access=mmap.ACCESS_READ)
+
+        try:
+            if mapped[:len(_SNAPSHOT_MAGIC)] != _SNAPSHOT_MAGIC:
+                raise ValueError('%s is not an esipy snapshot' % path)
+
+            now = time.time()
+            batch = []
+            offset = len(_SNAPSHOT_MAGIC)
+            while offset < len(mapped):
+                expire_at, length = _SNAPSHOT_RECORD.unpack_from(
+                    mapped, offset
+                )
+                offset += _SNAPSHOT_RECORD.size
+                if not expire_at or expire_at > now:
+                    key, value = pickle.loads(mapped[offset:offset + length])
+                    expire = (
+                        int(math.ceil(expire_at - now)) if expire_at else 0
+                    )
+                    batch.append((key, value, expire))
+                offset += length
+
+                if len(batch) >= batch_size:
+                    self.set_many(batch)
+                    count += len(batch)
+                    batch = []
+            if batch:
+                self.set_many(batch)
+                count += len(batch)
+        finally:
+            mapped.close()
+        return count
+
 
 class FileCache(BaseCache):
     """ BaseCache implementation using files to store the data.
@@ -74,26 +227,57 @@ class FileCache(BaseCache):
     def invalidate(self, key):
         self._cache.delete(_hash(key))
 
+    def set_many(self, items):
+        # one transaction for the whole batch instead of one per key
+        with self._cache.transact():
+            for key, value, expire in items:
+                self.set(key, value, expire)
+
+    def invalidate_many(self, keys):
+        with self._cache.transact():
+            for key in keys:
+                self.invalidate(key)
+
+    def iter_items(self):
+        for key in self._cache.iterkeys():
+            value, expire_at = self._cache.get(
+                key, default=_HashedKey, expire_time=True
+            )
+            if value is not _HashedKey:
+                yield _HashedKey(key), value, expire_at or 0
+
 
 class DictCache(BaseCache):
     """ BaseCache implementation using Dict to store the cached data.
 
-    Caution: due to its nature, DictCache do not expire keys !"""
+    Caution: due to its nature, DictCache do not expire keys !
+    Expiry is only kept for snapshots."""
 
     def __init__(self):
         self._dict = {}
+        self._expires = {}
 
     def get(self, key, default=None):
         return self._dict.get(key, default)
 
     def set(self, key, value, expire=300):
         self._dict[key] = value
+        if expire:
+            self._expires[key] = time.time() + int(expire)
+        else:
+            self._expires.pop(key, None)
 
     def invalidate(self, key):
         self._dict.pop(key, None)
+        self._expires.pop(key, None)
 
     def clear(self):
         self._dict.clear()
+        self._expires.clear()
+
+    def iter_items(self):
+        for key, value in list(self._dict.items()):
+            yield key, value, self._expires.get(key, 0)
 
 
 class DummyCache(BaseCache):
@@ -116,28 +300,165 @@ class DummyCache(BaseCache):
 class MemcachedCache(BaseCache):
     """ Base cache implementation for memcached.
 
+    Values are pickled before being stored. Values bigger than the
+    memcached item size limit are split in chunks stored under versioned
+    keys, and a small manifest is stored in the key itself once all
+    chunks are written: readers never get chunks from different values.
+    The chunks of the previous value are deleted when a key is set again
+    or invalidated.
+
     This cache requires you to install memcached using
     `pip install python-memcached`
     """
 
-    def __init__(self, memcache_client):
+    CHUNKED = 'esipy:chunked'
+
+    def __init__(self, memcache_client, chunk_size=None):
         """ memcache_client must be an instance of memcache.Client().
+
+        chunk_size is the max size of a stored item, default is the
+        client max value length minus some room for memcached overhead.
         """
         import memcache
         if not isinstance(memcache_client, memcache.Client):
             raise TypeError('cache must be an instance of memcache.Client')
         self._mc = memcache_client
+        if chunk_size is None:
+            chunk_size = getattr(
+                memcache_client,
+                'server_max_value_length',
+                1024 * 1024
+            ) - 1024
+        self.chunk_size = chunk_size
+
+    def _prepare(self, hashed_key, value):
+        """ pickle the value, return the mappings of chunks then main key
+        items to store """
+        data = pickle.dumps(value, pickle.HIGHEST_PROTOCOL)
+        if len(data) <= self.chunk_size:
+            return {}, {hashed_key: data}
+
+        version = uuid.uuid4().hex
+        chunks = {}
+        for index, offset in enumerate(
+                range(0, len(data), self.chunk_size)):
+            chunks['%s:%s:%d' % (hashed_key, version, index)] = (
+                data[offset:offset + self.chunk_size]
+            )
+        manifest = (self.CHUNKED, version, len(chunks), len(data))
+        return chunks, {hashed_key: manifest}
+
+    def _store(self, by_expire):
+        """ store the (chunks, main) mappings for each expire, chunks
+        first so a manifest never references missing chunks """
+        result = True
+        for expire, (chunks, main) in by_expire.items():
+            if chunks:
+                failed = self._mc.set_multi(chunks, time=expire)
+                if failed:
+                    # do not publish manifests whose chunks are missing
+                    failed_keys = set(key.split(':')[0] for key in failed)
+                    for key in failed_keys:
+                        LOGGER.warning('Could not store all chunks of %s', key)
+                        main.pop(key, None)
+                    result = False
+            if main and self._mc.set_multi(main, time=expire):
+                result = False
+        return result
+
+    def _chunk_keys(self, hashed_key, manifest):
+        """ return the chunk keys of a manifest """
+        return [
+            '%s:%s:%d' % (hashed_key, manifest[1], index)
+            for index in range(manifest[2])
+        ]
+
+    def _is_chunked(self, value):
+        """ return True if value is a chunked value manifest """
+        return isinstance(value, tuple) and value[0] == self.CHUNKED
+
+    def _delete_chunks(self, hashed_keys):
+        """ delete the chunks of the values currently stored in the keys,
+        so they do not stay in memcached until evicted """
+        chunk_keys = []
+        for hashed, value in self._mc.get_multi(hashed_keys).items():
+            if self._is_chunked(value):
+                chunk_keys.extend(self._chunk_keys(hashed, value))
+        if chunk_keys:
+            self._mc.delete_multi(chunk_keys)
+
+    def _load(self, hashed_keys, values, default):
+        """ unpickle the raw values, fetching chunks of chunked values """
+        chunk_keys = []
+        for hashed, value in zip(hashed_keys, values):
+            if self._is_chunked(value):
+                chunk_keys.extend(self._chunk_keys(hashed, value))
+        chunks = self._mc.get_multi(chunk_keys) if chunk_keys else {}
+
+        result = []
+        for hashed, value in zip(hashed_keys, values):
+            if value is None:
+                result.append(default)
+            elif self._is_chunked(value):
+                parts = [
+                    chunks.get(chunk_key)
+                    for chunk_key in self._chunk_keys(hashed, value)
+                ]
+                data = None
+                if all(part is not None for part in parts):
+                    data = b''.join(parts)
+                # a chunk was evicted, consider it a miss
+                if data is None or len(data) != value[3]:
+                    result.append(default)
+                else:
+                    result.append(pickle.loads(data))
+            else:
+                result.append(pickle.loads(value))
+        return result
 
     def get(self, key, default=None):
-        value = self._mc.get(_hash(key))
-        return value if value is not None else default
+        return self.get_many([key], default)[0]
 
     def set(self, key, value, expire=300):
-        expire = 0 if expire is None else expire
-        return self._mc.set(_hash(key), value, time=int(expire))
+        expire = 0 if expire is None else int(expire)
+        hashed_key = _hash(key)
+        self._delete_chunks([hashed_key])
+        return self._store({expire: self._prepare(hashed_key, value)})
 
     def invalidate(self, key):
-        return self._mc.delete(_hash(key))
+        hashed_key = _hash(key)
+        self._delete_chunks([hashed_key])
+        return self._mc.delete(hashed_key)
+
+    def get_many(self, keys, default=None):
+        hashed_keys = [_hash(key) for key in keys]
+        values = self._mc.get_multi(hashed_keys)
+        return self._load(
+            hashed_keys,
+            [values.get(hashed) for hashed in hashed_keys],
+            default
+        )
+
+    def set_many(self, items):
+        # memcached multi set only support one expire per call
+        by_expire = {}
+        for key, value, expire in items:
+            expire = 0 if expire is None else int(expire)
+            chunks, main = self._prepare(_hash(key), value)
+            group = by_expire.setdefault(expire, ({}, {}))
+            group[0].update(chunks)
+            group[1].update(main)
+        self._delete_chunks([
+            hashed_key
+            for _, main in by_expire.values()
+            for hashed_key in main
+        ])
+        return self._store(by_expire)
+
+    def invalidate_many(self, keys):
+        hashed_keys = [_hash(key) for key in keys]
+        self._delete_chunks(hashed_keys)
+        return self._mc.delete_multi(hashed_keys)
 
 
 class RedisCache(BaseCache):
@@ -169,3 +490,1373 @@ class RedisCache(BaseCache):
 
     def invalidate(self, key):
         return self._r.delete(_hash(key))
+
+    def get_many(self, keys, default=None):
+        keys = list(keys)
+        if not keys:
+            return []
+        values = self._r.mget([_hash(key) for key in keys])
+        return [
+            pickle.loads(value) if value is not None else default
+            for value in values
+        ]
+
+    def set_many(self, items):
+        pipe = self._r.pipeline(transaction=False)
+        for key, value, expire in items:
+            if expire is None or expire == 0:
+                pipe.set(_hash(key), pickle.dumps(value))
+            else:
+                pipe.setex(
+                    name=_hash(key),
+                    value=pickle.dumps(value),
+                    time=datetime.timedelta(seconds=int(expire)),
+                )
+        pipe.execute()
+
+    def invalidate_many(self, keys):
+        keys = [_hash(key) for key in keys]
+        return self._r.delete(*keys) if keys else 0
+
+
+class WriteBehindCache(BaseCache):
+    """ BaseCache wrapper that writes entries to another cache from a
+    background thread, so a slow backend (network, fsync...) does not add
+    its latency to the requests.
+
+    Pending writes are coalesced by key (only the last value for a key is
+    written), sent in batches using set_many / invalidate_many, and the
+    queue is bounded: when it is full, new keys are dropped and counted
+    in the stats.
+
+    Reads check the pending writes and the batch being written first, so
+    a value set is readable right away, even before it reaches the
+    backend.
+    """
+
+    _INVALIDATE = object()
+
+    def __init__(self, cache, max_queue=1000, batch_size=100,
+                 flush_interval=0.05):
+        """ Constructor
+
+        Arguments:
+            cache {BaseCache} -- The cache where entries are written
+            max_queue {int} -- The max number of pending keys
+            batch_size {int} -- The max number of keys written at once
+            flush_interval {float} -- Time (in s) waited to fill a batch
+        """
+        if not isinstance(cache, BaseCache):
+            raise TypeError('cache must be an instance of BaseCache')
+        self._cache = cache
+        self.max_queue = max_queue
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+
+        self._pending = OrderedDict()
+        self._writing = {}
+        self._in_flight = 0
+        self._stopped = False
+        self._cond = threading.Condition()
+        self._stats = {
+            'queued': 0,
+            'coalesced': 0,
+            'dropped': 0,
+            'written': 0,
+            'invalidated': 0,
+            'batches': 0,
+            'errors': 0,
+        }
+
+        self._worker = threading.Thread(
+            target=self._run,
+            name='esipy-write-behind'
+        )
+        self._worker.daemon = True
+        self._worker.start()
+
+    @property
+    def stats(self):
+        """ Return a copy of the write counters, and the queue size """
+        with self._cond:
+            stats = dict(self._stats)
+            stats['pending'] = len(self._pending)
+        return stats
+
+    def _enqueue(self, key, entry):
+        """ Add an operation in the queue, return False if dropped """
+        with self._cond:
+            if self._stopped:
+                raise RuntimeError('WriteBehindCache is closed')
+            if key in self._pending:
+                self._stats['coalesced'] += 1
+            elif len(self._pending) >= self.max_queue:
+                self._stats['dropped'] += 1
+                return False
+            else:
+                self._stats['queued'] += 1
+            self._pending[key] = entry
+            self._cond.notify_all()
+        return True
+
+    def get(self, key, default=None):
+        with self._cond:
+            entry = self._pending.get(key, None)
+            if entry is None:
+                entry = self._writing.get(key, None)
+        if entry is not None:
+            value, _ = entry
+            return default if value is self._INVALIDATE else value
+        return self._cache.get(key, default)
+
+    def set(self, key, value, expire=300):
+        self._enqueue(key, (value, expire))
+
+    def invalidate(self, key):
+        # invalidation is queued too, so it cannot be overwritten by
+        # a pending set written after it
+        if not self._enqueue(key, (self._INVALIDATE, None)):
+            self._cache.invalidate(key)
+
+    def _next_batch(self):
+        """ Wait for pending writes and pop a batch of them.
+        Return None when the cache is closed and everything is written """
+        with self._cond:
+            while not self._pending and not self._stopped:
+                self._cond.wait()
+            if not self._pending:
+                return None
+
+            # give some time for the batch to fill up
+            end = time.time() + self.flush_interval
+            while len(self._pending) < self.batch_size and not self._stopped:
+                remaining = end - time.time()
+                if remaining <= 0:
+                    break
+                self._cond.wait(remaining)
+
+            batch = []
+            while self._pending and len(batch) < self.batch_size:
+                batch.append(self._pending.popitem(last=False))
+            self._writing = dict(batch)
+            self._in_flight += 1
+            return batch
+
+    def _run(self):
+        """ Background thread loop, writing batches to the cache """
+        while True:
+            batch = self._next_batch()
+            if batch is None:
+                return
+
+            to_set = []
+            to_invalidate = []
+            for key, (value, expire) in batch:
+                if value is self._INVALIDATE:
+                    to_invalidate.append(key)
+                else:
+                    to_set.append((key, value, expire))
+
+            errors = 0
+            try:
+                if to_set:
+                    self._cache.set_many(to_set)
+                if to_invalidate:
+                    self._cache.invalidate_many(to_invalidate)
+            except Exception:  # pylint: disable=W0703
+                errors = 1
+                LOGGER.exception('Error while writing cache batch.')
+
+            with self._cond:
+                self._writing = {}
+                self._in_flight -= 1
+                self._stats['batches'] += 1
+                self._stats['errors'] += errors
+                if not errors:
+                    self._stats['written'] += len(to_set)
+                    self._stats['invalidated'] += len(to_invalidate)
+                self._cond.notify_all()
+
+    def flush(self, timeout=None):
+        """ Wait until all pending writes are done.
+
+        :param timeout: max time to wait in seconds, None waits forever
+        :return: True if everything was written, False on timeout
+        """
+        end = None if timeout is None else time.time() + timeout
+        with self._cond:
+            while self._pending or self._in_flight:
+                remaining = None if end is None else end - time.time()
+                if remaining is not None and remaining <= 0:
+                    return False
+                self._cond.wait(remaining)
+        return True
+
+    def close(self, timeout=None):
+        """ Write all pending entries then stop the background thread """
+        with self._cond:
+            self._stopped = True
+            self._cond.notify_all()
+        self._worker.join(timeout)
+
+
+class ShardedCache(BaseCache):
+    """ BaseCache implementation that spreads the keys over multiple
+    caches (redis, memcached... nodes) using consistent hashing.
+
+    When a node raises a connection or timeout error, it is considered
+    down for `retry_after` seconds and its keys go to the next node on the
+    ring, so the cache keeps working (with some misses) while a node is
+    unavailable. Other errors (ie: a value that can't be pickled) are
+    raised, as the next nodes would fail the same way.
+    Bulk operations are grouped by node.
+    """
+
+    def __init__(self, caches, replicas=100, retry_after=30,
+                 node_errors=None):
+        """ Constructor
+
+        Arguments:
+            caches {list|dict} -- The BaseCache nodes. Use a dict to give
+                them a name: keys only move if the names change.
+            replicas {int} -- The number of points of each node on the ring
+            retry_after {int} -- Time (in s) a failing node is skipped
+            node_errors {tuple} -- The exception types marking a node as
+                down. Default: socket, connection and timeout errors
+        """
+        if not isinstance(caches, dict):
+            caches = dict(
+                ('shard-%d' % index, cache)
+                for index, cache in enumerate(caches)
+            )
+        if not caches:
+            raise ValueError('ShardedCache requires at least one cache')
+        for cache in caches.values():
+            if not isinstance(cache, BaseCache):
+                raise TypeError('caches must be instances of BaseCache')
+
+        self._caches = caches
+        self.retry_after = retry_after
+        self.node_errors = node_errors or self._default_node_errors()
+        self._down = {}
+        self._lock = threading.Lock()
+
+        ring = []
+        for name in caches:
+            for replica in range(replicas):
+                ring.append((self._position('%s-%d' % (name, replica)), name))
+        ring.sort()
+        self._ring_positions = [position for position, _ in ring]
+        self._ring_nodes = [name for _, name in ring]
+
+    @staticmethod
+    def _default_node_errors():
+        """ return the connection and timeout errors of the backends """
+        errors = (EnvironmentError, FutureTimeoutError)
+        try:
+            import redis
+            errors += (
+                redis.exceptions.ConnectionError,
+                redis.exceptions.TimeoutError,
+            )
+        except ImportError:  # pragma: no cover
+            pass
+        return errors
+
+    @staticmethod
+    def _position(value):
+        """ return the position of a value on the ring """
+        return int(hashlib.md5(value.encode('utf-8')).hexdigest()[:16], 16)
+
+    @property
+    def health(self):
+        """ Return a dict of node name => True if the node is up """
+        now = time.time()
+        with self._lock:
+            return dict(
+                (name, self._down.get(name, 0) <= now)
+                for name in self._caches
+            )
+
+    def _mark_down(self, name):
+        """ flag a node as down, after it raised an error """
+        LOGGER.exception('Cache node "%s" failed, skipping it.', name)
+        with self._lock:
+            self._down[name] = time.time() + self.retry_after
+
+    def _node_for(self, key):
+        """ return the name of the first up node for a key, or None """
+        now = time.time()
+        with self._lock:
+            down = set(
+                name for name, until in self._down.items() if until > now
+            )
+        if len(down) == len(self._caches):
+            return None
+
+        index = bisect.bisect(self._ring_positions, self._position(_hash(key)))
+        for offset in range(len(self._ring_nodes)):
+            name = self._ring_nodes[
+                (index + offset) % len(self._ring_nodes)
+            ]
+            if name not in down:
+                return name
+        return None  # pragma: no cover
+
+    def _call(self, key, method, *args):
+        """ call the method on the node of the key, fallback on the next
+        node of the ring while it fails """
+        while True:
+            name = self._node_for(key)
+            if name is None:
+                return None
+            try:
+                return getattr(self._caches[name], method)(key, *args)
+            except self.node_errors:
+                self._mark_down(name)
+
+    def _call_many(self, keys, method, make_args):
+        """ group the keys by node and call the bulk method for each node.
+        Keys of a failing node are routed again to the next up node.
+
+        :param make_args: callable(indexes) returning the arguments of
+            the bulk method for the given key indexes
+        :return: dict of index => result of the bulk method for this index,
+            if the method returns a list
+        """
+        results = {}
+        pending = list(range(len(keys)))
+        while pending:
+            groups = {}
+            for index in pending:
+                name = self._node_for(keys[index])
+                if name is None:
+                    return results
+                groups.setdefault(name, []).append(index)
+
+            pending = []
+            for name, indexes in groups.items():
+                try:
+                    values = getattr(self._caches[name], method)(
+                        make_args(indexes)
+                    )
+                except self.node_errors:
+                    self._mark_down(name)
+                    pending.extend(indexes)
+                    continue
+                if isinstance(values, list):
+                    results.update(zip(indexes, values))
+        return results
+
+    def get(self, key, default=None):
+        value = self._call(key, 'get', default)
+        return default if value is None else value
+
+    def set(self, key, value, expire=300):
+        self._call(key, 'set', value, expire)
+
+    def invalidate(self, key):
+        self._call(key, 'invalidate')
+
+    def get_many(self, keys, default=None):
+        keys = list(keys)
+        results = self._call_many(
+            keys,
+            'get_many',
+            lambda indexes: [keys[index] for index in indexes]
+        )
+        return [
+            default if results.get(index) is None else results[index]
+            for index in range(len(keys))
+        ]
+
+    def set_many(self, items):
+        items = list(items)
+        self._call_many(
+            [key for key, _, _ in items],
+            'set_many',
+            lambda indexes: [items[index] for index in indexes]
+        )
+
+    def invalidate_many(self, keys):
+        keys = list(keys)
+        self._call_many(
+            keys,
+            'invalidate_many',
+            lambda indexes: [keys[index] for index in indexes]
+        )
+
+
+class FailSafeCache(BaseCache):
+    """ BaseCache wrapper that never lets a cache backend failure slow down
+    or break the requests.
+
+    Every backend call has a deadline (`timeout`), errors and timeouts are
+    counted by a circuit breaker that bypasses the backend after too many
+    consecutive failures. While the backend fails, values are read from
+    and written to a local in-process fallback cache, and the failed
+    invalidations are kept to be replayed when the backend recovers.
+    """
+
+    def __init__(self, cache, timeout=0.1, fallback=None, **kwargs):
+        """ Constructor
+
+        :param cache: the BaseCache to protect
+        :param timeout: max time (in s) allowed for a backend call. If None
+            calls are made directly, without deadline.
+        :param fallback: (optional) the BaseCache used while the backend
+            fails. Default is a DictCache cleared when the backend recovers.
+        :param failure_threshold: consecutive failures that open the circuit
+        :param reset_timeout: time (in s) before trying the backend again
+        :param max_workers: number of threads running the backend calls
+        """
+        if not isinstance(cache, BaseCache):
+            raise TypeError('cache must be an instance of BaseCache')
+        self._cache = cache
+        self.timeout = timeout
+
+        self._own_fallback = fallback is None
+        self._fallback = DictCache() if fallback is None else fallback
+        self.breaker = CircuitBreaker(
+            failure_threshold=kwargs.pop('failure_threshold', 5),
+            reset_timeout=kwargs.pop('reset_timeout', 30),
+            name=cache.__class__.__name__
+        )
+
+        self._executor = None
+        if timeout is not None:
+            self._executor = ThreadPoolExecutor(
+                max_workers=kwargs.pop('max_workers', 4)
+            )
+
+        self._lock = threading.Lock()
+        # keys invalidated while the backend failed
+        self._invalidated = set()
+        self._stats = {
+            'calls': 0,
+            'errors': 0,
+            'timeouts': 0,
+            'short_circuited': 0,
+            'fallback_calls': 0,
+        }
+
+    @property
+    def stats(self):
+        """ Return the health metrics of the backend """
+        with self._lock:
+            stats = dict(self._stats)
+        stats['state'] = self.breaker.state
+        return stats
+
+    def _count(self, name):
+        """ increment a stat counter """
+        with self._lock:
+            self._stats[name] += 1
+
+    def _add_invalidated(self, keys):
+        """ keep keys whose invalidation failed, to replay it later """
+        with self._lock:
+            self._invalidated.update(keys)
+
+    def _discard_invalidated(self, keys):
+        """ forget the failed invalidations of keys set in the backend """
+        if self._invalidated:
+            with self._lock:
+                self._invalidated.difference_update(keys)
+
+    def _call(self, method, *args):
+        """ call the backend method. Return a (success, result) tuple """
+        if not self.breaker.allow():
+            self._count('short_circuited')
+            return False, None
+
+        recovering = self.breaker.state != CircuitBreaker.CLOSED
+        if self._invalidated:
+            # replay the failed invalidations before using the backend
+            with self._lock:
+                keys = list(self._invalidated)
+                self._invalidated.clear()
+            success, _ = self._call_backend('invalidate_many', keys)
+            if not success:
+                self._add_invalidated(keys)
+                return False, None
+
+        success, result = self._call_backend(method, *args)
+        if success and recovering and self._own_fallback:
+            # backend is back, entries in the fallback are outdated
+            self._fallback.clear()
+        return success, result
+
+    def _call_backend(self, method, *args):
+        """ call the backend method with the timeout, and record the
+        result in the circuit breaker. Return a (success, result) tuple """
+        self._count('calls')
+        try:
+            if self._executor is None:
+                result = getattr(self._cache, method)(*args)
+            else:
+                result = self._executor.submit(
+                    getattr(self._cache, method), *args
+                ).result(self.timeout)
+        except FutureTimeoutError:
+            self._count('timeouts')
+            self.breaker.failure()
+            return False, None
+        except Exception:  # pylint: disable=W0703
+            LOGGER.warning('Cache backend error on %s', method, exc_info=True)
+            self._count('errors')
+            self.breaker.failure()
+            return False, None
+
+        self.breaker.success()
+        return True, result
+
+    def get(self, key, default=None):
+        success, value = self._call('get', key, default)
+        if success:
+            return value
+        self._count('fallback_calls')
+        return self._fallback.get(key, default)
+
+    def set(self, key, value, expire=300):
+        success, _ = self._call('set', key, value, expire)
+        if success:
+            self._discard_invalidated([key])
+        else:
+            self._count('fallback_calls')
+            self._fallback.set(key, value, expire)
+
+    def invalidate(self, key):
+        self._fallback.invalidate(key)
+        success, _ = self._call('invalidate', key)
+        if not success:
+            self._add_invalidated([key])
+
+    def get_many(self, keys, default=None):
+        keys = list(keys)
+        success, values = self._call('get_many', keys, default)
+        if success:
+            return values
+        self._count('fallback_calls')
+        return self._fallback.get_many(keys, default)
+
+    def set_many(self, items):
+        items = list(items)
+        success, _ = self._call('set_many', items)
+        if success:
+            self._discard_invalidated(item[0] for item in items)
+        else:
+            self._count('fallback_calls')
+            self._fallback.set_many(items)
+
+    def invalidate_many(self, keys):
+        keys = list(keys)
+        self._fallback.invalidate_many(keys)
+        success, _ = self._call('invalidate_many', keys)
+        if not success:
+            self._add_invalidated(keys)
+
+
+class TaggedCache(BaseCache):
+    """ BaseCache wrapper that allows to set tags on the cached entries
+    and invalidate all entries for a given tag at once.
+
+    Each tag has a generation stored in the backend. Entries are stored
+    with the generation of their tags, and are considered invalid if the
+    generation of one of their tags changed. invalidate_tag() only writes
+    a new generation: there is no scan, and it works with any backend.
+    """
+
+    def __init__(self, cache):
+        """ Constructor
+
+        :param cache: the BaseCache where entries and generations are stored
+        """
+        if not isinstance(cache, BaseCache):
+            raise TypeError('cache must be an instance of BaseCache')
+        self._cache = cache
+
+    @staticmethod
+    def _tag_key(tag):
+        """ return the cache key where the generation of a tag is stored """
+        return ('esipy:tag', tag)
+
+    @staticmethod
+    def _new_generation():
+        """ return a new generation value """
+        return uuid.uuid4().hex
+
+    def _valid(self, values, default):
+        """ unwrap tagged values, replace the ones with an outdated tag
+        generation with default """
+        tags = set()
+        for value in values:
+            if isinstance(value, _TaggedValue):
+                tags.update(tag for tag, _ in value.tags)
+        tags = list(tags)
+        generations = dict(zip(
+            tags,
+            self._cache.get_many([self._tag_key(tag) for tag in tags])
+        ))
+
+        result = []
+        for value in values:
+            if not isinstance(value, _TaggedValue):
+                result.append(value)
+            elif all(generations[tag] == generation
+                     for tag, generation in value.tags):
+                result.append(value.value)
+            else:
+                result.append(default)
+        return result
+
+    def get(self, key, default=None):
+        return self._valid([self._cache.get(key, default)], default)[0]
+
+    def set(self, key, value, expire=300, tags=None):
+        """ Set a value in the cache.
+
+        :param tags: (optional) list of tags (str) for this entry
+        """
+        if tags:
+            tags = sorted(set(tags))
+            tag_keys = [self._tag_key(tag) for tag in tags]
+            generations = self._cache.get_many(tag_keys)
+
+            new_generations = []
+            for index, generation in enumerate(generations):
+                if generation is None:
+                    generations[index] = self._new_generation()
+                    new_generations.append(
+                        (tag_keys[index], generations[index], 0)
+                    )
+            if new_generations:
+                self._cache.set_many(new_generations)
+
+            value = _TaggedValue(value, tuple(zip(tags, generations)))
+        self._cache.set(key, value, expire)
+
+    def invalidate(self, key):
+        self._cache.invalidate(key)
+
+    def invalidate_tag(self, tag):
+        """ Invalidate all the entries with the given tag """
+        self._cache.set(self._tag_key(tag), self._new_generation(), 0)
+
+    def get_many(self, keys, default=None):
+        return self._valid(self._cache.get_many(keys, default), default)
+
+    def set_many(self, items):
+        self._cache.set_many(items)
+
+    def invalidate_many(self, keys):
+        self._cache.invalidate_many(keys)
+
+
+class SharedMemoryCache(BaseCache):
+    """ BaseCache implementation using a memory mapped file, shared by all
+    the processes of a host using the same path (ie: gunicorn workers).
+
+    The file has a fixed size: values are written one after the other in
+    a ring buffer, the oldest ones are overwritten when the ring is full.
+    An index of `index_slots` entries (4-way set associative) gives the
+    position of each key. Expired entries are ignored and their slots
+    reused.
+
+    Access between processes is synchronized with file locks (fcntl),
+    so this cache is only available on unix. The file is opened again in
+    forked processes, as flock locks are shared by the file descriptors
+    inherited from the parent.
+    """
+
+    MAGIC = b'ESIPYSHM'
+    WAYS = 4
+    # magic, index slots, data size, head (absolute write position)
+    HEADER = struct.Struct('<8sIQQ')
+    HEADER_SIZE = 64
+    # key digest, absolute position, length, expire timestamp
+    ENTRY = struct.Struct('<16sQId')
+    EMPTY = b'\0' * 16
+
+    def __init__(self, path=None, size=64 * 1024 * 1024, index_slots=65536):
+        """ Constructor
+
+        If the file already exists, its size and number of slots are used
+        instead of the given ones.
+
+        Arguments:
+            path {String} -- The path of the file, default is esipy-cache
+                in /dev/shm (or the temp directory if it does not exist)
+            size {int} -- The size (in bytes) of the values storage
+            index_slots {int} -- The max number of keys in the cache
+        """
+        import fcntl
+        self._fcntl = fcntl
+        if path is None:
+            directory = '/dev/shm'
+            if not os.path.isdir(directory):
+                directory = tempfile.gettempdir()
+            path = os.path.join(directory, 'esipy-cache')
+        self.path = path
+
+        index_slots = max(index_slots - index_slots % self.WAYS, self.WAYS)
+        self._lock = threading.Lock()
+        self._pid = os.getpid()
+        self._fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o600)
+        self._map = None
+
+        fcntl.flock(self._fd, fcntl.LOCK_EX)
+        try:
+            total = os.fstat(self._fd).st_size
+            if total < self.HEADER_SIZE:
+                total = (self.HEADER_SIZE + index_slots * self.ENTRY.size
+                         + size)
+                os.ftruncate(self._fd, total)
+                self._map = mmap.mmap(self._fd, total)
+                self.HEADER.pack_into(
+                    self._map, 0, self.MAGIC, index_slots, size, 0
+                )
+            else:
+                self._map = mmap.mmap(self._fd, total)
+        finally:
+            fcntl.flock(self._fd, fcntl.LOCK_UN)
+
+        magic, self.index_slots, self.size, _ = self.HEADER.unpack_from(
+            self._map, 0
+        )
+        if magic != self.MAGIC:
+            raise ValueError('%s is not an esipy shared cache' % path)
+        self._data_offset = (
+            self.HEADER_SIZE + self.index_slots * self.ENTRY.size
+        )
+        # bigger values would evict too much of the cache
+        self.max_value_size = self.size // 4
+
+    def __del__(self):
+        """ Close the memory map and the file """
+        if getattr(self, '_map', None) is not None:
+            self._map.close()
+        if getattr(self, '_fd', None) is not None:
+            os.close(self._fd)
+
+    def _reopen(self):
+        """ open the file and its memory map again, after a fork. Must be
+        called with the thread lock acquired """
+        fd = os.open(self.path, os.O_RDWR)
+        new_map = mmap.mmap(fd, os.fstat(fd).st_size)
+        self._map.close()
+        os.close(self._fd)
+        self._fd = fd
+        self._map = new_map
+        self._pid = os.getpid()
+
+    @contextmanager
+    def _locked(self, exclusive):
+        """ lock the cache between threads and processes """
+        with self._lock:
+            if self._pid != os.getpid():
+                self._reopen()
+            self._fcntl.flock(
+                self._fd,
+                self._fcntl.LOCK_EX if exclusive else self._fcntl.LOCK_SH
+            )
+            try:
+                yield
+            finally:
+                self._fcntl.flock(self._fd, self._fcntl.LOCK_UN)
+
+    def _head(self):
+        """ return the absolute write position """
+        return self.HEADER.unpack_from(self._map, 0)[3]
+
+    def _slots(self, digest):
+        """ return the offsets of the index entries for a key digest """
+        bucket = (
+            struct.unpack('<Q', digest[:8])[0]
+            % (self.index_slots // self.WAYS)
+        )
+        return [
+            self.HEADER_SIZE + (bucket * self.WAYS + way) * self.ENTRY.size
+            for way in range(self.WAYS)
+        ]
+
+    def _valid(self, entry, head, now):
+        """ return True if the entry value is not expired or overwritten """
+        digest, position, _, expire = entry
+        return (
+            digest != self.EMPTY
+            and (expire == 0 or expire > now)
+            and position + self.size >= head
+        )
+
+    @staticmethod
+    def _digest(key):
+        """ return the 16 bytes digest of a key """
+        return bytes(bytearray.fromhex(_hash(key)[4:]))
+
+    def get(self, key, default=None):
+        digest = self._digest(key)
+        data = None
+        with self._locked(False):
+            head = self._head()
+            now = time.time()
+            for offset in self._slots(digest):
+                entry = self.ENTRY.unpack_from(self._map, offset)
+                if entry[0] == digest:
+                    if self._valid(entry, head, now):
+                        start = self._data_offset + entry[1] % self.size
+                        data = self._map[start:start + entry[2]]
+                    break
+        if data is None:
+            return default
+        try:
+            return pickle.loads(data)
+        except Exception:  # pylint: disable=W0703
+            LOGGER.warning('Invalid value in SharedMemoryCache, ignored.')
+            return default
+
+    def set(self, key, value, expire=300):
+        data = pickle.dumps(value, pickle.HIGHEST_PROTOCOL)
+        if len(data) > self.max_value_size:
+            LOGGER.debug('Value too big for SharedMemoryCache, not stored.')
+            return
+        expire = time.time() + int(expire) if expire else 0
+        digest = self._digest(key)
+
+        with self._locked(True):
+            head = self._head()
+            # values are never split around the end of the ring
+            if head % self.size + len(data) > self.size:
+                head += self.size - head % self.size
+            start = self._data_offset + head % self.size
+            self._map[start:start + len(data)] = data
+            position = head
+            head += len(data)
+            self.HEADER.pack_into(
+                self._map, 0, self.MAGIC, self.index_slots, self.size, head
+            )
+
+            # use the slot of the key, a free one, or the oldest one
+            now = time.time()
+            entries = [
+                (offset, self.ENTRY.unpack_from(self._map, offset))
+                for offset in self._slots(digest)
+            ]
+            slot = next(
+                (offset for offset, entry in entries if entry[0] == digest),
+                None
+            )
+            if slot is None:
+                slot = next(
+                    (offset for offset, entry in entries
+                     if not self._valid(entry, head, now)),
+                    None
+                )
+            if slot is None:
+                slot = min(entries, key=lambda item: item[1][1])[0]
+            self.ENTRY.pack_into(
+                self._map, slot, digest, position, len(data), expire
+            )
+
+    def invalidate(self, key):
+        digest = self._digest(key)
+        with self._locked(True):
+            for offset in self._slots(digest):
+                if self.ENTRY.unpack_from(self._map, offset)[0] == digest:
+                    self.ENTRY.pack_into(
+                        self._map, offset, self.EMPTY, 0, 0, 0
+                    )
+
+    def clear(self):
+        """ Remove all the entries of the cache """
+        with self._locked(True):
+            self._map[self.HEADER_SIZE:self._data_offset] = (
+                b'\0' * (self._data_offset - self.HEADER_SIZE)
+            )
+
+
+class SqliteCache(BaseCache):
+    """ BaseCache implementation using a SQLite database in WAL mode, so
+    multiple processes can read while another one writes.
+
+    The absolute expiry is stored in an indexed column: expired entries are
+    never returned and purge_expired() removes them all with one query.
+
+    Writes can be grouped: they are kept in memory (and readable) until
+    `batch_size` writes are pending or `commit_interval` seconds passed
+    since the last commit, then written in one transaction. A background
+    timer writes them when no other write comes. Use flush() to write them
+    immediately.
+    """
+
+    def __init__(self, path, batch_size=1, commit_interval=0, timeout=5):
+        """ Constructor
+
+        Arguments:
+            path {String} -- The path of the database file
+            batch_size {int} -- The number of writes grouped in a commit
+            commit_interval {float} -- Max time (in s) a write is delayed
+            timeout {float} -- Time (in s) to wait for a locked database
+        """
+        self.path = path
+        self.batch_size = batch_size
+        self.commit_interval = commit_interval
+        self.timeout = timeout
+
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._pending = OrderedDict()
+        self._last_commit = time.time()
+        self._timer = None
+
+        connection = self._connection()
+        connection.execute('PRAGMA journal_mode=WAL')
+        connection.execute(
+            'CREATE TABLE IF NOT EXISTS esipy_cache ('
+            ' key TEXT PRIMARY KEY,'
+            ' value BLOB NOT NULL,'
+            ' expire REAL)'
+        )
+        connection.execute(
+            'CREATE INDEX IF NOT EXISTS esipy_cache_expire '
+            'ON esipy_cache (expire)'
+        )
+
+    def __del__(self):
+        """ Write the pending entries as the cache instance is deleted """
+        try:
+            self.flush()
+        except Exception:  # pylint: disable=W0703
+            LOGGER.exception('Could not write pending cache entries.')
+
+    def _connection(self):
+        """ return the connection of the current thread """
+        connection = getattr(self._local, 'connection', None)
+        if connection is None:
+            connection = sqlite3.connect(
+                self.path,
+                timeout=self.timeout,
+                isolation_level=None,
+            )
+            connection.execute('PRAGMA synchronous=NORMAL')
+            self._local.connection = connection
+        return connection
+
+    def _write(self, rows, deleted=()):
+        """ write (key, value, expire) rows and delete keys in
+        one transaction """
+        connection = self._connection()
+        connection.execute('BEGIN IMMEDIATE')
+        try:
+            if rows:
+                connection.executemany(
+                    'INSERT OR REPLACE INTO esipy_cache (key, value, expire) '
+                    'VALUES (?, ?, ?)',
+                    rows
+                )
+            if deleted:
+                connection.executemany(
+                    'DELETE FROM esipy_cache WHERE key = ?',
+                    [(key,) for key in deleted]
+                )
+        except Exception:
+            connection.execute('ROLLBACK')
+            raise
+        connection.execute('COMMIT')
+
+    @staticmethod
+    def _row(key, value, expire):
+        """ return the database row of an entry """
+        return (
+            _hash(key),
+            sqlite3.Binary(pickle.dumps(value, pickle.HIGHEST_PROTOCOL)),
+            time.time() + int(expire) if expire else None,
+        )
+
+    def _timed_flush(self):
+        """ flush the pending entries from the timer thread """
+        with self._lock:
+            self._timer = None
+        try:
+            self.flush()
+        except Exception:  # pylint: disable=W0703
+            LOGGER.exception('Could not write pending cache entries.')
+
+    def flush(self):
+        """ Write all the pending entries in the database """
+        with self._lock:
+            rows = list(self._pending.values())
+            self._pending.clear()
+            self._last_commit = time.time()
+        if rows:
+            self._write(rows)
+
+    def get(self, key, default=None):
+        return self.get_many([key], default)[0]
+
+    def get_many(self, keys, default=None):
+        hashed_keys = [_hash(key) for key in keys]
+        now = time.time()
+        rows = {}
+        with self._lock:
+            for hashed in hashed_keys:
+                if hashed in self._pending:
+                    rows[hashed] = self._pending[hashed][1:]
+
+        missing = [hashed for hashed in hashed_keys if hashed not in rows]
+        connection = self._connection()
+        # stay under the SQLite max number of variables
+        for index in range(0, len(missing), 500):
+            chunk = missing[index:index + 500]
+            rows.update(
+                (row[0], row[1:]) for row in connection.execute(
+                    'SELECT key, value, expire FROM esipy_cache '
+                    'WHERE key IN (%s)' % ','.join('?' * len(chunk)),
+                    chunk
+                )
+            )
+
+        values = []
+        for hashed in hashed_keys:
+            row = rows.get(hashed)
+            if row is None or (row[1] is not None and row[1] <= now):
+                values.append(default)
+            else:
+                values.append(pickle.loads(bytes(row[0])))
+        return values
+
+    def set(self, key, value, expire=300):
+        self.set_many([(key, value, expire)])
+
+    def set_many(self, items):
+        rows = [self._row(key, value, expire) for key, value, expire in items]
+        with self._lock:
+            for row in rows:
+                self._pending[row[0]] = row
+            flush = (
+                len(self._pending) >= self.batch_size
+                or time.time() - self._last_commit >= self.commit_interval
+            )
+            # make sure the pending entries are written in time
+            if not flush and self._timer is None:
+                self._timer = threading.Timer(
+                    self._last_commit + self.commit_interval - time.time(),
+                    self._timed_flush
+                )
+                self._timer.daemon = True
+                self._timer.start()
+        if flush:
+            self.flush()
+
+    def invalidate(self, key):
+        self.invalidate_many([key])
+
+    def invalidate_many(self, keys):
+        hashed_keys = [_hash(key) for key in keys]
+        with self._lock:
+            for hashed in hashed_keys:
+                self._pending.pop(hashed, None)
+        self._write([], hashed_keys)
+
+    def iter_items(self):
+        self.flush()
+        rows = self._connection().execute(
+            'SELECT key, value, expire FROM esipy_cache'
+        )
+        for key, value, expire in rows:
+            yield (
+                _HashedKey(key),
+                pickle.loads(bytes(value)),
+                expire or 0
+            )
+
+    def purge_expired(self):
+        """ Delete all the expired entries, return the number of deleted
+        entries """
+        self.flush()
+        cursor = self._connection().execute(
+            'DELETE FROM esipy_cache WHERE expire <= ?',
+            (time.time(),)
+        )
+        return cursor.rowcount
+
+
+class BlobCache(BaseCache):
+    """ BaseCache wrapper that stores the big response bodies in files,
+    and only a small reference to the file in the wrapped cache.
+
+    Bodies are written once to a file and read back using a read-only
+    memory map: a hit returns the response with `content` being a
+    memoryview on the file, with no copy and no unpickling of the body.
+    Values smaller than `threshold` are stored as usual.
+
+    Values must be CachedResponse-like namedtuples (with a content field).
+    """
+
+    def __init__(self, cache, path, threshold=64 * 1024):
+        """ Constructor
+
+        Arguments:
+            cache {BaseCache} -- The cache where the references are stored
+            path {String} -- The directory where the bodies are written
+            threshold {int} -- The min size (in bytes) of a body in a file
+        """
+        if not isinstance(cache, BaseCache):
+            raise TypeError('cache must be an instance of BaseCache')
+        self._cache = cache
+        self.path = path
+        self.threshold = threshold
+        if not os.path.isdir(path):
+            os.makedirs(path)
+
+    def _remove(self, value):
+        """ remove the file of a reference value, if any """
+        content = getattr(value, 'content', None)
+        if isinstance(content, _BlobRef):
+            try:
+                os.remove(os.path.join(self.path, content.filename))
+            except OSError:
+                pass
+
+    def _load(self, value, default):
+        """ replace the reference by a memoryview on the file content """
+        content = getattr(value, 'content', None)
+        if not isinstance(content, _BlobRef):
+            return value
+        if content.size == 0:
+            return value._replace(content=b'')
+        try:
+            with open(os.path.join(self.path, content.filename), 'rb') as blob:
+                mapped = mmap.mmap(
+                    blob.fileno(), content.size, access=mmap.ACCESS_READ
+                )
+        except (IOError, OSError, ValueError):
+            # file removed or truncated: cache miss
+            return default
+        return value._replace(content=memoryview(mapped))
+
+    def get(self, key, default=None):
+        return self._load(self._cache.get(key, default), default)
+
+    def get_many(self, keys, default=None):
+        return [
+            self._load(value, default)
+            for value in self._cache.get_many(keys, default)
+        ]
+
+    def set(self, key, value, expire=300):
+        content = getattr(value, 'content', None)
+        if (not isinstance(content, (bytes, bytearray, memoryview))
+                or len(content) < self.threshold):
+            self._cache.set(key, value, expire)
+            return
+
+        previous = self._cache.get(key)
+
+        # expire timestamp in the name allows purge_expired without index
+        expire_at = int(time.time() + int(expire)) if expire else 0
+        filename = '%s-%d-%s.blob' % (_hash(key), expire_at, uuid.uuid4().hex)
+        tmp_path = os.path.join(self.path, filename + '.tmp')
+        with open(tmp_path, 'wb') as blob:
+            blob.write(content)
+        # readers never see a partially written file
+        os.rename(tmp_path, os.path.join(self.path, filename))
+
+        self._cache.set(
+            key,
+            value._replace(content=_BlobRef(filename, len(content))),
+            expire
+        )
+        self._remove(previous)
+
+    def invalidate(self, key):
+        self._remove(self._cache.get(key))
+        self._cache.invalidate(key)
+
+    def purge_expired(self):
+        """ Remove the files of expired entries, return the number of
+        removed files """
+        now = time.time()
+        removed = 0
+        for filename in os.listdir(self.path):
+            parts = filename.split('-')
+            if not filename.endswith('.blob') or len(parts) != 3:
+                continue
+            if 0 < int(parts[1]) < now:
+                try:
+                    os.remove(os.path.join(self.path, filename))
+                    removed += 1
+                except OSError:
+                    pass
+        return removed
+
+
+class QuotaCache(BaseCache):
+    """ BaseCache wrapper that limits the size used by groups of routes,
+    so one endpoint with big responses (markets...) cannot evict all the
+    other entries.
+
+    Each group has a pattern, matched against the route url of the cache
+    key, an optional max size and a priority. When a group exceeds its
+    max size, its least recently used entries are evicted. When the whole
+    cache exceeds `max_size`, entries of the lowest priority groups are
+    evicted first.
+
+    Sizes are tracked in the current process, this is meant for in-process
+    (DictCache) or local (FileCache...) backends used by a single process.
+    """
+
+    DEFAULT_GROUP = 'default'
+
+    def __init__(self, cache, quotas, max_size=None):
+        """ Constructor
+
+        Arguments:
+            cache {BaseCache} -- The cache where entries are stored
+            quotas {dict} -- group name => dict with the keys:
+                pattern: regex searched in the route url (default group
+                    matches everything else),
+                max_size: (optional) max size in bytes of the group,
+                priority: (optional, default 0) higher is evicted last
+            max_size {int} -- (optional) max size in bytes of all groups
+        """
+        if not isinstance(cache, BaseCache):
+            raise TypeError('cache must be an instance of BaseCache')
+        self._cache = cache
+        self.max_size = max_size
+
+        self._quotas = dict(quotas)
+        self._quotas.setdefault(self.DEFAULT_GROUP, {})
+        self._patterns = [
+            (re.compile(quota['pattern']), name)
+            for name, quota in sorted(self._quotas.items())
+            if quota.get('pattern') is not None
+        ]
+        self._routes = {}
+
+        self._lock = threading.RLock()
+        # group => OrderedDict of key => (size, expire_at), in LRU order
+        self._entries = dict((name, OrderedDict()) for name in self._quotas)
+        self._sizes = dict((name, 0) for name in self._quotas)
+        self.evictions = dict((name, 0) for name in self._quotas)
+
+    @property
+    def sizes(self):
+        """ Return the current size used by each group """
+        with self._lock:
+            return dict(self._sizes)
+
+    def group(self, key):
+        """ Return the name of the group of a key """
+        route = key[0] if isinstance(key, tuple) and key else key
+        route = str(route)
+        name = self._routes.get(route)
+        if name is None:
+            name = next(
+                (name for pattern, name in self._patterns
+                 if pattern.search(route)),
+                self.DEFAULT_GROUP
+            )
+            self._routes[route] = name
+        return name
+
+    @staticmethod
+    def _sizeof(value):
+        """ return the approximate size of a value """
+        content = getattr(value, 'content', None)
+        if isinstance(content, (bytes, bytearray, memoryview)):
+            # headers and other fields
+            return len(content) + 512
+        return len(pickle.dumps(value, pickle.HIGHEST_PROTOCOL))
+
+    def _forget(self, name, key):
+        """ remove a key from the accounting. Lock must be acquired """
+        size, _ = self._entries[name].pop(key)
+        self._sizes[name] -= size
+
+    def _evict_from(self, name, needed):
+        """ evict entries of a group until `needed` bytes are freed.
+        Expired entries first, then the least recently used.
+        Lock must be acquired. Return the evicted keys """
+        entries = self._entries[name]
+        now = time.time()
+        evicted = []
+        freed = 0
+        for key, (_, expire_at) in list(entries.items()):
+            if expire_at and expire_at <= now:
+                freed += entries[key][0]
+                self._forget(name, key)
+                evicted.append(key)
+        while freed < needed and entries:
+            key = next(iter(entries))
+            freed += entries[key][0]
+            self._forget(name, key)
+            evicted.append(key)
+            self.evictions[name] += 1
+        return evicted
+
+    def _make_room(self, name):
+        """ evict entries so the group and the total fit in their quotas.
+        Lock must be acquired. Return the evicted keys """
+        evicted = []
+        group_max = self._quotas[name].get('max_size')
+        if group_max is not None and self._sizes[name] > group_max:
+            evicted.extend(
+                self._evict_from(name, self._sizes[name] - group_max)
+            )
+
+        if self.max_size is not None:
+            # evict from the lowest priority groups first
+            order = sorted(
+                self._quotas,
+                key=lambda group: self._quotas[group].get('priority', 0)
+            )
+            for group in order:
+                excess = sum(self._sizes.values()) - self.max_size
+                if excess <= 0:
+                    break
+                evicted.extend(self._evict_from(group, excess))
+        return evicted
+
+    def get(self, key, default=None):
+        value = self._cache.get(key, None)
+        name = self.group(key)
+        with self._lock:
+            if key in self._entries[name]:
+                if value is None:
+                    # expired or removed from the backend
+                    self._forget(name, key)
+                else:
+                    self._entries[name].move_to_end(key)
+        return default if value is None else value
+
+    def set(self, key, value, expire=300):
+        name = self.group(key)
+        size = self._sizeof(value)
+        group_max = self._quotas[name].get('max_size')
+        if ((group_max is not None and size > group_max)
+                or (self.max_size is not None and size > self.max_size)):
+            LOGGER.debug('Value bigger than the "%s" quota, not cached', name)
+            # the previous value of the key is outdated now
+            self.invalidate(key)
+            return
+
+        self._cache.set(key, value, expire)
+        with self._lock:
+            if key in self._entries[name]:
+                self._forget(name, key)
+            self._entries[name][key] = (
+                size,
+                time.time() + int(expire) if expire else 0
+            )
+            self._sizes[name] += size
+            evicted = self._make_room(name)
+        if evicted:
+            self._cache.invalidate_many(evicted)
+
+    def invalidate(self, key):
+        name = self.group(key)
+        with self._lock:
+            if key in self._entries[name]:
+                self._forget(name, key)
+        self._cache.invalidate(key)
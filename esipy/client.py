@@ -2,27 +2,50 @@
 """ EsiPy Client """
 from __future__ import absolute_import
 
+import functools
+import heapq
+import json
+import threading
 import time
 import warnings
 import logging
 
-from concurrent.futures import ThreadPoolExecutor
+from concurrent.futures import FIRST_COMPLETED
+from concurrent.futures import wait
 from collections import namedtuple
+from collections import OrderedDict
+from email.utils import formatdate
 
-import six
 from pyswagger.core import BaseClient
+from pyswagger.io import Response
 from requests import Request
 from requests import Session
 from requests.exceptions import (
     ConnectionError as RequestsConnectionError, Timeout
 )
-from requests.adapters import HTTPAdapter
+from requests.adapters import BaseAdapter
+from requests.structures import CaseInsensitiveDict
 
+from .cache import TaggedCache
+from .events import API_CACHE_STATS
 from .events import API_CALL_STATS
+from .events import API_RETRY
 from .utils import make_cache_key
+from .utils import make_cache_tags
 from .utils import check_cache
 from .utils import get_cache_time_left
+from .utils import get_operation_id
+from .breaker import CircuitBreaker
 from .exceptions import APIException
+from .exceptions import CircuitOpenException
+from .hedge import HedgePolicy
+from .limiter import AdaptiveLimiter
+from .retry import LegacyRetryPolicy
+from .retry import RetryPolicy
+from .scheduler import Dispatcher
+from .scheduler import PRIORITY_LOW
+from .scheduler import PRIORITY_NORMAL
+from .security import EsiSecurity
 
 
 LOGGER = logging.getLogger(__name__)
@@ -33,6 +56,9 @@ CachedResponse = namedtuple(
     ['status_code', 'headers', 'content', 'url']
 )
 
+# body of the fake responses for requests cancelled by their deadline
+DEADLINE_EXCEEDED = b'{"error": "Deadline exceeded"}'
+
 
 class EsiClient(BaseClient):
     """ EsiClient is a pyswagger client that override some behavior and
@@ -45,17 +71,69 @@ class EsiClient(BaseClient):
         """ Init the ESI client object
 
         :param security: (optional) the security object [default: None]
-        :param retry_requests: (optional) use a retry loop for all requests
+        :param retry_requests: (optional) use a retry loop for all requests.
+        True to use the default policy (5 attempts for 5xx errors), or an
+        esipy.retry.RetryPolicy object
         :param headers: (optional) additional headers we want to add
         :param transport_adapter: (optional) an HTTPAdapter object / implement
+        (any requests adapter, see esipy.transport.Http2Adapter to multiplex
+        the requests over HTTP/2)
         :param cache: (optional) esipy.cache.BaseCache cache implementation.
         :param raw_body_only: (optional) default value [False] for all requests
         :param signal_api_call_stats: (optional) allow to define a specific
             signal to use, instead of using the global API_CALL_STATS
+        :param signal_cache_stats: (optional) allow to define a specific
+            signal to use, instead of using the global API_CACHE_STATS
+        :param signal_api_retry: (optional) allow to define a specific
+            signal to use, instead of using the global API_RETRY
         :param timeout: (optional) default value [None=No timeout]
         timeout in seconds for requests
         :param no_etag_body: (optional) default False, set to return empty
         response when ETag requests return 304 (normal http behavior)
+        :param cache_tag_params: (optional) the path params used to tag the
+        cached responses, when cache is a TaggedCache.
+        Default: character_id, corporation_id, alliance_id
+        :param permanent_operations: (optional) operation ids of immutable
+        resources (killmails, universe types...). Their responses are stored
+        without expiry and never requested again. Either a list, or a dict
+        of operation id => version: changing the version invalidates the
+        stored responses of the operation.
+        :param permanent_version: (optional) version used for operations
+        given as a list. Default: 1
+        :param permanent_cache: (optional) the cache used for permanent
+        responses. Default: the client cache
+        :param circuit_breaker: (optional) enable a circuit breaker for each
+        operation: True, or a dict of esipy.breaker.CircuitBreaker params
+        (failure_threshold, reset_timeout, half_open_calls). When it is
+        open, requests are not sent and CircuitOpenException is raised.
+        5xx, 420 and connection errors are failures. Default: disabled
+        :param circuit_breaker_stale: (optional) return the expired cached
+        response, if any, instead of raising when the circuit is open.
+        Default: True
+        :param concurrency_limiter: (optional) True or an
+        esipy.limiter.AdaptiveLimiter, adjusting the concurrency of
+        multi_request from the API latency and errors. Default: None, the
+        threads param of multi_request is used
+        :param hedging: (optional) True or an esipy.hedge.HedgePolicy, to
+        send a second GET request when the first one is slower than the
+        usual latency of its operation. Default: None (disabled)
+        :param dispatcher: (optional) the esipy.scheduler.Dispatcher running
+        multi_request and submit requests, to share it between clients.
+        Default: a new Dispatcher using the following params
+        :param max_workers: (optional) the maximum number of worker threads
+        running any request. Default: 100
+        :param reserved_workers: (optional) the extra workers reserved to
+        high priority requests. Default: 10
+        :param priority_aging: (optional) the waiting time (in s) for a
+        request to gain one priority class. Default: 30
+        :param tenant_weights: (optional) dict of tenant => weight, to share
+        the workers between tenants (characters, corporations...)
+        :param tenant_max_running: (optional) the maximum running requests
+        for each tenant. Default: no limit
+        :param parsed_cache_size: (optional) number of parsed response data
+        kept in memory, keyed by cache key and ETag, so cache hits and 304
+        are not parsed again. The same data object is returned for each
+        hit, it must not be modified. Default: 0 (disabled)
         """
         super(EsiClient, self).__init__(security)
         self.security = security
@@ -66,6 +144,10 @@ class EsiClient(BaseClient):
             self.request = self._retry_request
         else:
             self.request = self._request
+        self.retry_policy = (
+            retry_requests if isinstance(retry_requests, RetryPolicy)
+            else LegacyRetryPolicy()
+        )
 
         # store default raw_body_only in case user never want parsing
         self.raw_body_only = kwargs.pop('raw_body_only', False)
@@ -91,7 +173,7 @@ class EsiClient(BaseClient):
 
         # transport adapter
         transport_adapter = kwargs.pop('transport_adapter', None)
-        if isinstance(transport_adapter, HTTPAdapter):
+        if isinstance(transport_adapter, BaseAdapter):
             self._session.mount('http://', transport_adapter)
             self._session.mount('https://', transport_adapter)
 
@@ -103,44 +185,99 @@ class EsiClient(BaseClient):
             'signal_api_call_stats',
             API_CALL_STATS
         )
+        self.signal_cache_stats = kwargs.pop(
+            'signal_cache_stats',
+            API_CACHE_STATS
+        )
+        self.signal_api_retry = kwargs.pop(
+            'signal_api_retry',
+            API_RETRY
+        )
 
         self.timeout = kwargs.pop('timeout', None)
         self.no_etag_body = kwargs.pop('no_etag_body', False)
+        self.cache_tag_params = kwargs.pop(
+            'cache_tag_params',
+            ('character_id', 'corporation_id', 'alliance_id')
+        )
+
+        # permanent tier for immutable resources
+        permanent_operations = kwargs.pop('permanent_operations', {})
+        if not isinstance(permanent_operations, dict):
+            permanent_operations = dict.fromkeys(
+                permanent_operations,
+                kwargs.pop('permanent_version', 1)
+            )
+        self.permanent_operations = permanent_operations
+        permanent_cache = kwargs.pop('permanent_cache', None)
+        self.permanent_cache = (
+            self.cache if permanent_cache is None
+            else check_cache(permanent_cache)
+        )
 
-    def _retry_request(self, req_and_resp, _retry=0, **kwargs):
-        """Uses self._request in a sane retry loop (for 5xx level errors).
+        # per operation circuit breakers
+        circuit_breaker = kwargs.pop('circuit_breaker', None)
+        if circuit_breaker is True:
+            circuit_breaker = {}
+        elif circuit_breaker is False:
+            circuit_breaker = None
+        self.circuit_breaker = circuit_breaker
+        self.circuit_breaker_stale = kwargs.pop('circuit_breaker_stale', True)
+        self.circuit_breakers = {}
+        self._breakers_lock = threading.Lock()
+
+        # adaptive concurrency for multi_request
+        self.concurrency_limiter = kwargs.pop('concurrency_limiter', None)
+        if self.concurrency_limiter is True:
+            self.concurrency_limiter = AdaptiveLimiter()
+
+        # hedged GET requests
+        self.hedging = kwargs.pop('hedging', None)
+        if self.hedging is True:
+            self.hedging = HedgePolicy()
+
+        # worker threads for multi_request and submit
+        self.dispatcher = kwargs.pop('dispatcher', None)
+        if self.dispatcher is None:
+            self.dispatcher = Dispatcher(
+                max_workers=kwargs.pop('max_workers', 100),
+                reserved=kwargs.pop('reserved_workers', 10),
+                aging=kwargs.pop('priority_aging', 30),
+                tenant_weights=kwargs.pop('tenant_weights', None),
+                tenant_max_running=kwargs.pop('tenant_max_running', None),
+            )
+
+        # parsed data of the last responses, LRU
+        self.parsed_cache_size = kwargs.pop('parsed_cache_size', 0)
+        self._parsed_cache = OrderedDict()
+        self._parsed_lock = threading.Lock()
 
-        Do not use the _retry parameter, use the same params as _request
+    def _retry_request(self, req_and_resp, **kwargs):
+        """Uses self._request in a retry loop, following the retry policy
+        (see esipy.retry). Use the same params as _request
 
-        Used when ESIClient is initialized with retry_requests=True
+        Used when ESIClient is initialized with retry_requests
         if raise_on_error is True, this will only raise exception after
         all retry have been done
 
+        The deadline covers all the attempts and the sleeps between them:
+        no retry is made if its delay ends after the deadline.
+
         """
         raise_on_error = kwargs.pop('raise_on_error', False)
-
-        if _retry:
-            # backoff delay loop in seconds: 0.01, 0.16, 0.81, 2.56, 6.25
-            time.sleep(_retry ** 4 / 100)
-
-        res = self._request(req_and_resp, **kwargs)
-
-        if 500 <= res.status <= 599:
-            _retry += 1
-            if _retry < 5:
-                LOGGER.warning(
-                    "[failure #%d] %s %d: %r",
-                    _retry,
-                    req_and_resp[0].url,
-                    res.status,
-                    res.data,
-                )
-                return self._retry_request(
-                    req_and_resp,
-                    _retry=_retry,
-                    raise_on_error=raise_on_error,
-                    **kwargs
-                )
+        deadline_at = self.__get_deadline(kwargs)
+
+        self.retry_policy.start()
+        attempt = 0
+        while True:
+            res = self._request(req_and_resp, deadline_at=deadline_at,
+                                **kwargs)
+            attempt += 1
+            delay = self._retry_delay(req_and_resp, attempt, res,
+                                      deadline_at)
+            if delay is None:
+                break
+            time.sleep(delay)
 
         if res.status >= 400 and raise_on_error:
             raise APIException(
@@ -153,39 +290,208 @@ class EsiClient(BaseClient):
 
         return res
 
+    def _retry_delay(self, req_and_resp, attempt, res, deadline_at=None):
+        """ Return the delay before the next attempt of a request, or None
+        if it must not be retried. Send the retry signal for failures.
+
+        :param req_and_resp: the request and response object
+        :param attempt: the number of attempts already made
+        :param res: the response of the last attempt
+        :param deadline_at: (optional) the request deadline timestamp, no
+        retry is made after it
+        """
+        delay = self.retry_policy.next_delay(attempt, res)
+        if (delay is not None and deadline_at is not None
+                and time.time() + delay >= deadline_at):
+            delay = None
+        if res.status in self.retry_policy.retry_statuses:
+            self.signal_api_retry.send(
+                operation_id=get_operation_id(req_and_resp[0]),
+                url=req_and_resp[0].url,
+                attempt=attempt,
+                status_code=res.status,
+                delay=delay,
+            )
+        if delay is not None:
+            LOGGER.warning(
+                "[failure #%d] %s %d: %r",
+                attempt,
+                req_and_resp[0].url,
+                res.status,
+                res.data,
+            )
+        return delay
+
+    def submit(self, req_and_resp, priority=PRIORITY_LOW, tenant=None,
+               **kwargs):
+        """ Send a request in the background, using the client dispatcher.
+
+        :param req_and_resp: the request and response object from pyswagger.App
+        :param priority: the priority class, see esipy.scheduler
+        :param tenant: (optional) the tenant key (character id...) used to
+        share the workers fairly
+        :param kwargs: the params of the request call. The deadline starts
+        when the request is submitted, the time waiting for a worker counts
+        :return: a concurrent.futures.Future of the response
+        """
+        deadline_at = self.__get_deadline(kwargs)
+        if deadline_at is not None:
+            kwargs['deadline_at'] = deadline_at
+        return self.dispatcher.submit(
+            functools.partial(self.request, req_and_resp, **kwargs),
+            priority=priority,
+            tenant=tenant
+        )
+
     def multi_request(self, reqs_and_resps, threads=20, **kwargs):
-        """Use a threadpool to send multiple requests in parallel.
+        """Use the client dispatcher to send multiple requests in parallel.
+
+        When retries are enabled, failed requests are put back in a delayed
+        queue instead of sleeping in their worker, so the workers keep
+        sending the other requests during the backoff.
 
         :param reqs_and_resps: iterable of req_and_resp tuples
         :param raw_body_only: applied to every request call
         :param opt: applies to every request call
-        :param threads: number of concurrent workers to use
+        :param threads: number of concurrent requests for this batch,
+        ignored if the client has a concurrency limiter
+        :param priority: the priority class of the requests, see
+        esipy.scheduler. Default: PRIORITY_NORMAL
+        :param tenant: (optional) the tenant key of the requests, to share
+        the workers fairly, or a callable returning the key of a
+        req_and_resp (see esipy.utils.get_tenant)
+        :param deadline: (optional) the time (in s) given to the whole batch,
+        retries included. The requests not finished at the deadline are
+        cancelled, and get a 504 "Deadline exceeded" response.
+
+        Requests not sent because their circuit breaker is open get a 503
+        response, instead of raising CircuitOpenException for the batch.
 
         :return: a list of [(pyswagger.io.Request, pyswagger.io.Response), ...]
         """
 
         opt = kwargs.pop('opt', {})
         raw_body_only = kwargs.pop('raw_body_only', self.raw_body_only)
+        priority = kwargs.pop('priority', PRIORITY_NORMAL)
+        tenant = kwargs.pop('tenant', None)
+        deadline_at = self.__get_deadline(kwargs)
         # you shouldnt need more than 100, 20 is probably fine in most cases
         threads = max(min(threads, 100), 1)
 
-        def _multi_shim(req_and_resp):
-            """Shim self.request to also return the original request."""
-
-            return req_and_resp[0], self.request(
-                req_and_resp,
-                raw_body_only=raw_body_only,
-                opt=opt,
+        reqs_and_resps = list(reqs_and_resps)
+        retry = self.request == self._retry_request
+        results = [None] * len(reqs_and_resps)
+
+        # heap of (time to send, index, attempts already made)
+        queue = [(0, index, 0) for index in range(len(reqs_and_resps))]
+        running = {}
+
+        while queue or running:
+            if deadline_at is not None and time.time() >= deadline_at:
+                break
+            if self.concurrency_limiter is not None:
+                threads = self.concurrency_limiter.limit
+            while (queue and len(running) < threads
+                   and queue[0][0] <= time.time()):
+                _, index, attempt = heapq.heappop(queue)
+                if retry and attempt == 0:
+                    self.retry_policy.start()
+                future = self.dispatcher.submit(
+                    functools.partial(
+                        self._request,
+                        reqs_and_resps[index],
+                        raw_body_only=raw_body_only,
+                        opt=opt,
+                        deadline_at=deadline_at,
+                    ),
+                    priority=priority,
+                    tenant=(
+                        tenant(reqs_and_resps[index]) if callable(tenant)
+                        else tenant
+                    )
+                )
+                running[future] = (index, attempt + 1)
+
+            timeout = None
+            if queue and len(running) < threads:
+                timeout = max(0, queue[0][0] - time.time())
+            if deadline_at is not None:
+                remaining = max(0, deadline_at - time.time())
+                timeout = remaining if timeout is None else min(
+                    timeout,
+                    remaining
+                )
+            if not running:
+                time.sleep(timeout)
+                continue
+
+            done, _ = wait(
+                running,
+                timeout=timeout,
+                return_when=FIRST_COMPLETED
+            )
+            for future in done:
+                index, attempt = running.pop(future)
+                req_and_resp = reqs_and_resps[index]
+                try:
+                    res = future.result()
+                except CircuitOpenException as exc:
+                    results[index] = (
+                        req_and_resp[0],
+                        self.__error_response(
+                            req_and_resp[0],
+                            exc.status_code,
+                            json.dumps({'error': exc.response}).encode(),
+                            raw_body_only
+                        )
+                    )
+                    continue
+
+                delay = None
+                if retry:
+                    delay = self._retry_delay(req_and_resp, attempt, res,
+                                              deadline_at)
+                if delay is None:
+                    results[index] = (req_and_resp[0], res)
+                else:
+                    heapq.heappush(
+                        queue,
+                        (time.time() + delay, index, attempt)
+                    )
+
+        # deadline exceeded: cancel what is still waiting or running
+        unfinished = [index for _, index, _ in queue]
+        for future, (index, _) in running.items():
+            future.cancel()
+            unfinished.append(index)
+        if unfinished:
+            LOGGER.warning(
+                "Deadline exceeded, %d requests cancelled",
+                len(unfinished)
+            )
+        for index in unfinished:
+            request = reqs_and_resps[index][0]
+            results[index] = (
+                request,
+                self.__error_response(
+                    request,
+                    504,
+                    DEADLINE_EXCEEDED,
+                    raw_body_only
+                )
             )
-
-        results = []
-
-        with ThreadPoolExecutor(max_workers=threads) as pool:
-            for result in pool.map(_multi_shim, reqs_and_resps):
-                results.append(result)
 
         return results
 
+    @staticmethod
+    def __error_response(request, status, raw, raw_body_only):
+        """ return a new pyswagger response for a request that did not
+        get one from the API (circuit open, deadline exceeded) """
+        response = Response(request._Request__op)
+        response.raw_body_only = raw_body_only
+        response.apply_with(status=status, header={}, raw=raw)
+        return response
+
     def _request(self, req_and_resp, **kwargs):
         """ Take a request_and_response object from pyswagger.App and
         check auth, token, headers, prepare the actual request and fill the
@@ -201,38 +507,137 @@ class EsiClient(BaseClient):
                               instead of staying a raw dict. [Default: False]
         :param opt: options, see pyswagger/blob/master/pyswagger/io.py#L144
         :param raise_on_error: boolean to raise an error if HTTP Code >= 400
+        :param deadline: (optional) the time (in s) given to the request,
+        cache lookup included. The HTTP timeout is reduced to fit in, and
+        a 504 "Deadline exceeded" response is returned without calling the
+        API once it is exceeded.
+        :param deadline_at: (optional) the deadline, as a timestamp
 
         :return: the final response.
         """
 
         opt = kwargs.pop('opt', {})
+        deadline_at = self.__get_deadline(kwargs)
+        operation_id = get_operation_id(req_and_resp[0])
+        start_request = time.time()
+
+        # fast path: fresh cached responses are returned before building
+        # the request (reset, security, headers merge...)
+        looked_up = {}
+        res = None
+        cache_key = self.__fast_cache_key(req_and_resp[0])
+        if cache_key is not None:
+            cache, permanent_key, res = self.__get_fresh(
+                operation_id,
+                cache_key,
+                looked_up
+            )
+            cache_outcome = 'hit'
 
-        # reset the request and response to reuse existing req_and_resp
-        req_and_resp[0].reset()
-        req_and_resp[1].reset()
+        if res is not None:
+            request, response = req_and_resp
+            response.reset()
 
-        # required because of inheritance
-        request, response = super(EsiClient, self).request(req_and_resp, opt)
+        else:
+            # reset the request and response to reuse existing req_and_resp
+            req_and_resp[0].reset()
+            req_and_resp[1].reset()
 
-        # check cache here so we have all headers, formed url and params
-        cache_key = make_cache_key(request)
-        res = self.__make_request(request, opt, cache_key)
+            # required because of inheritance
+            request, response = super(EsiClient, self).request(
+                req_and_resp,
+                opt
+            )
 
-        if res.status_code == 200:
-            self.__cache_response(cache_key, res, request.method.upper())
+            # check cache here so we have all headers, formed url and params
+            cache_key = make_cache_key(request)
 
-        # generate the Response object from requests response
-        response.raw_body_only = kwargs.pop(
-            'raw_body_only',
-            self.raw_body_only
+            # immutable resources: never expire, never revalidated
+            cache = self.cache
+            permanent_key = self.__permanent_key(
+                operation_id,
+                cache_key,
+                request.method.upper()
+            )
+            if permanent_key is not None:
+                cache = self.permanent_cache
+                if permanent_key in looked_up:
+                    res = looked_up[permanent_key]
+                else:
+                    res = cache.get(permanent_key, None)
+                cache_outcome = 'hit'
+
+            if res is None:
+                res, cache_outcome = self.__make_request(
+                    request,
+                    opt,
+                    cache_key,
+                    looked_up=looked_up,
+                    deadline_at=deadline_at
+                )
+
+        # a fresh hit is already in the cache, with the same expiry
+        bytes_stored = 0
+        if res.status_code == 200 and cache_outcome not in ('hit', 'stale'):
+            if permanent_key is not None:
+                cache.set(
+                    permanent_key,
+                    CachedResponse(
+                        status_code=res.status_code,
+                        headers=res.headers,
+                        content=res.content,
+                        url=res.url,
+                    ),
+                    0
+                )
+                bytes_stored = len(res.content)
+            else:
+                bytes_stored = self.__cache_response(cache_key, res, request)
+
+        # event for cache stats
+        self.signal_cache_stats.send(
+            operation_id=operation_id,
+            backend=cache.__class__.__name__,
+            outcome=cache_outcome,
+            elapsed_time=time.time() - start_request,
+            bytes_saved=(
+                len(res.content)
+                if cache_outcome in ('hit', 'not_modified', 'stale') else 0
+            ),
+            bytes_stored=bytes_stored,
         )
 
+        # generate the Response object from requests response
+        raw_body_only = kwargs.pop('raw_body_only', self.raw_body_only)
+        response.raw_body_only = raw_body_only
+
+        # cached content may be a buffer (BlobCache): give it as is when
+        # it's not parsed, parsing requires bytes.
+        raw = res.content
+        if not raw_body_only and not isinstance(raw, bytes):
+            raw = bytes(raw)
+
+        parsed_key = None
+        if not raw_body_only:
+            parsed_key = self.__parsed_key(cache_key, permanent_key, res)
+        data = self.__get_parsed(parsed_key)
+
         try:
-            response.apply_with(
-                status=res.status_code,
-                header=res.headers,
-                raw=six.BytesIO(res.content).getvalue()
-            )
+            if data is not None:
+                # same content already parsed, only set status and headers
+                response.apply_with(
+                    status=res.status_code,
+                    header=res.headers
+                )
+                response._Response__raw = raw
+                response._Response__data = data
+            else:
+                response.apply_with(
+                    status=res.status_code,
+                    header=res.headers,
+                    raw=raw
+                )
+                self.__set_parsed(parsed_key, response.data)
 
         except (ValueError, Exception):
             # catch when response is not JSON
@@ -261,6 +666,67 @@ class EsiClient(BaseClient):
 
         return response
 
+    def preload(self, app, records, batch_size=500, expire=86400):
+        """ Fill the cache with responses from a local dataset (static data
+        dump...) without calling ESI. Cache keys are generated the same way
+        as for the requests, so the entries are used by the next requests.
+        Permanent operations are stored in the permanent cache.
+
+        Each record is a dict with:
+        - operation: the operation id (ex: get_universe_types_type_id)
+        - params: (optional) the operation parameters
+        - body: the response data, as returned by ESI (json)
+        - headers: (optional) the response headers
+        - expires: (optional) the cache time in seconds, default: expire
+
+        :param app: the pyswagger.App the operations are taken from
+        :param records: iterable of records, see esipy.utils.iter_jsonl
+        :param batch_size: the number of entries in each set_many call
+        :param expire: the default cache time, in seconds
+        :return: the number of entries stored
+        """
+        batches = {}
+        count = 0
+        for record in records:
+            operation_id = record['operation']
+            req_and_resp = app.op[operation_id](**record.get('params', {}))
+            req_and_resp[0].reset()
+            request, _ = super(EsiClient, self).request(req_and_resp, {})
+            cache_key = make_cache_key(request)
+
+            ttl = int(record.get('expires', expire))
+            headers = CaseInsensitiveDict(record.get('headers', {}))
+            headers['Expires'] = formatdate(time.time() + ttl, usegmt=True)
+            value = CachedResponse(
+                status_code=200,
+                headers=headers,
+                content=json.dumps(record['body']).encode('utf-8'),
+                url=request.url,
+            )
+
+            permanent_key = self.__permanent_key(
+                operation_id,
+                cache_key,
+                request.method.upper()
+            )
+            if permanent_key is None:
+                cache, item = self.cache, (cache_key, value, ttl)
+            else:
+                cache, item = self.permanent_cache, (permanent_key, value, 0)
+
+            batch = batches.setdefault(id(cache), (cache, []))[1]
+            batch.append(item)
+            if len(batch) >= batch_size:
+                cache.set_many(batch)
+                count += len(batch)
+                del batch[:]
+
+        for cache, batch in batches.values():
+            if batch:
+                cache.set_many(batch)
+                count += len(batch)
+        return count
+
     def head(self, req_and_resp, **kwargs):
         """ Take a request_and_response object from pyswagger.App, check
         and prepare everything to make a valid HEAD request
@@ -281,7 +747,7 @@ class EsiClient(BaseClient):
         # required because of inheritance
         request, response = super(EsiClient, self).request(req_and_resp, opt)
 
-        res = self.__make_request(request, opt, method='HEAD')
+        res, _ = self.__make_request(request, opt, method='HEAD')
 
         response.apply_with(
             status=res.status_code,
@@ -306,18 +772,163 @@ class EsiClient(BaseClient):
 
         return response
 
-    def __cache_response(self, cache_key, res, method):
-        """ cache the response
+    def __fast_cache_key(self, request):
+        """ return the cache key of a request, computed from the operation
+        and the params only, the same way it is after security is applied
+        in _request. Return None if it can't be known without building
+        the request (uncached method, token to refresh, other security) """
+        if request.method.upper() in self.__uncached_methods__:
+            return None
+
+        # a previous call may have set an older token in the headers
+        headers = dict(request._p['header'])
+        headers.pop('Authorization', None)
+
+        if request._security and self.security is not None:
+            if (not isinstance(self.security, EsiSecurity)
+                    or self.security.is_token_expired()):
+                return None
+            name = self.security.security_name
+            access_token = self.security.access_token
+            if (access_token is not None
+                    and any(name in sec for sec in request._security)):
+                headers['Authorization'] = 'Bearer %s' % access_token
+
+        return (
+            request._Request__op.url,
+            frozenset(headers.items()),
+            frozenset(request._p['path'].items()),
+            frozenset(request._p['query']),
+        )
+
+    def __get_fresh(self, operation_id, cache_key, looked_up):
+        """ return the cache, the permanent key and the fresh cached
+        response for a cache key, or None as response if there is none.
+        Read entries are stored in looked_up. """
+        permanent_key = self.__permanent_key(operation_id, cache_key)
+        if permanent_key is not None:
+            res = self.permanent_cache.get(permanent_key, None)
+            looked_up[permanent_key] = res
+            return self.permanent_cache, permanent_key, res
+
+        res = looked_up[cache_key] = self.cache.get(cache_key, None)
+        if res is not None:
+            expires = res.headers.get('expires', None)
+            if expires is not None and get_cache_time_left(expires) >= 0:
+                return self.cache, None, res
+        return self.cache, None, None
+
+    def __get_breaker(self, request):
+        """ return the circuit breaker of the request operation, or None if
+        circuit breakers are not enabled """
+        if self.circuit_breaker is None:
+            return None
+        operation_id = get_operation_id(request)
+        breaker = self.circuit_breakers.get(operation_id)
+        if breaker is None:
+            with self._breakers_lock:
+                breaker = self.circuit_breakers.get(operation_id)
+                if breaker is None:
+                    breaker = CircuitBreaker(
+                        name=operation_id,
+                        **self.circuit_breaker
+                    )
+                    self.circuit_breakers[operation_id] = breaker
+        return breaker
+
+    @staticmethod
+    def __get_deadline(kwargs):
+        """ pop the deadline params from the kwargs and return the deadline
+        timestamp, or None """
+        deadline_at = kwargs.pop('deadline_at', None)
+        deadline = kwargs.pop('deadline', None)
+        if deadline is not None:
+            deadline_at = min(
+                deadline_at or float('inf'),
+                time.time() + deadline
+            )
+        return deadline_at
+
+    def __get_timeout(self, deadline_at):
+        """ return the client timeout, reduced to the time left before the
+        deadline """
+        if deadline_at is None:
+            return self.timeout
+        remaining = max(deadline_at - time.time(), 0.001)
+        if isinstance(self.timeout, tuple):
+            return tuple(
+                remaining if timeout is None else min(timeout, remaining)
+                for timeout in self.timeout
+            )
+        if self.timeout is None:
+            return remaining
+        return min(self.timeout, remaining)
+
+    def __permanent_key(self, operation_id, cache_key, method='GET'):
+        """ return the cache key of a permanent operation response, or None
+        if the operation is not permanent. Uncached methods (POST...) are
+        never permanent, their body is not part of the cache key """
+        if (operation_id not in self.permanent_operations
+                or method in self.__uncached_methods__):
+            return None
+        return (
+            'esipy:permanent',
+            self.permanent_operations[operation_id],
+            cache_key
+        )
+
+    def __parsed_key(self, cache_key, permanent_key, res):
+        """ return the key of the parsed data for the response, or None if
+        it can't be safely reused: the ETag identifies the content, and
+        permanent responses never change """
+        if not self.parsed_cache_size or res.status_code != 200:
+            return None
+        etag = res.headers.get('etag', None)
+        if permanent_key is not None:
+            return (permanent_key, etag)
+        if etag is None:
+            return None
+        return (cache_key, etag)
+
+    def __get_parsed(self, parsed_key):
+        """ return the parsed data for the given key, if any """
+        if parsed_key is None:
+            return None
+        with self._parsed_lock:
+            data = self._parsed_cache.pop(parsed_key, None)
+            if data is not None:
+                self._parsed_cache[parsed_key] = data
+            return data
+
+    def __set_parsed(self, parsed_key, data):
+        """ keep the parsed data, removing the least recently used ones """
+        if parsed_key is None or data is None:
+            return
+        with self._parsed_lock:
+            self._parsed_cache.pop(parsed_key, None)
+            self._parsed_cache[parsed_key] = data
+            while len(self._parsed_cache) > self.parsed_cache_size:
+                self._parsed_cache.popitem(last=False)
+
+    def __cache_response(self, cache_key, res, request):
+        """ cache the response, return the number of bytes stored
 
         if method is one of self.__uncached_method__, don't cache anything
+        if the cache is a TaggedCache, add the request tags to the entry
         """
         if ('expires' in res.headers
-                and method not in self.__uncached_methods__):
+                and request.method.upper() not in self.__uncached_methods__):
             cache_timeout = get_cache_time_left(res.headers.get('expires'))
 
             # Occasionally CCP swagger will return an outdated expire
             # warn and skip cache if timeout is <0
             if cache_timeout >= 0:
+                kwargs = {}
+                if isinstance(self.cache, TaggedCache):
+                    kwargs['tags'] = make_cache_tags(
+                        request,
+                        self.cache_tag_params
+                    )
                 self.cache.set(
                     cache_key,
                     CachedResponse(
@@ -326,17 +937,30 @@ class EsiClient(BaseClient):
                         content=res.content,
                         url=res.url,
                     ),
-                    cache_timeout
+                    cache_timeout,
+                    **kwargs
                 )
+                return len(res.content)
             else:
                 LOGGER.warning(
                     "[%s] returned expired result: %s", res.url,
                     res.headers)
                 warnings.warn("[%s] returned expired result" % res.url)
+        return 0
 
-    def __make_request(self, request, opt, cache_key=None, method=None):
+    def __make_request(self, request, opt, cache_key=None, method=None,
+                       looked_up=None, deadline_at=None):
         """ Check cache, deal with expiration and etag, make the request and
-        return the response or cached response.
+        return the response or cached response, and the cache outcome:
+
+        - hit: fresh cached response, no request made
+        - not_modified: etag revalidation, 304 returned, cached response used
+        - revalidated: etag revalidation, content changed
+        - expired: cached response expired without etag, full request
+        - miss: nothing in the cache, full request
+        - uncached: method not cached (POST, HEAD...)
+        - stale: circuit breaker open, expired cached response used
+        - deadline: deadline exceeded, no request made
 
         :param request: the pyswagger.io.Request object to prepare the request
         :param opt: options, see pyswagger/blob/master/pyswagger/io.py#L144
@@ -344,11 +968,23 @@ class EsiClient(BaseClient):
         :param method: [default:None] allows to force the method, especially
             useful if you want to make a HEAD request.
             Default value will use endpoint method
+        :param looked_up: (optional) dict of the cache entries already read,
+            to not read them again
+        :param deadline_at: (optional) the deadline timestamp, the request
+            is not made after it, and its timeout is reduced to end before
 
         """
         # check expiration and etags
         opt_headers = {}
-        cached_response = self.cache.get(cache_key, None)
+        method = method or request.method.upper()
+        outcome = 'miss'
+        if method in self.__uncached_methods__:
+            outcome = 'uncached'
+
+        if looked_up is not None and cache_key in looked_up:
+            cached_response = looked_up[cache_key]
+        else:
+            cached_response = self.cache.get(cache_key, None)
         if cached_response is not None:
             # if we have expires cached, and still validd
             expires = cached_response.headers.get('expires', None)
@@ -357,43 +993,84 @@ class EsiClient(BaseClient):
                     cached_response.headers['expires']
                 )
                 if cache_timeout >= 0:
-                    return cached_response
+                    return cached_response, 'hit'
 
+        if deadline_at is not None and time.time() >= deadline_at:
+            LOGGER.warning("[%s] deadline exceeded", request.url)
+            return CachedResponse(
+                status_code=504,
+                headers={},
+                content=DEADLINE_EXCEEDED,
+                url=request.url
+            ), 'deadline'
+
+        # the route keeps failing: don't call it, use stale data if allowed
+        breaker = self.__get_breaker(request)
+        if breaker is not None and not breaker.allow():
+            if cached_response is not None and self.circuit_breaker_stale:
+                LOGGER.warning(
+                    "[%s] circuit open, returned stale result",
+                    request.url
+                )
+                return cached_response, 'stale'
+            raise CircuitOpenException(
+                request.url,
+                get_operation_id(request),
+                request_param=request.query
+            )
+
+        if cached_response is not None:
             # if we have etags, add the header to use them
             etag = cached_response.headers.get('etag', None)
             if etag is not None:
                 opt_headers['If-None-Match'] = etag
+                outcome = 'revalidated'
+            elif outcome == 'miss':
+                outcome = 'expired'
 
             # if nothing makes us use the cache, invalidate everything
             if (expires is None or cache_timeout < 0) and etag is None:
                 self.cache.invalidate(cache_key)
 
-        # apply request-related options before preparation.
-        request.prepare(
-            scheme=self.prepare_schemes(request).pop(),
-            handle_files=False
-        )
-        request._patch(opt)
-
-        # prepare the request and make it.
-        method = method or request.method.upper()
-        request.header.update(opt_headers)
-        prepared_request = self._session.prepare_request(
-            Request(
-                method=method,
-                url=request.url,
-                params=request.query,
-                data=request.data,
-                headers=request.header
+        try:
+            # apply request-related options before preparation.
+            request.prepare(
+                scheme=self.prepare_schemes(request).pop(),
+                handle_files=False
             )
-        )
+            request._patch(opt)
+
+            # prepare the request and make it.
+            request.header.update(opt_headers)
+            prepared_request = self._session.prepare_request(
+                Request(
+                    method=method,
+                    url=request.url,
+                    params=request.query,
+                    data=request.data,
+                    headers=request.header
+                )
+            )
+        except Exception:
+            # release the trial call reserved by allow()
+            if breaker is not None:
+                breaker.failure()
+            raise
         start_api_call = time.time()
 
         try:
-            res = self._session.send(
-                prepared_request,
-                timeout=self.timeout,
-            )
+            if self.hedging is not None and method == 'GET':
+                res = self.hedging.send(
+                    self._session.send,
+                    prepared_request,
+                    get_operation_id(request),
+                    timeout=self.__get_timeout(deadline_at),
+                )
+            else:
+                res = self._session.send(
+                    prepared_request,
+                    timeout=self.__get_timeout(deadline_at),
+                )
 
         except (RequestsConnectionError, Timeout) as exc:
             # timeout issue, generate a fake response to finish the process
@@ -405,20 +1082,41 @@ class EsiClient(BaseClient):
                 url=prepared_request.url
             )
 
+        except Exception:
+            if breaker is not None:
+                breaker.failure()
+            raise
+
+        if breaker is not None:
+            if res.status_code >= 500 or res.status_code == 420:
+                breaker.failure()
+            else:
+                breaker.success()
+
+        elapsed_time = time.time() - start_api_call
+        if self.concurrency_limiter is not None:
+            self.concurrency_limiter.update(
+                elapsed_time,
+                res.status_code,
+                res.headers
+            )
+
         # event for api call stats
         self.signal_api_call_stats.send(
             url=res.url,
             status_code=res.status_code,
-            elapsed_time=time.time() - start_api_call,
+            elapsed_time=elapsed_time,
             message=res.content if res.status_code != 200 else None
         )
 
         # if we have HTTP 304 (content didn't change), return the cached
         # response updated with the new headers
-        if (res.status_code == 304
-                and cached_response is not None
-                and not self.no_etag_body):
-            cached_response.headers['Expires'] = res.headers.get('Expires')
-            cached_response.headers['Date'] = res.headers.get('Date')
-            return cached_response
-        return res
+        if res.status_code == 304 and cached_response is not None:
+            outcome = 'not_modified'
+            if not self.no_etag_body:
+                cached_response.headers['Expires'] = res.headers.get(
+                    'Expires'
+                )
+                cached_response.headers['Date'] = res.headers.get('Date')
+                return cached_response, outcome
+        return res, outcome
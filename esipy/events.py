@@ -62,3 +62,5 @@ class Signal(object):
 # define required alarms
 AFTER_TOKEN_REFRESH = Signal()
 API_CALL_STATS = Signal()
+API_CACHE_STATS = Signal()
+API_RETRY = Signal()
@@ -15,3 +15,16 @@ class APIException(Exception):
 
     def __str__(self):
         return 'HTTP Error %s: %s' % (self.status_code, self.response)
+
+
+class CircuitOpenException(APIException):
+    """ Exception raised when a request is not sent because the circuit
+    breaker of its operation is open (the route keeps failing) """
+
+    def __init__(self, url, operation_id, **kwargs):
+        self.operation_id = operation_id
+        kwargs.setdefault(
+            'response',
+            'Circuit open for %s, request not sent' % operation_id
+        )
+        super(CircuitOpenException, self).__init__(url, 503, **kwargs)
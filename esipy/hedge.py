@@ -0,0 +1,161 @@
+# -*- encoding: utf-8 -*-
+""" Hedged requests, to cut the tail latency of GET requests """
+import collections
+import functools
+import logging
+import threading
+import time
+
+from concurrent.futures import FIRST_COMPLETED
+from concurrent.futures import wait
+
+from .retry import RetryBudget
+from .scheduler import Dispatcher
+
+LOGGER = logging.getLogger(__name__)
+
+
+def _close_response(future):
+    """ done callback closing the response of a hedge that lost """
+    if not future.cancelled() and future.exception() is None:
+        future.result().close()
+
+
+class HedgePolicy(object):
+    """ Send a second identical request when the first one is slower than
+    the usual latency of its route, and use the first response received.
+
+    - the hedge delay is the `percentile` of the last `window` latencies
+      of the route, measured on the first attempts only. Routes with less
+      than `min_samples` latencies are not hedged.
+    - the hedges are limited to `max_rate` of the requests (see
+      esipy.retry.RetryBudget), so the extra load stays bounded.
+
+    Only use it for idempotent requests. The requests are sent by the
+    policy dispatcher threads, a policy can be shared by several clients.
+    """
+
+    def __init__(self, percentile=95, min_samples=20, window=200,
+                 min_delay=0.01, max_rate=0.05, budget=None,
+                 max_workers=100):
+        """ Constructor
+
+        :param percentile: the latency percentile after which a request is
+        hedged
+        :param min_samples: the latencies required before hedging a route
+        :param window: the number of latencies kept for each route
+        :param min_delay: the minimum delay (in s) before hedging
+        :param max_rate: the share of requests that can be hedged
+        :param budget: (optional) a RetryBudget limiting the hedges,
+        instead of max_rate
+        :param max_workers: the maximum number of threads sending requests
+        """
+        self.percentile = percentile
+        self.min_samples = min_samples
+        self.window = window
+        self.min_delay = min_delay
+        self.budget = budget or RetryBudget(
+            ratio=max_rate,
+            min_retries=1,
+            window=10
+        )
+        self.dispatcher = Dispatcher(
+            max_workers=max_workers,
+            reserved=0,
+            aging=0,
+            name='esipy-hedge'
+        )
+
+        self._lock = threading.Lock()
+        self._latencies = {}
+        self.stats = {
+            'requests': 0,
+            'hedged': 0,
+            'hedge_wins': 0,
+        }
+
+    def get_delay(self, route):
+        """ Return the delay (in s) before hedging a request of the route,
+        or None if the route has not enough latencies yet
+
+        :param route: the route key (operation id)
+        """
+        with self._lock:
+            latencies = self._latencies.get(route, None)
+            if latencies is None or len(latencies) < self.min_samples:
+                return None
+            latencies = sorted(latencies)
+        index = min(
+            len(latencies) - 1,
+            int(len(latencies) * self.percentile / 100.)
+        )
+        return max(self.min_delay, latencies[index])
+
+    def record(self, route, elapsed_time):
+        """ Record the latency of a request of the route
+
+        :param route: the route key (operation id)
+        :param elapsed_time: the request duration, in seconds
+        """
+        with self._lock:
+            if route not in self._latencies:
+                self._latencies[route] = collections.deque(
+                    maxlen=self.window
+                )
+            self._latencies[route].append(elapsed_time)
+
+    def send(self, send, request, route, **kwargs):
+        """ Call send(request, **kwargs), and hedge it if it takes longer
+        than the route delay. The first successful response is returned,
+        the exception is raised if both requests failed.
+
+        :param send: the send function (requests.Session.send)
+        :param request: the requests.PreparedRequest to send
+        :param route: the route key (operation id)
+        :param kwargs: the params of the send function
+        :return: the response
+        """
+        with self._lock:
+            self.stats['requests'] += 1
+        self.budget.record_request()
+        delay = self.get_delay(route)
+
+        def timed_send():
+            """ send the first attempt and record its latency """
+            start = time.time()
+            res = send(request, **kwargs)
+            self.record(route, time.time() - start)
+            return res
+
+        if delay is None:
+            return timed_send()
+
+        first = self.dispatcher.submit(timed_send)
+        done, _ = wait([first], timeout=delay)
+        if done or not self.budget.withdraw():
+            return first.result()
+
+        with self._lock:
+            self.stats['hedged'] += 1
+        LOGGER.debug("[%s] hedged after %.3fs", request.url, delay)
+        second = self.dispatcher.submit(
+            functools.partial(send, request.copy(), **kwargs)
+        )
+
+        pending = [first, second]
+        error = None
+        while pending:
+            done, _ = wait(pending, return_when=FIRST_COMPLETED)
+            for future in [f for f in pending if f in done]:
+                pending.remove(future)
+                if future.exception() is not None:
+                    error = error or future.exception()
+                    continue
+                if future is second:
+                    with self._lock:
+                        self.stats['hedge_wins'] += 1
+                for other in pending:
+                    other.cancel()
+                    other.add_done_callback(_close_response)
+                return future.result()
+        raise error
@@ -0,0 +1,126 @@
+# -*- encoding: utf-8 -*-
+""" Adaptive concurrency limit for the client batches """
+import logging
+import threading
+import time
+
+LOGGER = logging.getLogger(__name__)
+
+
+class AdaptiveLimiter(object):
+    """ Concurrency limit adjusted with AIMD (additive increase,
+    multiplicative decrease) from the API responses:
+
+    - each success adds `increase / limit`, so about `increase` for each
+      `limit` successful calls.
+    - the limit is multiplied by `decrease` on 5xx or 420 errors, when the
+      ESI error limit remain is under `error_limit_threshold`, or when the
+      latency goes over `latency_tolerance` times the baseline latency.
+      Calls started before the last decrease are ignored, so one burst of
+      errors only decreases the limit once.
+    """
+
+    def __init__(self, initial=20, min_limit=1, max_limit=100, increase=1,
+                 decrease=0.7, latency_tolerance=3, error_limit_threshold=20):
+        """ Constructor
+
+        :param initial: the initial limit
+        :param min_limit: the minimum limit
+        :param max_limit: the maximum limit
+        :param increase: the increase for `limit` successful calls
+        :param decrease: the factor applied to the limit on overload
+        :param latency_tolerance: the latency / baseline ratio considered as
+        an overload, None to ignore latency
+        :param error_limit_threshold: the X-Esi-Error-Limit-Remain value
+        under which the limit is decreased
+        """
+        self.min_limit = min_limit
+        self.max_limit = max_limit
+        self.increase = increase
+        self.decrease = decrease
+        self.latency_tolerance = latency_tolerance
+        self.error_limit_threshold = error_limit_threshold
+
+        self._lock = threading.Lock()
+        self._limit = float(max(min_limit, min(initial, max_limit)))
+        self._baseline = None
+        self._latency = None
+        self._last_decrease = 0
+        self.stats = {
+            'increases': 0,
+            'decreases': 0,
+        }
+
+    @property
+    def limit(self):
+        """ Return the current concurrency limit """
+        return int(self._limit)
+
+    def snapshot(self):
+        """ Return the current limit, latencies and counters """
+        with self._lock:
+            stats = dict(self.stats)
+            stats.update(
+                limit=int(self._limit),
+                latency=self._latency,
+                baseline=self._baseline,
+            )
+            return stats
+
+    def _is_overloaded(self, elapsed_time, status_code, headers):
+        """ check the response and update the latencies. Must be called
+        with the lock acquired """
+        if status_code >= 500 or status_code == 420:
+            return True
+
+        remain = headers.get('X-Esi-Error-Limit-Remain', None)
+        if remain is not None:
+            try:
+                if int(remain) < self.error_limit_threshold:
+                    return True
+            except (TypeError, ValueError):
+                LOGGER.warning(
+                    "Invalid X-Esi-Error-Limit-Remain header: %s", remain
+                )
+
+        if self._baseline is None:
+            self._baseline = self._latency = elapsed_time
+            return False
+        self._latency += (elapsed_time - self._latency) * 0.2
+        # slowly follow latency increases, immediately follow decreases
+        self._baseline = min(
+            elapsed_time,
+            self._baseline + (elapsed_time - self._baseline) * 0.01
+        )
+        return (
+            self.latency_tolerance is not None
+            and self._latency > self._baseline * self.latency_tolerance
+        )
+
+    def update(self, elapsed_time, status_code, headers=None):
+        """ Update the limit with the result of an API call
+
+        :param elapsed_time: the call duration, in seconds
+        :param status_code: the response status code
+        :param headers: (optional) the response headers
+        """
+        with self._lock:
+            now = time.time()
+            overloaded = self._is_overloaded(
+                elapsed_time,
+                status_code,
+                headers or {}
+            )
+            if overloaded:
+                if now - elapsed_time < self._last_decrease:
+                    return
+                self._last_decrease = now
+                self._limit = max(self.min_limit, self._limit * self.decrease)
+                self.stats['decreases'] += 1
+                LOGGER.info('Concurrency limit decreased to %d', self._limit)
+            elif self._limit < self.max_limit:
+                self._limit = min(
+                    self.max_limit,
+                    self._limit + self.increase / self._limit
+                )
+                self.stats['increases'] += 1
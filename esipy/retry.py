@@ -0,0 +1,190 @@
+# -*- encoding: utf-8 -*-
+""" Retry policies used by EsiClient when retry_requests is set """
+import collections
+import logging
+import random
+import threading
+import time
+
+from .utils import get_cache_time_left
+
+LOGGER = logging.getLogger(__name__)
+
+
+def _get_header(response, name):
+    """ return a header value from a pyswagger response (values are lists)
+    or a requests response, None if not set """
+    headers = getattr(response, 'header', None)
+    if headers is None:
+        headers = getattr(response, 'headers', None) or {}
+    value = headers.get(name, None)
+    if isinstance(value, list):
+        value = value[0] if value else None
+    return value
+
+
+class RetryBudget(object):
+    """ Limit the share of retries over a sliding window, so retries do
+    not multiply the load during an incident. A retry is allowed while
+    retries < min_retries + ratio * requests, over the last `window`
+    seconds. A budget can be shared by several policies and clients.
+    """
+
+    def __init__(self, ratio=0.2, min_retries=10, window=10):
+        """ Constructor
+
+        :param ratio: the share of retries allowed, relative to requests
+        :param min_retries: the retries always allowed in the window
+        :param window: the duration of the window, in seconds
+        """
+        self.ratio = ratio
+        self.min_retries = min_retries
+        self.window = window
+
+        self._lock = threading.Lock()
+        self._requests = collections.deque()
+        self._retries = collections.deque()
+
+    def _purge(self, now):
+        """ remove the events out of the window. Must be called with the
+        lock acquired """
+        limit = now - self.window
+        for events in (self._requests, self._retries):
+            while events and events[0] < limit:
+                events.popleft()
+
+    def record_request(self):
+        """ Record a new request (first attempt) """
+        with self._lock:
+            now = time.time()
+            self._purge(now)
+            self._requests.append(now)
+
+    def withdraw(self):
+        """ Return True and record the retry if the budget allows it """
+        with self._lock:
+            now = time.time()
+            self._purge(now)
+            allowed = self.min_retries + self.ratio * len(self._requests)
+            if len(self._retries) >= allowed:
+                return False
+            self._retries.append(now)
+            return True
+
+
+class RetryPolicy(object):
+    """ Decide if a failed request is retried, and how long to wait before
+    the next attempt: exponential backoff with jitter, or the delay given
+    by the response headers (Retry-After, ESI error limit reset).
+    """
+
+    def __init__(self, max_attempts=5, backoff=0.1, multiplier=2,
+                 max_backoff=30, jitter=True,
+                 retry_statuses=(420, 429, 500, 502, 503, 504),
+                 retry_after=True, max_retry_after=60, budget=None):
+        """ Constructor
+
+        :param max_attempts: the maximum number of attempts, first included
+        :param backoff: the delay (in s) before the first retry
+        :param multiplier: the delay multiplier for each retry
+        :param max_backoff: the maximum delay computed with the backoff
+        :param jitter: use a random delay between 0 and the backoff, so
+        workers failing at the same time don't retry at the same time
+        :param retry_statuses: the status codes to retry
+        :param retry_after: use the delay given by Retry-After or
+        X-Esi-Error-Limit-Reset headers when they are set
+        :param max_retry_after: the maximum header delay (in s), a longer
+        delay stops the retries
+        :param budget: (optional) a RetryBudget limiting the retries
+        """
+        self.max_attempts = max_attempts
+        self.backoff = backoff
+        self.multiplier = multiplier
+        self.max_backoff = max_backoff
+        self.jitter = jitter
+        self.retry_statuses = retry_statuses
+        self.retry_after = retry_after
+        self.max_retry_after = max_retry_after
+        self.budget = budget
+
+    def start(self):
+        """ Called once for each request, before the first attempt """
+        if self.budget is not None:
+            self.budget.record_request()
+
+    def get_backoff(self, attempt):
+        """ Return the backoff delay after the given failed attempt """
+        delay = min(
+            self.max_backoff,
+            self.backoff * self.multiplier ** (attempt - 1)
+        )
+        if self.jitter:
+            delay = random.uniform(0, delay)
+        return delay
+
+    def get_header_delay(self, response):
+        """ Return the delay requested by the response headers, or None """
+        retry_after = _get_header(response, 'Retry-After')
+        if retry_after is not None:
+            try:
+                return max(0, float(retry_after))
+            except ValueError:
+                pass
+            try:
+                # HTTP-date format
+                return max(0, get_cache_time_left(retry_after))
+            except (TypeError, ValueError):
+                LOGGER.warning("Invalid Retry-After header: %s", retry_after)
+
+        if response.status == 420:
+            reset = _get_header(response, 'X-Esi-Error-Limit-Reset')
+            if reset is not None:
+                try:
+                    return max(0, float(reset))
+                except (TypeError, ValueError):
+                    LOGGER.warning(
+                        "Invalid X-Esi-Error-Limit-Reset header: %s", reset
+                    )
+        return None
+
+    def next_delay(self, attempt, response):
+        """ Return the delay (in s) to wait before the next attempt, or
+        None if the request must not be retried.
+
+        :param attempt: the number of attempts already made
+        :param response: the response of the last attempt
+        """
+        if response.status not in self.retry_statuses:
+            return None
+        if attempt >= self.max_attempts:
+            return None
+
+        delay = None
+        if self.retry_after:
+            delay = self.get_header_delay(response)
+            if delay is not None and delay > self.max_retry_after:
+                LOGGER.warning(
+                    "Retry delay too long (%ds), not retrying.", delay
+                )
+                return None
+        if delay is None:
+            delay = self.get_backoff(attempt)
+
+        if self.budget is not None and not self.budget.withdraw():
+            LOGGER.warning("Retry budget exhausted, not retrying.")
+            return None
+        return delay
+
+
+class LegacyRetryPolicy(RetryPolicy):
+    """ The historical EsiClient retry behavior: 5 attempts for 5xx errors,
+    with 0.01, 0.16, 0.81, 2.56s delays, headers are ignored. """
+
+    def __init__(self, **kwargs):
+        kwargs.setdefault('retry_statuses', range(500, 600))
+        kwargs.setdefault('retry_after', False)
+        kwargs.setdefault('jitter', False)
+        super(LegacyRetryPolicy, self).__init__(**kwargs)
+
+    def get_backoff(self, attempt):
+        return attempt ** 4 / 100.
@@ -0,0 +1,279 @@
+# -*- encoding: utf-8 -*-
+""" Priority dispatcher running the client requests in worker threads """
+import collections
+import logging
+import threading
+import time
+
+from concurrent.futures import Future
+
+LOGGER = logging.getLogger(__name__)
+
+# priority classes, lower value is served first
+PRIORITY_HIGH = 0
+PRIORITY_NORMAL = 1
+PRIORITY_LOW = 2
+
+
+class _Task(object):
+    """ a function waiting to be run by the dispatcher """
+    __slots__ = ('fn', 'future', 'priority', 'tenant', 'enqueued')
+
+    def __init__(self, fn, priority, tenant):
+        self.fn = fn
+        self.future = Future()
+        self.priority = priority
+        self.tenant = tenant
+        self.enqueued = time.time()
+
+
+class _TenantQueues(object):
+    """ the tasks of a priority class, in one queue per tenant. Tenants
+    are served with a smooth weighted round-robin """
+
+    def __init__(self):
+        self.queues = collections.OrderedDict()
+        self.credits = {}
+
+    def __len__(self):
+        return sum(len(queue) for queue in self.queues.values())
+
+    def __iter__(self):
+        for queue in self.queues.values():
+            for task in queue:
+                yield task
+
+    def append(self, task):
+        """ add a task at the end of its tenant queue """
+        if task.tenant not in self.queues:
+            self.queues[task.tenant] = collections.deque()
+            self.credits[task.tenant] = 0
+        self.queues[task.tenant].append(task)
+
+    def clear(self):
+        """ remove all the tasks """
+        self.queues.clear()
+        self.credits.clear()
+
+    def oldest(self, tenants):
+        """ return the enqueue time of the oldest task of the tenants """
+        return min(self.queues[tenant][0].enqueued for tenant in tenants)
+
+    def pop(self, tenants, weights):
+        """ remove and return the next task of the given tenants: each one
+        gains its weight, the richest is served and pays the total """
+        total = 0
+        selected = None
+        for tenant in tenants:
+            weight = weights.get(tenant, 1)
+            total += weight
+            self.credits[tenant] += weight
+            if (selected is None
+                    or self.credits[tenant] > self.credits[selected]):
+                selected = tenant
+        self.credits[selected] -= total
+
+        queue = self.queues[selected]
+        task = queue.popleft()
+        if not queue:
+            del self.queues[selected]
+            del self.credits[selected]
+        return task
+
+
+class Dispatcher(object):
+    """ Thread pool running tasks by priority instead of FIFO.
+
+    - Tasks with the lowest priority value are run first.
+    - `reserved` workers, on top of `max_workers`, can only run
+      PRIORITY_HIGH tasks, so interactive requests are not stuck behind a
+      big batch.
+    - To prevent starvation, waiting tasks get one priority class higher
+      every `aging` seconds.
+    - Tasks can be tagged with a tenant (character, corporation...). In a
+      priority class, tenants are served with a weighted round-robin, and
+      each one can be limited to `tenant_max_running` running tasks, so a
+      big tenant can't use all the workers.
+
+    Worker threads are started when required, and stopped after being
+    idle for `idle_timeout` seconds.
+    """
+
+    def __init__(self, max_workers=100, reserved=10, aging=30,
+                 idle_timeout=30, name=None, tenant_weights=None,
+                 tenant_max_running=None):
+        """ Constructor
+
+        :param max_workers: the maximum number of worker threads running
+        any task
+        :param reserved: the extra workers reserved for PRIORITY_HIGH tasks
+        :param aging: the waiting time (in s) to gain one priority class,
+        0 to disable aging
+        :param idle_timeout: the time (in s) before an idle worker stops
+        :param name: (optional) name used for the worker threads
+        :param tenant_weights: (optional) dict of tenant => weight, for the
+        round-robin between tenants. Default weight: 1
+        :param tenant_max_running: (optional) the maximum running tasks for
+        each tenant (tasks without tenant are not limited)
+        """
+        self.max_workers = max_workers
+        self.reserved = reserved
+        self.aging = aging
+        self.idle_timeout = idle_timeout
+        self.name = name or 'esipy-dispatcher'
+        self.tenant_weights = tenant_weights or {}
+        self.tenant_max_running = tenant_max_running
+
+        self._cond = threading.Condition()
+        self._queues = {}
+        self._workers = 0
+        self._idle = 0
+        self._running_shared = 0
+        self._running_tenants = collections.Counter()
+        self._shutdown = False
+        self.stats = {
+            'submitted': 0,
+            'completed': 0,
+        }
+
+    def submit(self, fn, priority=PRIORITY_NORMAL, tenant=None):
+        """ Schedule fn() to be run, and return a Future for its result.
+
+        :param fn: the callable to run, without arguments
+        :param priority: the task priority class
+        :param tenant: (optional) the tenant the task is run for
+        :return: a concurrent.futures.Future
+        """
+        task = _Task(fn, priority, tenant)
+        with self._cond:
+            if self._shutdown:
+                raise RuntimeError('cannot submit after shutdown')
+            self._enqueue(task)
+            self.stats['submitted'] += 1
+            if (self._idle == 0
+                    and self._workers < self.max_workers + self.reserved):
+                self._workers += 1
+                worker = threading.Thread(
+                    target=self._worker,
+                    name='%s-%d' % (self.name, self._workers)
+                )
+                worker.daemon = True
+                worker.start()
+            else:
+                self._cond.notify()
+        return task.future
+
+    def pending(self):
+        """ Return the number of tasks waiting for a worker """
+        with self._cond:
+            return sum(len(queue) for queue in self._queues.values())
+
+    def shutdown(self, wait=True):
+        """ Stop the workers and cancel the tasks not started yet.
+
+        :param wait: wait for the running tasks to finish
+        """
+        with self._cond:
+            self._shutdown = True
+            for queue in self._queues.values():
+                for task in queue:
+                    task.future.cancel()
+                queue.clear()
+            self._cond.notify_all()
+            while wait and self._workers:
+                self._cond.wait()
+
+    def _enqueue(self, task):
+        """ add the task to its priority queue. Must be called with the lock
+        acquired """
+        if task.priority not in self._queues:
+            self._queues[task.priority] = _TenantQueues()
+        self._queues[task.priority].append(task)
+
+    def _can_run(self, priority):
+        """ return True if a task of this priority can use a worker now.
+        Must be called with the lock acquired """
+        return (
+            priority <= PRIORITY_HIGH
+            or self._running_shared < self.max_workers
+        )
+
+    def _tenant_can_run(self, tenant):
+        """ return True if the tenant is under its running tasks limit.
+        Must be called with the lock acquired """
+        return (
+            tenant is None
+            or self.tenant_max_running is None
+            or self._running_tenants[tenant] < self.tenant_max_running
+        )
+
+    def _next_task(self):
+        """ return the next task to run, or None. Must be called with the
+        lock acquired """
+        now = time.time()
+        best = None
+        best_queue = None
+        best_tenants = None
+        for priority, queue in self._queues.items():
+            if not queue.queues or not self._can_run(priority):
+                continue
+            tenants = [
+                tenant for tenant in queue.queues
+                if self._tenant_can_run(tenant)
+            ]
+            if not tenants:
+                continue
+            effective = priority
+            if self.aging:
+                effective -= (now - queue.oldest(tenants)) / self.aging
+            if best is None or (effective, priority) < best:
+                best = (effective, priority)
+                best_queue = queue
+                best_tenants = tenants
+        if best_queue is None:
+            return None
+        return best_queue.pop(best_tenants, self.tenant_weights)
+
+    def _worker(self):
+        """ worker thread loop """
+        while True:
+            with self._cond:
+                task = self._next_task()
+                while task is None:
+                    if self._shutdown:
+                        self._workers -= 1
+                        self._cond.notify_all()
+                        return
+                    self._idle += 1
+                    notified = self._cond.wait(self.idle_timeout)
+                    self._idle -= 1
+                    task = self._next_task()
+                    if task is None and not notified:
+                        self._workers -= 1
+                        return
+                shared = task.priority > PRIORITY_HIGH
+                if shared:
+                    self._running_shared += 1
+                if task.tenant is not None:
+                    self._running_tenants[task.tenant] += 1
+
+            try:
+                if task.future.set_running_or_notify_cancel():
+                    try:
+                        result = task.fn()
+                    except BaseException as exc:  # pylint: disable=W0703
+                        task.future.set_exception(exc)
+                    else:
+                        task.future.set_result(result)
+            finally:
+                with self._cond:
+                    self.stats['completed'] += 1
+                    if shared:
+                        self._running_shared -= 1
+                    if task.tenant is not None:
+                        self._running_tenants[task.tenant] -= 1
+                        if not self._running_tenants[task.tenant]:
+                            del self._running_tenants[task.tenant]
+                    if shared or task.tenant is not None:
+                        # a waiting task may be allowed to run now
+                        self._cond.notify()
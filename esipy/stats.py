@@ -0,0 +1,88 @@
+# -*- encoding: utf-8 -*-
+""" Statistics collectors, to be used as receivers of EsiPy signals """
+import threading
+
+
+class CacheStats(object):
+    """ Collect the cache statistics sent by EsiClient through the
+    API_CACHE_STATS signal, by operation id and cache backend.
+
+    Usage::
+
+        stats = CacheStats()
+        API_CACHE_STATS.add_receiver(stats)
+        ...
+        stats.snapshot()
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._stats = {}
+
+    def __call__(self, operation_id, backend, outcome, elapsed_time,
+                 bytes_saved=0, bytes_stored=0, **kwargs):
+        """ Receiver for the API_CACHE_STATS signal """
+        with self._lock:
+            stats = self._stats.get((operation_id, backend))
+            if stats is None:
+                stats = self._stats[(operation_id, backend)] = {
+                    'bytes_saved': 0,
+                    'bytes_stored': 0,
+                    'outcomes': {},
+                }
+            stats['bytes_saved'] += bytes_saved
+            stats['bytes_stored'] += bytes_stored
+
+            outcome_stats = stats['outcomes'].setdefault(outcome, {
+                'count': 0,
+                'total_time': 0.0,
+                'max_time': 0.0,
+            })
+            outcome_stats['count'] += 1
+            outcome_stats['total_time'] += elapsed_time
+            outcome_stats['max_time'] = max(
+                outcome_stats['max_time'],
+                elapsed_time
+            )
+
+    def snapshot(self):
+        """ Return the statistics as a dict of
+        (operation_id, backend) => {
+            'requests', 'hit_ratio', 'bytes_saved', 'bytes_stored',
+            'outcomes': {outcome: {'count', 'total_time', 'max_time',
+                                   'mean_time'}}
+        }
+
+        hit_ratio is the share of requests answered with cached data
+        (hit and not_modified).
+        """
+        result = {}
+        with self._lock:
+            for key, stats in self._stats.items():
+                outcomes = {}
+                for outcome, outcome_stats in stats['outcomes'].items():
+                    outcomes[outcome] = dict(outcome_stats)
+                    outcomes[outcome]['mean_time'] = (
+                        outcome_stats['total_time'] / outcome_stats['count']
+                    )
+                requests = sum(
+                    outcome['count'] for outcome in outcomes.values()
+                )
+                hits = sum(
+                    outcomes[outcome]['count']
+                    for outcome in ('hit', 'not_modified')
+                    if outcome in outcomes
+                )
+                result[key] = {
+                    'requests': requests,
+                    'hit_ratio': float(hits) / requests,
+                    'bytes_saved': stats['bytes_saved'],
+                    'bytes_stored': stats['bytes_stored'],
+                    'outcomes': outcomes,
+                }
+        return result
+
+    def reset(self):
+        """ Clear all the statistics """
+        with self._lock:
+            self._stats.clear()
@@ -0,0 +1,96 @@
+# -*- encoding: utf-8 -*-
+""" Transport adapters for the EsiClient requests session """
+import logging
+
+from requests import Response
+from requests.adapters import BaseAdapter
+from requests.exceptions import ConnectionError as RequestsConnectionError
+from requests.exceptions import ConnectTimeout
+from requests.exceptions import ReadTimeout
+from requests.structures import CaseInsensitiveDict
+from requests.utils import get_encoding_from_headers
+
+LOGGER = logging.getLogger(__name__)
+
+
+class Http2Adapter(BaseAdapter):
+    """ requests transport adapter sending the requests with httpx, over
+    HTTP/2: the concurrent requests to ESI are multiplexed over a few
+    connections, instead of one TCP+TLS connection for each.
+
+    Use it as EsiClient transport adapter, so caching, ETag and signals
+    work the same way:
+
+        EsiClient(transport_adapter=Http2Adapter())
+
+    TLS verification, client certificates and proxies are set on the
+    httpx client, the per request values of requests are ignored.
+
+    This adapter requires you to install httpx with HTTP/2 support using
+    `pip install EsiPy[http2]` (or `pip install httpx[http2]`)
+    """
+
+    def __init__(self, client=None, **kwargs):
+        """ Constructor
+
+        :param client: (optional) the httpx.Client used to send requests.
+        Default: a new HTTP/2 client
+        :param kwargs: the params of the new httpx.Client (limits,
+        verify...), if client is not given
+        """
+        import httpx
+        super(Http2Adapter, self).__init__()
+        self._httpx = httpx
+        if client is None:
+            kwargs.setdefault('http2', True)
+            client = httpx.Client(**kwargs)
+        self.client = client
+
+    def _get_timeout(self, timeout):
+        """ convert a requests timeout (float, or (connect, read) tuple)
+        to httpx """
+        if isinstance(timeout, tuple):
+            connect, read = timeout
+            return self._httpx.Timeout(read, connect=connect)
+        return self._httpx.Timeout(timeout)
+
+    def send(self, request, stream=False, timeout=None, verify=True,
+             cert=None, proxies=None):
+        """ Send a requests.PreparedRequest, return a requests.Response.
+        Same params as requests.adapters.HTTPAdapter.send """
+        httpx = self._httpx
+        try:
+            res = self.client.request(
+                request.method,
+                request.url,
+                headers=list(request.headers.items()),
+                content=request.body,
+                timeout=self._get_timeout(timeout),
+            )
+        except httpx.ConnectTimeout as exc:
+            raise ConnectTimeout(exc, request=request)
+        except httpx.TimeoutException as exc:
+            raise ReadTimeout(exc, request=request)
+        except httpx.TransportError as exc:
+            raise RequestsConnectionError(exc, request=request)
+        return self.build_response(request, res)
+
+    def build_response(self, request, res):
+        """ Build a requests.Response from an httpx response, with its
+        content already read """
+        response = Response()
+        response.status_code = res.status_code
+        response.headers = CaseInsensitiveDict(res.headers.items())
+        response.encoding = get_encoding_from_headers(response.headers)
+        response.reason = res.reason_phrase
+        response.url = request.url
+        response.request = request
+        response.connection = self
+        response._content = res.content
+        # no raw stream to read or close
+        response._content_consumed = True
+        return response
+
+    def close(self):
+        """ Close the httpx client and its connections """
+        self.client.close()
@@ -2,6 +2,8 @@
 """ Helper and utils functions """
 import base64
 import hashlib
+import io
+import json
 import os
 
 from datetime import datetime
@@ -20,6 +22,39 @@ def make_cache_key(request):
     return (request.url, headers, path, query)
 
 
+def get_operation_id(request):
+    """ Return the operation id (ex: get_characters_character_id) of a
+    pyswagger request """
+    return request._Request__op.operationId
+
+
+def get_tenant(req_and_resp,
+               params=('character_id', 'corporation_id', 'alliance_id')):
+    """ Return the tenant key of a request, to share the workers fairly in
+    EsiClient.multi_request: the first of the path params set, as
+    "<param>:<value>", or None. """
+    path = req_and_resp[0]._p['path']
+    for param in params:
+        if param in path:
+            return '%s:%s' % (param, path[param])
+    return None
+
+
+def make_cache_tags(request, params):
+    """ Generate the cache tags of a request: one tag for the route, and
+    one for each of the given path params used in the request.
+
+    Tags format is "route:<operation_id>" and "<param>:<value>",
+    for example "character_id:123456789".
+    """
+    tags = ['route:%s' % get_operation_id(request)]
+    path = request._p['path']
+    for param in params:
+        if param in path:
+            tags.append('%s:%s' % (param, path[param]))
+    return tags
+
+
 def check_cache(cache):
     """ check if a cache fits esipy needs or not """
     if isinstance(cache, BaseCache):
@@ -45,6 +80,16 @@ def get_cache_time_left(expires_header):
     return int(expire) - int(now)
 
 
+def iter_jsonl(path):
+    """ Iterate over the records of a JSON lines file (one json object per
+    line), for example to preload a cache with EsiClient.preload() """
+    with io.open(path, encoding='utf-8') as jsonl:
+        for line in jsonl:
+            line = line.strip()
+            if line:
+                yield json.loads(line)
+
+
 def generate_code_verifier(n_bytes=64):
     """
     source: https://github.com/openstack/deb-python-oauth2client
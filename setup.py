@@ -14,6 +14,12 @@ install_requirements = [
     "python-jose >= 3.0 , < 4"
 ]
 
+# optional requirements
+extras_requirements = {
+    # esipy.transport.Http2Adapter
+    "http2": ["httpx[http2]"],
+}
+
 # test requirements
 test_requirements = [
     "coverage",
@@ -41,6 +47,7 @@ setup(
     description='Swagger Client for the ESI API for EVE Online',
     long_description=README,
     install_requires=install_requirements,
+    extras_require=extras_requirements,
     tests_require=test_requirements,
     test_suite='nose.collector',
     classifiers=[
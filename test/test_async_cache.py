@@ -0,0 +1,182 @@
+# -*- encoding: utf-8 -*-
+# pylint: skip-file
+from __future__ import absolute_import
+
+import asyncio
+import shutil
+import tempfile
+import threading
+import time
+
+from concurrent.futures import ThreadPoolExecutor
+
+from esipy.async_cache import AsyncBaseCache
+from esipy.async_cache import AsyncCacheAdapter
+from esipy.async_cache import AsyncDictCache
+from esipy.async_cache import AsyncFileCache
+from esipy.async_cache import AsyncRedisCache
+from esipy.cache import DictCache
+
+from .test_cache import BaseTest
+
+
+class SlowDictCache(DictCache):
+    """ DictCache with blocking I/O """
+
+    def get(self, key, default=None):
+        time.sleep(0.1)
+        return super(SlowDictCache, self).get(key, default)
+
+
+class AsyncBaseTest(BaseTest):
+
+    def setUp(self):
+        self.loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(self.loop)
+
+    def tearDown(self):
+        self.loop.close()
+        asyncio.set_event_loop(None)
+
+    def run_async(self, coro):
+        return self.loop.run_until_complete(coro)
+
+    def check_cache(self, cache):
+        self.run_async(cache.set(*self.ex_str))
+        self.run_async(cache.set(*self.ex_int))
+        self.run_async(cache.set(*self.ex_cpx))
+        self.assertEqual(self.run_async(cache.get(self.ex_str[0])),
+                         self.ex_str[1])
+        self.assertEqual(self.run_async(cache.get(self.ex_int[0])),
+                         self.ex_int[1])
+        self.check_complex(self.run_async(cache.get(self.ex_cpx[0])))
+
+        self.run_async(cache.invalidate(self.ex_str[0]))
+        self.assertIsNone(self.run_async(cache.get(self.ex_str[0])))
+        self.assertEqual(self.run_async(cache.get(self.ex_str[0], 'def')),
+                         'def')
+
+        self.run_async(cache.set_many([
+            self.ex_str + (300,),
+            self.ex_int + (None,),
+        ]))
+        values = self.run_async(cache.get_many(
+            [self.ex_str[0], 'missing', self.ex_int[0]],
+            'def'
+        ))
+        self.assertEqual(values, [self.ex_str[1], 'def', self.ex_int[1]])
+        self.assertEqual(self.run_async(cache.get_many([])), [])
+
+        self.run_async(cache.invalidate_many([
+            self.ex_str[0], self.ex_int[0], self.ex_cpx[0]
+        ]))
+        self.assertEqual(
+            self.run_async(cache.get_many(
+                [self.ex_str[0], self.ex_int[0], self.ex_cpx[0]]
+            )),
+            [None, None, None]
+        )
+
+
+class TestAsyncBaseCache(AsyncBaseTest):
+    """ AsyncBaseCache tests """
+
+    def test_base_cache_method(self):
+        cache = AsyncBaseCache()
+        self.assertRaises(NotImplementedError, self.run_async,
+                          cache.get('key'))
+        self.assertRaises(NotImplementedError, self.run_async,
+                          cache.set('key', 'val'))
+        self.assertRaises(NotImplementedError, self.run_async,
+                          cache.invalidate('key'))
+
+
+class TestAsyncDictCache(AsyncBaseTest):
+    """ AsyncDictCache tests """
+
+    def test_dict_cache(self):
+        self.check_cache(AsyncDictCache())
+
+    def test_dict_cache_shared(self):
+        dict_cache = DictCache()
+        cache = AsyncDictCache(dict_cache)
+        self.run_async(cache.set(*self.ex_str))
+        self.assertEqual(dict_cache.get(self.ex_str[0]), self.ex_str[1])
+
+
+class TestAsyncCacheAdapter(AsyncBaseTest):
+    """ AsyncCacheAdapter tests """
+
+    def test_adapter(self):
+        self.check_cache(AsyncCacheAdapter(DictCache()))
+
+    def test_adapter_executor(self):
+        executor = ThreadPoolExecutor(max_workers=1)
+        self.addCleanup(executor.shutdown)
+        cache = AsyncCacheAdapter(DictCache(), executor)
+        self.check_cache(cache)
+
+        threads = set()
+        cache.cache.get = lambda key, default=None: threads.add(
+            threading.current_thread()
+        )
+        self.run_async(cache.get('key'))
+        self.assertEqual(len(threads), 1)
+        self.assertIsNot(threads.pop(), threading.current_thread())
+
+    def test_adapter_does_not_block(self):
+        executor = ThreadPoolExecutor(max_workers=5)
+        self.addCleanup(executor.shutdown)
+        cache = AsyncCacheAdapter(SlowDictCache(), executor)
+
+        async def gets():
+            return await asyncio.gather(
+                *[cache.get('key', i) for i in range(5)]
+            )
+
+        start = time.time()
+        self.assertEqual(self.run_async(gets()), [0, 1, 2, 3, 4])
+        self.assertLess(time.time() - start, 0.4)
+
+
+class TestAsyncFileCache(AsyncBaseTest):
+    """ AsyncFileCache tests """
+
+    def setUp(self):
+        super(TestAsyncFileCache, self).setUp()
+        self.path = tempfile.mkdtemp()
+        self.c = AsyncFileCache(self.path)
+
+    def tearDown(self):
+        del self.c
+        shutil.rmtree(self.path)
+        super(TestAsyncFileCache, self).tearDown()
+
+    def test_file_cache(self):
+        self.check_cache(self.c)
+
+
+class TestAsyncRedisCache(AsyncBaseTest):
+    """ AsyncRedisCache tests """
+
+    def setUp(self):
+        # redis.asyncio requires redis >= 4.2, not available everywhere
+        try:
+            import redis.asyncio
+        except ImportError:
+            self.skipTest('redis.asyncio is not available')
+        self.redis = redis
+        super(TestAsyncRedisCache, self).setUp()
+        self.client = redis.asyncio.Redis(host='localhost', port=6379, db=0)
+        self.c = AsyncRedisCache(self.client)
+
+    def tearDown(self):
+        self.run_async(self.client.close())
+        super(TestAsyncRedisCache, self).tearDown()
+
+    def test_redis_cache(self):
+        self.check_cache(self.c)
+
+    def test_redis_instance(self):
+        with self.assertRaises(TypeError):
+            AsyncRedisCache(self.redis.Redis())
@@ -0,0 +1,57 @@
+# -*- encoding: utf-8 -*-
+# pylint: skip-file
+from __future__ import absolute_import
+
+import time
+import unittest
+
+from esipy.breaker import CircuitBreaker
+
+
+class TestCircuitBreaker(unittest.TestCase):
+
+    def setUp(self):
+        self.breaker = CircuitBreaker(
+            failure_threshold=3,
+            reset_timeout=0.2,
+            name='test'
+        )
+
+    def test_breaker_closed(self):
+        self.assertEqual(self.breaker.state, CircuitBreaker.CLOSED)
+        self.breaker.failure()
+        self.breaker.failure()
+        self.breaker.success()
+        self.breaker.failure()
+        self.breaker.failure()
+        self.assertTrue(self.breaker.allow())
+        self.assertEqual(self.breaker.state, CircuitBreaker.CLOSED)
+
+    def test_breaker_open(self):
+        for _ in range(3):
+            self.breaker.failure()
+        self.assertEqual(self.breaker.state, CircuitBreaker.OPEN)
+        self.assertFalse(self.breaker.allow())
+        self.assertEqual(self.breaker.stats['opened'], 1)
+        self.assertEqual(self.breaker.stats['rejected'], 1)
+
+    def test_breaker_half_open(self):
+        for _ in range(3):
+            self.breaker.failure()
+        time.sleep(0.2)
+        self.assertEqual(self.breaker.state, CircuitBreaker.HALF_OPEN)
+
+        # only one trial call
+        self.assertTrue(self.breaker.allow())
+        self.assertFalse(self.breaker.allow())
+
+        # trial failed, open again
+        self.breaker.failure()
+        self.assertEqual(self.breaker.state, CircuitBreaker.OPEN)
+        self.assertEqual(self.breaker.stats['opened'], 2)
+
+        time.sleep(0.2)
+        self.assertTrue(self.breaker.allow())
+        self.breaker.success()
+        self.assertEqual(self.breaker.state, CircuitBreaker.CLOSED)
+        self.assertTrue(self.breaker.allow())
@@ -3,19 +3,33 @@
 from __future__ import absolute_import
 
 import memcache
+import multiprocessing
+import os
+import pickle
 import redis
 import shutil
+import tempfile
+import threading
 import unittest
 import time
 
 from collections import namedtuple
 
 from esipy.cache import BaseCache
+from esipy.cache import BlobCache
 from esipy.cache import DictCache
 from esipy.cache import DummyCache
+from esipy.cache import FailSafeCache
 from esipy.cache import FileCache
 from esipy.cache import MemcachedCache
+from esipy.cache import QuotaCache
 from esipy.cache import RedisCache
+from esipy.cache import ShardedCache
+from esipy.cache import SharedMemoryCache
+from esipy.cache import SqliteCache
+from esipy.cache import TaggedCache
+from esipy.cache import WriteBehindCache
+from esipy.cache import _hash
 
 CachedResponse = namedtuple(
     'CachedResponse',
@@ -53,6 +67,24 @@ class BaseTest(unittest.TestCase):
         self.assertEqual(cplx.url, self.ex_cpx[1].url)
 
 
+class TestHash(unittest.TestCase):
+    """ cache key hash tests """
+
+    def test_hash_set_order(self):
+        # same content, different insertion order / hash seed
+        key_a = ('url', frozenset([('a', '1'), ('b', '2'), ('c', '3')]))
+        key_b = ('url', frozenset([('c', '3'), ('b', '2'), ('a', '1')]))
+        self.assertEqual(_hash(key_a), _hash(key_b))
+        self.assertEqual(_hash({'a': 1, 'b': 2}), _hash({'b': 2, 'a': 1}))
+        self.assertNotEqual(_hash(key_a), _hash(('url', frozenset())))
+
+    def test_hash_stable(self):
+        self.assertEqual(
+            _hash(('url', frozenset([('a', '1')]))),
+            'esi_2cabdb55045ad4855e972d2bc4afc99d'
+        )
+
+
 class TestBaseCache(BaseTest):
     """ BaseCache test class """
 
@@ -68,6 +100,78 @@ class TestBaseCache(BaseTest):
     def test_base_cache_invalidate(self):
         self.assertRaises(NotImplementedError, self.c.invalidate, 'key')
 
+    def test_base_cache_iter_items(self):
+        self.assertRaises(NotImplementedError, self.c.iter_items)
+
+
+class TestSnapshot(BaseTest):
+    """ Snapshot dump / load tests """
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.path = os.path.join(self.directory, 'snapshot')
+
+    def tearDown(self):
+        shutil.rmtree(self.directory, ignore_errors=True)
+
+    def fill(self, cache):
+        cache.set(self.ex_str[0], self.ex_str[1], expire=300)
+        cache.set(self.ex_int[0], self.ex_int[1], expire=0)
+        cache.set(self.ex_cpx[0], self.ex_cpx[1], expire=1)
+
+    def test_snapshot_dict_cache(self):
+        cache = DictCache()
+        self.fill(cache)
+        self.assertEqual(cache.dump_snapshot(self.path), 3)
+
+        loaded = DictCache()
+        self.assertEqual(loaded.load_snapshot(self.path, batch_size=2), 3)
+        self.assertEqual(loaded.get(self.ex_str[0]), self.ex_str[1])
+        self.assertEqual(loaded.get(self.ex_int[0]), self.ex_int[1])
+        self.check_complex(loaded.get(self.ex_cpx[0]))
+
+        # absolute expiry is kept
+        self.assertAlmostEqual(
+            loaded._expires[self.ex_str[0]],
+            cache._expires[self.ex_str[0]],
+            delta=1
+        )
+        self.assertNotIn(self.ex_int[0], loaded._expires)
+
+    def test_snapshot_skip_expired(self):
+        cache = DictCache()
+        self.fill(cache)
+        cache.dump_snapshot(self.path)
+        time.sleep(1.1)
+
+        loaded = DictCache()
+        self.assertEqual(loaded.load_snapshot(self.path), 2)
+        self.assertIsNone(loaded.get(self.ex_cpx[0]))
+
+        # expired entries are not dumped
+        self.assertEqual(cache.dump_snapshot(self.path), 2)
+
+    def test_snapshot_file_cache(self):
+        cache = FileCache(os.path.join(self.directory, 'filecache'))
+        self.fill(cache)
+        self.assertEqual(cache.dump_snapshot(self.path), 3)
+
+        loaded = SqliteCache(os.path.join(self.directory, 'cache.sqlite'))
+        self.assertEqual(loaded.load_snapshot(self.path), 3)
+        self.assertEqual(loaded.get(self.ex_str[0]), self.ex_str[1])
+        self.check_complex(loaded.get(self.ex_cpx[0]))
+
+        self.assertEqual(loaded.dump_snapshot(self.path), 3)
+        other = FileCache(os.path.join(self.directory, 'other'))
+        self.assertEqual(other.load_snapshot(self.path), 3)
+        self.assertEqual(other.get(self.ex_int[0]), self.ex_int[1])
+
+    def test_snapshot_invalid_file(self):
+        with open(self.path, 'wb') as snapshot:
+            snapshot.write(b'not a snapshot file')
+        with self.assertRaises(ValueError):
+            DictCache().load_snapshot(self.path)
+
 
 class TestDictCache(BaseTest):
     """ DictCache test class """
@@ -95,6 +199,16 @@ class TestDictCache(BaseTest):
         self.c.invalidate(self.ex_cpx[0])
         self.assertIsNone(self.c.get(self.ex_cpx[0]))
 
+    def test_dict_cache_many(self):
+        self.assertEqual(
+            self.c.get_many([self.ex_str[0], 'missing'], 'default'),
+            [self.ex_str[1], 'default']
+        )
+        self.c.set_many([('foo', 'bar', 10), ('baz', 'qux', None)])
+        self.assertEqual(self.c.get_many(['foo', 'baz']), ['bar', 'qux'])
+        self.c.invalidate_many(['foo', 'baz'])
+        self.assertEqual(self.c.get_many(['foo', 'baz']), [None, None])
+
     def test_dict_cache_clear(self):
         self.assertEqual(self.c._dict[self.ex_str[0]], self.ex_str[1])
         self.assertEqual(len(self.c._dict), 3)
@@ -158,6 +272,18 @@ class TestFileCache(BaseTest):
         self.c.invalidate('key')
         self.assertEqual(self.c.get('key'), None)
 
+    def test_file_cache_many(self):
+        self.c.set_many([self.ex_str + (300,), self.ex_cpx + (300,)])
+        values = self.c.get_many([self.ex_str[0], self.ex_cpx[0], 'none'])
+        self.assertEqual(values[0], self.ex_str[1])
+        self.check_complex(values[1])
+        self.assertIsNone(values[2])
+        self.c.invalidate_many([self.ex_str[0], self.ex_cpx[0]])
+        self.assertEqual(
+            self.c.get_many([self.ex_str[0], self.ex_cpx[0]]),
+            [None, None]
+        )
+
     def test_file_cache_expire(self):
         self.c.set('key', 'bar', expire=1)
         self.assertEqual(self.c.get('key'), 'bar')
@@ -215,6 +341,81 @@ class TestMemcachedCache(BaseTest):
         self.c.invalidate(self.ex_str[0])
         self.assertEqual(self.c.get(self.ex_str[0]), None)
 
+    def test_memcached_many(self):
+        self.c.set_many([self.ex_str + (300,), self.ex_cpx + (None,)])
+        values = self.c.get_many([self.ex_str[0], self.ex_cpx[0], 'none'])
+        self.assertEqual(values[0], self.ex_str[1])
+        self.check_complex(values[1])
+        self.assertIsNone(values[2])
+        self.c.invalidate_many([self.ex_str[0], self.ex_cpx[0]])
+        self.assertEqual(
+            self.c.get_many([self.ex_str[0], self.ex_cpx[0]]),
+            [None, None]
+        )
+
+    def test_memcached_large_value(self):
+        # bigger than the default 1MB memcached item size
+        large = CachedResponse(
+            status_code=200,
+            headers={'foo': 'bar'},
+            content=b'x' * (3 * 1024 * 1024),
+            url='http://example.com'
+        )
+        self.assertTrue(self.c.set(self.ex_cpx[0], large))
+        value = self.c.get(self.ex_cpx[0])
+        self.assertEqual(value.content, large.content)
+
+        # raw value is a manifest, not the value
+        raw = self.c._mc.get(_hash(self.ex_cpx[0]))
+        self.assertEqual(raw[0], MemcachedCache.CHUNKED)
+        self.assertEqual(raw[2], 4)
+
+        # missing chunk is a cache miss, never a partial value
+        self.c._mc.delete(self.c._chunk_keys(_hash(self.ex_cpx[0]), raw)[1])
+        self.assertIsNone(self.c.get(self.ex_cpx[0]))
+
+        self.c.set_many([(self.ex_cpx[0], large, 300), self.ex_str + (300,)])
+        values = self.c.get_many([self.ex_cpx[0], self.ex_str[0]])
+        self.assertEqual(values[0].content, large.content)
+        self.assertEqual(values[1], self.ex_str[1])
+
+    def test_memcached_large_value_chunks_deleted(self):
+        large = CachedResponse(
+            status_code=200,
+            headers={'foo': 'bar'},
+            content=b'x' * (3 * 1024 * 1024),
+            url='http://example.com'
+        )
+        hashed_key = _hash(self.ex_cpx[0])
+
+        # the chunks of the previous value are deleted on set...
+        self.c.set(self.ex_cpx[0], large)
+        chunk_keys = self.c._chunk_keys(
+            hashed_key,
+            self.c._mc.get(hashed_key)
+        )
+        self.c.set(self.ex_cpx[0], large)
+        self.assertEqual(self.c._mc.get_multi(chunk_keys), {})
+
+        # ... on set_many ...
+        chunk_keys = self.c._chunk_keys(
+            hashed_key,
+            self.c._mc.get(hashed_key)
+        )
+        self.c.set_many([self.ex_cpx + (300,)])
+        self.assertEqual(self.c._mc.get_multi(chunk_keys), {})
+        self.check_complex(self.c.get(self.ex_cpx[0]))
+
+        # ... and on invalidate
+        self.c.set(self.ex_cpx[0], large)
+        chunk_keys = self.c._chunk_keys(
+            hashed_key,
+            self.c._mc.get(hashed_key)
+        )
+        self.c.invalidate(self.ex_cpx[0])
+        self.assertEqual(self.c._mc.get_multi(chunk_keys), {})
+        self.assertIsNone(self.c.get(self.ex_cpx[0]))
+
     def test_memcached_invalid_argument(self):
         with self.assertRaises(TypeError):
             MemcachedCache(None)
@@ -275,6 +476,18 @@ class TestRedisCache(BaseTest):
         self.c.invalidate(self.ex_str[0])
         self.assertEqual(self.c.get(self.ex_str[0]), None)
 
+    def test_redis_many(self):
+        self.c.set_many([self.ex_str + (300,), self.ex_cpx + (None,)])
+        values = self.c.get_many([self.ex_str[0], self.ex_cpx[0], 'none'])
+        self.assertEqual(values[0], self.ex_str[1])
+        self.check_complex(values[1])
+        self.assertIsNone(values[2])
+        self.c.invalidate_many([self.ex_str[0], self.ex_cpx[0]])
+        self.assertEqual(
+            self.c.get_many([self.ex_str[0], self.ex_cpx[0]]),
+            [None, None]
+        )
+
     def test_redis_invalid_argument(self):
         with self.assertRaises(TypeError):
             RedisCache(None)
@@ -294,3 +507,787 @@ class TestRedisCache(BaseTest):
         self.assertEqual(self.c.get(self.ex_int[0]), self.ex_int[1])
         time.sleep(1)
         self.assertEqual(self.c.get(self.ex_int[0], None), self.ex_int[1])
+
+
+class BlockingCache(DictCache):
+    """ DictCache that blocks writes until released """
+
+    def __init__(self):
+        super(BlockingCache, self).__init__()
+        self.released = threading.Event()
+        self.set_many_calls = 0
+
+    def set_many(self, items):
+        self.released.wait()
+        self.set_many_calls += 1
+        super(BlockingCache, self).set_many(items)
+
+
+class TestWriteBehindCache(BaseTest):
+    """ WriteBehindCache tests """
+
+    def setUp(self):
+        self.backend = DictCache()
+        self.c = WriteBehindCache(self.backend, flush_interval=0)
+
+    def tearDown(self):
+        self.c.close()
+
+    def test_write_behind_invalid_argument(self):
+        with self.assertRaises(TypeError):
+            WriteBehindCache(None)
+
+    def test_write_behind_get_set(self):
+        self.c.set(*self.ex_str)
+        self.c.set(*self.ex_cpx)
+        self.assertEqual(self.c.get(self.ex_str[0]), self.ex_str[1])
+        self.assertTrue(self.c.flush(5))
+        self.assertEqual(self.backend.get(self.ex_str[0]), self.ex_str[1])
+        self.check_complex(self.backend.get(self.ex_cpx[0]))
+        self.check_complex(self.c.get(self.ex_cpx[0]))
+        self.assertEqual(self.c.stats['written'], 2)
+
+    def test_write_behind_invalidate(self):
+        self.c.set(*self.ex_str)
+        self.c.invalidate(self.ex_str[0])
+        self.assertIsNone(self.c.get(self.ex_str[0]))
+        self.c.flush(5)
+        self.assertIsNone(self.backend.get(self.ex_str[0]))
+
+    def test_write_behind_read_while_writing(self):
+        backend = BlockingCache()
+        cache = WriteBehindCache(backend, flush_interval=0)
+        backend.set('foo', 'old')
+
+        # the batch is being written: values still come from the cache
+        cache.set('foo', 'new')
+        while cache.stats['pending']:
+            time.sleep(0.01)
+        self.assertEqual(cache.get('foo'), 'new')
+
+        backend.released.set()
+        self.assertTrue(cache.flush(5))
+        self.assertEqual(cache._writing, {})
+        self.assertEqual(cache.get('foo'), 'new')
+        cache.close()
+
+    def test_write_behind_coalesce_and_drop(self):
+        backend = BlockingCache()
+        cache = WriteBehindCache(backend, max_queue=2, flush_interval=0)
+
+        # first write is taken by the worker, which blocks on it
+        cache.set('first', 1)
+        while cache.stats['pending']:
+            time.sleep(0.01)
+
+        cache.set('foo', 1)
+        cache.set('foo', 2)
+        cache.set('bar', 1)
+        cache.set('baz', 1)
+        self.assertEqual(cache.get('foo'), 2)
+
+        stats = cache.stats
+        self.assertEqual(stats['coalesced'], 1)
+        self.assertEqual(stats['dropped'], 1)
+        self.assertEqual(stats['pending'], 2)
+
+        backend.released.set()
+        cache.close()
+        self.assertEqual(backend.get_many(['first', 'foo', 'bar', 'baz']),
+                         [1, 2, 1, None])
+        self.assertEqual(backend.set_many_calls, 2)
+
+    def test_write_behind_closed(self):
+        self.c.close()
+        with self.assertRaises(RuntimeError):
+            self.c.set('foo', 'bar')
+
+
+class FailingCache(DictCache):
+    """ DictCache raising an error on every call when broken """
+
+    def __init__(self):
+        super(FailingCache, self).__init__()
+        self.broken = False
+
+    def get(self, key, default=None):
+        if self.broken:
+            raise IOError('broken')
+        return super(FailingCache, self).get(key, default)
+
+    def set(self, key, value, expire=300):
+        if self.broken:
+            raise IOError('broken')
+        super(FailingCache, self).set(key, value, expire)
+
+    def invalidate(self, key):
+        if self.broken:
+            raise IOError('broken')
+        super(FailingCache, self).invalidate(key)
+
+
+class PicklingCache(DictCache):
+    """ DictCache pickling the values, like remote caches """
+
+    def set(self, key, value, expire=300):
+        super(PicklingCache, self).set(key, pickle.dumps(value), expire)
+
+    def get(self, key, default=None):
+        value = super(PicklingCache, self).get(key, None)
+        return default if value is None else pickle.loads(value)
+
+
+class TestShardedCache(BaseTest):
+    """ ShardedCache tests """
+
+    def setUp(self):
+        self.nodes = dict(
+            ('node%d' % index, FailingCache()) for index in range(3)
+        )
+        self.c = ShardedCache(self.nodes)
+
+    def test_sharded_invalid_argument(self):
+        with self.assertRaises(ValueError):
+            ShardedCache([])
+        with self.assertRaises(TypeError):
+            ShardedCache([None])
+
+    def test_sharded_get_set_invalidate(self):
+        self.c.set(*self.ex_str)
+        self.c.set(*self.ex_cpx)
+        self.assertEqual(self.c.get(self.ex_str[0]), self.ex_str[1])
+        self.check_complex(self.c.get(self.ex_cpx[0]))
+
+        # key only exists in one node
+        stored = [
+            node for node in self.nodes.values()
+            if self.ex_str[0] in node._dict
+        ]
+        self.assertEqual(len(stored), 1)
+
+        self.c.invalidate(self.ex_str[0])
+        self.assertEqual(self.c.get(self.ex_str[0], 'default'), 'default')
+
+    def test_sharded_distribution(self):
+        keys = ['key%d' % index for index in range(300)]
+        self.c.set_many([(key, key, 300) for key in keys])
+        for node in self.nodes.values():
+            self.assertGreater(len(node._dict), 50)
+        self.assertEqual(self.c.get_many(keys + ['missing']),
+                         keys + [None])
+
+        self.c.invalidate_many(keys)
+        self.assertEqual(self.c.get_many(keys), [None] * len(keys))
+
+    def test_sharded_consistent(self):
+        keys = ['key%d' % index for index in range(300)]
+        self.c.set_many([(key, key, 300) for key in keys])
+
+        # removing a node only moves the keys of this node
+        del self.nodes['node0']
+        cache = ShardedCache(self.nodes)
+        values = cache.get_many(keys)
+        hits = len([value for value in values if value is not None])
+        self.assertEqual(
+            hits,
+            sum(len(node._dict) for node in self.nodes.values())
+        )
+
+    def test_sharded_node_failure(self):
+        keys = ['key%d' % index for index in range(100)]
+        self.c.set_many([(key, key, 300) for key in keys])
+
+        self.nodes['node1'].broken = True
+        lost = len(self.nodes['node1']._dict)
+        values = self.c.get_many(keys)
+        self.assertEqual(
+            len([value for value in values if value is None]),
+            lost
+        )
+        self.assertFalse(self.c.health['node1'])
+        self.assertTrue(self.c.health['node0'])
+
+        # writes go to the other nodes while node1 is down
+        self.c.set('foo', 'bar')
+        self.assertEqual(self.c.get('foo'), 'bar')
+        self.c.set_many([(key, key, 300) for key in keys])
+        self.assertEqual(self.c.get_many(keys), keys)
+
+    def test_sharded_value_error(self):
+        nodes = [PicklingCache() for _ in range(3)]
+        cache = ShardedCache(nodes)
+        cache.set('good', 'value')
+
+        # the value is the problem, not the node: no failover
+        with self.assertRaises(Exception):
+            cache.set('bad', lambda: None)
+        with self.assertRaises(Exception):
+            cache.set_many([('bad', lambda: None, 300)])
+        self.assertEqual(list(cache.health.values()), [True] * 3)
+        self.assertEqual(cache.get('good'), 'value')
+
+        # errors marking a node down can be changed
+        cache = ShardedCache(nodes, node_errors=(pickle.PicklingError,
+                                                 AttributeError))
+        cache.set('bad', lambda: None)
+        self.assertEqual(list(cache.health.values()), [False] * 3)
+        self.assertIsNone(cache.get('good'))
+
+    def test_sharded_all_down(self):
+        for node in self.nodes.values():
+            node.broken = True
+        self.c.set('foo', 'bar')
+        self.assertEqual(self.c.get('foo', 'default'), 'default')
+        self.assertEqual(self.c.get_many(['foo'], 'default'), ['default'])
+
+
+class SlowCache(DictCache):
+    """ DictCache that is slow to answer """
+
+    def get(self, key, default=None):
+        time.sleep(0.5)
+        return super(SlowCache, self).get(key, default)
+
+
+class TestFailSafeCache(BaseTest):
+    """ FailSafeCache tests """
+
+    def setUp(self):
+        self.backend = FailingCache()
+        self.c = FailSafeCache(
+            self.backend,
+            failure_threshold=2,
+            reset_timeout=0.2
+        )
+
+    def test_fail_safe_invalid_argument(self):
+        with self.assertRaises(TypeError):
+            FailSafeCache(None)
+
+    def test_fail_safe_get_set(self):
+        self.c.set(*self.ex_str)
+        self.c.set_many([self.ex_cpx + (300,)])
+        self.assertEqual(self.backend.get(self.ex_str[0]), self.ex_str[1])
+        self.assertEqual(self.c.get(self.ex_str[0]), self.ex_str[1])
+        self.check_complex(self.c.get_many([self.ex_cpx[0]])[0])
+        self.c.invalidate(self.ex_str[0])
+        self.c.invalidate_many([self.ex_cpx[0]])
+        self.assertEqual(self.backend._dict, {})
+        self.assertEqual(self.c.stats['state'], 'closed')
+
+    def test_fail_safe_backend_error(self):
+        self.backend.set(*self.ex_str)
+        self.backend.broken = True
+
+        # errors are not raised, fallback is used instead
+        self.assertIsNone(self.c.get(self.ex_str[0]))
+        self.c.set('foo', 'bar')
+        self.assertEqual(self.c.get('foo'), 'bar')
+        self.assertEqual(self.c.get_many(['foo']), ['bar'])
+
+        stats = self.c.stats
+        self.assertEqual(stats['errors'], 2)
+        self.assertEqual(stats['short_circuited'], 2)
+        self.assertEqual(stats['state'], 'open')
+
+        # backend is back after reset_timeout, fallback is cleared
+        self.backend.broken = False
+        time.sleep(0.2)
+        self.assertEqual(self.c.get(self.ex_str[0]), self.ex_str[1])
+        self.assertIsNone(self.c.get('foo'))
+        self.assertEqual(self.c.stats['state'], 'closed')
+
+    def test_fail_safe_replay_invalidations(self):
+        self.backend.set('foo', 'old')
+        self.backend.set('bar', 'old')
+        self.backend.set('baz', 'old')
+        self.backend.broken = True
+
+        # invalidations made while the backend fails are kept
+        self.c.invalidate('foo')
+        self.c.invalidate_many(['bar', 'baz'])
+        self.assertEqual(self.c.stats['state'], 'open')
+        self.assertEqual(self.c._invalidated, set(['foo', 'bar', 'baz']))
+
+        # and replayed when the backend is back
+        self.backend.broken = False
+        time.sleep(0.2)
+        self.assertIsNone(self.c.get('foo'))
+        self.assertIsNone(self.c.get('bar'))
+        self.assertEqual(self.backend._dict, {})
+        self.assertEqual(self.c._invalidated, set())
+        self.assertEqual(self.c.stats['state'], 'closed')
+
+        # a new value set in the backend is not invalidated again
+        self.backend.broken = True
+        self.c.invalidate('foo')
+        self.backend.broken = False
+        self.c.set('foo', 'new')
+        self.assertEqual(self.c._invalidated, set())
+        self.assertEqual(self.c.get('foo'), 'new')
+
+    def test_fail_safe_timeout(self):
+        cache = FailSafeCache(SlowCache(), timeout=0.05, failure_threshold=1)
+        start = time.time()
+        self.assertEqual(cache.get('foo', 'default'), 'default')
+        self.assertEqual(cache.get('foo', 'default'), 'default')
+        self.assertLess(time.time() - start, 0.4)
+        self.assertEqual(cache.stats['timeouts'], 1)
+        self.assertEqual(cache.stats['short_circuited'], 1)
+
+    def test_fail_safe_no_timeout(self):
+        cache = FailSafeCache(self.backend, timeout=None)
+        cache.set('foo', 'bar')
+        self.assertEqual(cache.get('foo'), 'bar')
+
+
+class TestTaggedCache(BaseTest):
+    """ TaggedCache tests """
+
+    def setUp(self):
+        self.backend = DictCache()
+        self.c = TaggedCache(self.backend)
+
+    def test_tagged_invalid_argument(self):
+        with self.assertRaises(TypeError):
+            TaggedCache(None)
+
+    def test_tagged_get_set(self):
+        self.c.set(*self.ex_str)
+        self.c.set(self.ex_cpx[0], self.ex_cpx[1], tags=['character_id:1'])
+        self.assertEqual(self.c.get(self.ex_str[0]), self.ex_str[1])
+        self.check_complex(self.c.get(self.ex_cpx[0]))
+        self.assertEqual(
+            self.c.get_many([self.ex_str[0], 'missing'], 'default'),
+            [self.ex_str[1], 'default']
+        )
+        self.c.invalidate(self.ex_cpx[0])
+        self.assertIsNone(self.c.get(self.ex_cpx[0]))
+
+    def test_tagged_invalidate_tag(self):
+        self.c.set('char1_assets', 'assets', tags=['character_id:1'])
+        self.c.set('char1_skills', 'skills', tags=['character_id:1', 'a'])
+        self.c.set('char2_assets', 'assets', tags=['character_id:2'])
+        self.c.set_many([('untagged', 'value', 300)])
+
+        self.c.invalidate_tag('character_id:1')
+        self.assertIsNone(self.c.get('char1_assets'))
+        self.assertEqual(
+            self.c.get_many(
+                ['char1_skills', 'char2_assets', 'untagged'],
+                'default'
+            ),
+            ['default', 'assets', 'value']
+        )
+
+        # new entries with the tag are valid again
+        self.c.set('char1_assets', 'new', tags=['character_id:1'])
+        self.assertEqual(self.c.get('char1_assets'), 'new')
+
+    def test_tagged_lost_generation(self):
+        # if the backend lost the generation, entries must be invalid
+        self.c.set('foo', 'bar', tags=['tag'])
+        self.backend.invalidate(TaggedCache._tag_key('tag'))
+        self.assertIsNone(self.c.get('foo'))
+        self.c.invalidate_many(['foo'])
+        self.assertNotIn('foo', self.backend._dict)
+
+
+def _shared_memory_writer(path):
+    """ set a value in a shared memory cache from another process """
+    SharedMemoryCache(path).set('from_child', 'hello')
+
+
+def _shared_memory_locker(cache, locked, acquired):
+    """ lock a shared memory cache created before the fork """
+    locked.wait(5)
+    with cache._locked(True):
+        acquired.put(time.time())
+
+
+def _shared_memory_fork_writer(cache, name):
+    """ set values in a shared memory cache created before the fork """
+    for index in range(200):
+        cache.set('%s-%d' % (name, index), '%s-%d' % (name, index) * 50)
+
+
+class TestSharedMemoryCache(BaseTest):
+    """ SharedMemoryCache tests """
+
+    def setUp(self):
+        self.path = os.path.join(tempfile.mkdtemp(), 'esipy-shm')
+        self.c = SharedMemoryCache(self.path, size=4096, index_slots=16)
+
+    def tearDown(self):
+        del self.c
+        shutil.rmtree(os.path.dirname(self.path), ignore_errors=True)
+
+    def test_shared_memory_get_set(self):
+        self.c.set(*self.ex_str)
+        self.c.set(*self.ex_int)
+        self.c.set(*self.ex_cpx)
+        self.assertEqual(self.c.get(self.ex_str[0]), self.ex_str[1])
+        self.assertEqual(self.c.get(self.ex_int[0]), self.ex_int[1])
+        self.check_complex(self.c.get(self.ex_cpx[0]))
+        self.assertEqual(self.c.get('missing', 'default'), 'default')
+
+    def test_shared_memory_update(self):
+        self.c.set(self.ex_str[0], 'first')
+        self.c.set(*self.ex_str)
+        self.assertEqual(self.c.get(self.ex_str[0]), self.ex_str[1])
+
+    def test_shared_memory_invalidate(self):
+        self.c.set(*self.ex_str)
+        self.c.invalidate(self.ex_str[0])
+        self.assertIsNone(self.c.get(self.ex_str[0]))
+        self.c.set(*self.ex_int)
+        self.c.clear()
+        self.assertIsNone(self.c.get(self.ex_int[0]))
+
+    def test_shared_memory_expire(self):
+        self.c.set('key', 'bar', expire=1)
+        self.c.set('foo', 'baz', expire=0)
+        self.assertEqual(self.c.get('key'), 'bar')
+        time.sleep(1)
+        self.assertIsNone(self.c.get('key'))
+        self.assertEqual(self.c.get('foo'), 'baz')
+
+    def test_shared_memory_budget(self):
+        # each value takes ~1kB, only the last ones stay in 4kB
+        for index in range(20):
+            self.c.set('key%d' % index, 'x' * 900)
+        self.assertIsNone(self.c.get('key0'))
+        self.assertEqual(self.c.get('key19'), 'x' * 900)
+        self.assertEqual(os.path.getsize(self.path),
+                         64 + 16 * SharedMemoryCache.ENTRY.size + 4096)
+
+        # too big to be stored
+        self.c.set('big', 'x' * 2000)
+        self.assertIsNone(self.c.get('big'))
+
+    def test_shared_memory_processes(self):
+        other = SharedMemoryCache(self.path, size=1, index_slots=1)
+        self.assertEqual(other.size, 4096)
+        other.set('foo', 'bar')
+        self.assertEqual(self.c.get('foo'), 'bar')
+
+        process = multiprocessing.Process(
+            target=_shared_memory_writer,
+            args=(self.path,)
+        )
+        process.start()
+        process.join()
+        self.assertEqual(self.c.get('from_child'), 'hello')
+
+    def test_shared_memory_fork_lock(self):
+        # the lock excludes processes forked after the cache creation
+        locked = multiprocessing.Event()
+        acquired = multiprocessing.Queue()
+        process = multiprocessing.get_context('fork').Process(
+            target=_shared_memory_locker,
+            args=(self.c, locked, acquired)
+        )
+        process.start()
+        with self.c._locked(True):
+            locked.set()
+            time.sleep(0.3)
+            released = time.time()
+        self.assertGreaterEqual(acquired.get(timeout=5), released)
+        process.join()
+
+    def test_shared_memory_fork_writers(self):
+        cache = SharedMemoryCache(
+            os.path.join(os.path.dirname(self.path), 'writers'),
+            size=4 * 1024 * 1024,
+            index_slots=65536
+        )
+        context = multiprocessing.get_context('fork')
+        processes = [
+            context.Process(
+                target=_shared_memory_fork_writer,
+                args=(cache, 'p%d' % number)
+            )
+            for number in range(4)
+        ]
+        for process in processes:
+            process.start()
+        for process in processes:
+            process.join()
+
+        for number in range(4):
+            for index in range(200):
+                key = 'p%d-%d' % (number, index)
+                self.assertEqual(cache.get(key), key * 50)
+
+    def test_shared_memory_invalid_value(self):
+        self.c.set('foo', 'bar')
+        start = self.c._data_offset
+        self.c._map[start:start + 8] = b'\0' * 8
+        self.assertEqual(self.c.get('foo', 'default'), 'default')
+
+    def test_shared_memory_invalid_file(self):
+        path = os.path.join(os.path.dirname(self.path), 'invalid')
+        with open(path, 'wb') as invalid:
+            invalid.write(b'x' * 1024)
+        with self.assertRaises(ValueError):
+            SharedMemoryCache(path)
+
+
+class TestSqliteCache(BaseTest):
+    """ SqliteCache tests """
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.path = os.path.join(self.directory, 'cache.sqlite')
+        self.c = SqliteCache(self.path)
+
+    def tearDown(self):
+        del self.c
+        shutil.rmtree(self.directory, ignore_errors=True)
+
+    def test_sqlite_get_set(self):
+        self.c.set(*self.ex_str)
+        self.c.set(*self.ex_int)
+        self.c.set(*self.ex_cpx)
+        self.assertEqual(self.c.get(self.ex_str[0]), self.ex_str[1])
+        self.assertEqual(self.c.get(self.ex_int[0]), self.ex_int[1])
+        self.check_complex(self.c.get(self.ex_cpx[0]))
+        self.assertEqual(self.c.get('missing', 'default'), 'default')
+
+        # other connection (process) sees the values
+        other = SqliteCache(self.path)
+        self.check_complex(other.get(self.ex_cpx[0]))
+
+    def test_sqlite_update(self):
+        self.c.set(self.ex_str[0], 'first')
+        self.c.set(*self.ex_str)
+        self.assertEqual(self.c.get(self.ex_str[0]), self.ex_str[1])
+
+    def test_sqlite_invalidate(self):
+        self.c.set_many([self.ex_str + (300,), self.ex_int + (300,)])
+        self.c.invalidate(self.ex_str[0])
+        self.assertEqual(
+            self.c.get_many([self.ex_str[0], self.ex_int[0]]),
+            [None, self.ex_int[1]]
+        )
+        self.c.invalidate_many([self.ex_int[0]])
+        self.assertIsNone(self.c.get(self.ex_int[0]))
+
+    def test_sqlite_expire(self):
+        self.c.set('key', 'bar', expire=1)
+        self.c.set('foo', 'baz', expire=0)
+        self.c.set('none', 'baz', expire=None)
+        self.assertEqual(self.c.get('key'), 'bar')
+        time.sleep(1)
+        self.assertIsNone(self.c.get('key'))
+        self.assertEqual(self.c.get_many(['foo', 'none']), ['baz', 'baz'])
+        self.assertEqual(self.c.purge_expired(), 1)
+        self.assertEqual(self.c.purge_expired(), 0)
+
+    def test_sqlite_batch(self):
+        cache = SqliteCache(self.path, batch_size=3, commit_interval=60)
+        other = SqliteCache(self.path)
+
+        cache.set('foo', 'bar')
+        cache.set('baz', 'qux')
+        # pending writes are readable, but not written yet
+        self.assertEqual(cache.get('foo'), 'bar')
+        self.assertIsNone(other.get('foo'))
+
+        cache.invalidate('baz')
+        cache.set('one', 1)
+        cache.set('two', 2)
+        self.assertEqual(other.get_many(['foo', 'baz', 'one', 'two']),
+                         ['bar', None, 1, 2])
+
+        cache.set('three', 3)
+        cache.flush()
+        self.assertEqual(other.get('three'), 3)
+
+    def test_sqlite_commit_interval(self):
+        cache = SqliteCache(self.path, batch_size=100, commit_interval=0.2)
+        other = SqliteCache(self.path)
+
+        # written by the timer, without another write
+        cache.set('foo', 'bar')
+        self.assertIsNone(other.get('foo'))
+        time.sleep(0.5)
+        self.assertEqual(other.get('foo'), 'bar')
+        self.assertEqual(cache._pending, {})
+
+
+class TestBlobCache(BaseTest):
+    """ BlobCache tests """
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.backend = DictCache()
+        self.c = BlobCache(self.backend, self.directory, threshold=1024)
+        self.large = CachedResponse(
+            status_code=200,
+            headers={'foo': 'bar'},
+            content=b'x' * 4096,
+            url='http://example.com'
+        )
+
+    def tearDown(self):
+        shutil.rmtree(self.directory, ignore_errors=True)
+
+    def test_blob_invalid_argument(self):
+        with self.assertRaises(TypeError):
+            BlobCache(None, self.directory)
+
+    def test_blob_small_value(self):
+        self.c.set(*self.ex_str)
+        self.c.set(*self.ex_cpx)
+        self.assertEqual(self.c.get(self.ex_str[0]), self.ex_str[1])
+        self.check_complex(self.c.get(self.ex_cpx[0]))
+        self.assertEqual(os.listdir(self.directory), [])
+
+    def test_blob_large_value(self):
+        self.c.set('key', self.large)
+        self.assertEqual(len(os.listdir(self.directory)), 1)
+
+        # only a reference is stored in the cache
+        self.assertNotIsInstance(self.backend.get('key').content, bytes)
+
+        value = self.c.get('key')
+        self.assertIsInstance(value.content, memoryview)
+        self.assertEqual(value.content, self.large.content)
+        self.assertEqual(value.headers, self.large.headers)
+        self.assertEqual(
+            self.c.get_many(['key', 'missing'])[0].content,
+            self.large.content
+        )
+
+        # new value replaces the file
+        self.c.set('key', self.large._replace(content=b'y' * 2048))
+        self.assertEqual(len(os.listdir(self.directory)), 1)
+        self.assertEqual(bytes(self.c.get('key').content), b'y' * 2048)
+
+        self.c.invalidate('key')
+        self.assertIsNone(self.c.get('key'))
+        self.assertEqual(os.listdir(self.directory), [])
+
+    def test_blob_missing_file(self):
+        self.c.set('key', self.large)
+        for filename in os.listdir(self.directory):
+            os.remove(os.path.join(self.directory, filename))
+        self.assertEqual(self.c.get('key', 'default'), 'default')
+
+    def test_blob_purge_expired(self):
+        self.c.set('key', self.large, expire=1)
+        self.c.set('other', self.large, expire=0)
+        self.assertEqual(self.c.purge_expired(), 0)
+        time.sleep(2)
+        self.assertEqual(self.c.purge_expired(), 1)
+        self.assertIsNone(self.c.get('key'))
+        self.assertEqual(self.c.get('other').content, self.large.content)
+
+
+class TestQuotaCache(BaseTest):
+    """ QuotaCache tests """
+
+    MARKET = '//esi.evetech.net/latest/markets/{region_id}/orders/'
+    CHARACTER = '//esi.evetech.net/latest/characters/{character_id}/'
+
+    def setUp(self):
+        self.backend = DictCache()
+        self.c = QuotaCache(
+            self.backend,
+            {
+                'markets': {
+                    'pattern': r'/markets/',
+                    'max_size': 3000,
+                    'priority': 0,
+                },
+                'characters': {
+                    'pattern': r'/characters/',
+                    'priority': 10,
+                },
+            },
+            max_size=5000
+        )
+
+    def key(self, route, index):
+        return (route, frozenset(), frozenset([('id', index)]), frozenset())
+
+    def value(self, size=400):
+        return CachedResponse(
+            status_code=200,
+            headers={},
+            content=b'x' * size,
+            url='http://example.com'
+        )
+
+    def test_quota_invalid_argument(self):
+        with self.assertRaises(TypeError):
+            QuotaCache(None, {})
+
+    def test_quota_group(self):
+        self.assertEqual(self.c.group(self.key(self.MARKET, 1)), 'markets')
+        self.assertEqual(
+            self.c.group(self.key(self.CHARACTER, 1)),
+            'characters'
+        )
+        self.assertEqual(self.c.group('other'), 'default')
+
+    def test_quota_get_set(self):
+        self.c.set(*self.ex_str)
+        self.c.set(*self.ex_cpx)
+        self.assertEqual(self.c.get(self.ex_str[0]), self.ex_str[1])
+        self.check_complex(self.c.get(self.ex_cpx[0]))
+        self.assertGreater(self.c.sizes['default'], 0)
+        self.c.invalidate(self.ex_str[0])
+        self.c.invalidate(self.ex_cpx[0])
+        self.assertIsNone(self.c.get(self.ex_cpx[0]))
+        self.assertEqual(self.c.sizes['default'], 0)
+
+    def test_quota_group_max_size(self):
+        # markets can't use more than 3000 bytes (3 * 912)
+        for index in range(5):
+            self.c.set(self.key(self.MARKET, index), self.value())
+        self.assertLessEqual(self.c.sizes['markets'], 3000)
+        self.assertIsNone(self.c.get(self.key(self.MARKET, 0)))
+        self.assertIsNone(self.c.get(self.key(self.MARKET, 1)))
+        self.assertIsNotNone(self.c.get(self.key(self.MARKET, 4)))
+        self.assertEqual(self.c.evictions['markets'], 2)
+        self.assertEqual(len(self.backend._dict), 3)
+
+        # too big for the quota
+        self.c.set(self.key(self.MARKET, 10), self.value(4000))
+        self.assertIsNone(self.c.get(self.key(self.MARKET, 10)))
+
+    def test_quota_priority(self):
+        for index in range(3):
+            self.c.set(self.key(self.CHARACTER, index), self.value())
+        for index in range(3):
+            self.c.set(self.key(self.MARKET, index), self.value())
+
+        # markets have lower priority: evicted first to fit max_size
+        for index in range(2):
+            self.c.set(self.key(self.CHARACTER, 10 + index), self.value())
+        self.assertLessEqual(sum(self.c.sizes.values()), 5000)
+        self.assertEqual(self.c.sizes['markets'], 0)
+        for index in range(3):
+            self.assertIsNotNone(self.c.get(self.key(self.CHARACTER, index)))
+
+    def test_quota_lru(self):
+        for index in range(3):
+            self.c.set(self.key(self.MARKET, index), self.value())
+        # use the first one, the second one is now the oldest
+        self.c.get(self.key(self.MARKET, 0))
+        self.c.set(self.key(self.MARKET, 3), self.value())
+        self.assertIsNotNone(self.c.get(self.key(self.MARKET, 0)))
+        self.assertIsNone(self.c.get(self.key(self.MARKET, 1)))
+
+    def test_quota_too_big_replace(self):
+        key = self.key(self.MARKET, 0)
+        self.c.set(key, self.value())
+        self.assertGreater(self.c.sizes['markets'], 0)
+
+        # the new value is too big: the old one is not used anymore
+        self.c.set(key, self.value(4000))
+        self.assertIsNone(self.c.get(key))
+        self.assertNotIn(key, self.backend._dict)
+        self.assertEqual(self.c.sizes['markets'], 0)
@@ -18,16 +18,34 @@ from esipy import App
 from esipy import EsiClient
 from esipy import EsiSecurity
 from esipy.cache import BaseCache
+from esipy.cache import BlobCache
 from esipy.cache import DictCache
 from esipy.cache import DummyCache
+from esipy.cache import TaggedCache
+from esipy.events import Signal
+from esipy.breaker import CircuitBreaker
 from esipy.exceptions import APIException
-
+from esipy.exceptions import CircuitOpenException
+from esipy.hedge import HedgePolicy
+from esipy.limiter import AdaptiveLimiter
+from esipy.retry import RetryPolicy
+from esipy.scheduler import Dispatcher
+from esipy.scheduler import PRIORITY_HIGH
+from esipy.stats import CacheStats
+from esipy.utils import make_cache_key
+import esipy.utils as utils
+
+from pyswagger.core import BaseClient
 from requests.adapters import HTTPAdapter
 from requests.exceptions import ConnectionError
 
 import httmock
 import mock
+import os
+import shutil
 import six
+import tempfile
+import threading
 import time
 import unittest
 import warnings
@@ -156,6 +174,76 @@ class TestEsiPy(unittest.TestCase):
                 60004756
             )
 
+    def test_esipy_cache_fast_path(self):
+        @httmock.all_requests
+        def fail_if_request(url, request):
+            self.fail('Cached data is not supposed to do requests')
+
+        operation = self.app.op['get_characters_character_id_location']
+        with httmock.HTTMock(*_all_auth_mock_):
+            self.security.auth('let it bee')
+            self.client.request(operation(character_id=123456789))
+
+        with mock.patch.object(
+                BaseClient,
+                'request',
+                autospec=True,
+                side_effect=BaseClient.request
+        ) as base_request:
+            # fresh hit: no request building at all
+            with httmock.HTTMock(fail_if_request):
+                char_location = self.client.request(
+                    operation(character_id=123456789)
+                )
+            self.assertEqual(char_location.data.station_id, 60004756)
+            self.assertEqual(base_request.call_count, 0)
+
+            # same key with a new operation and a reused one
+            req_and_resp = operation(character_id=123456789)
+            with httmock.HTTMock(fail_if_request):
+                self.client.request(req_and_resp)
+                self.client.request(req_and_resp)
+            self.assertEqual(base_request.call_count, 0)
+
+            # token to refresh: normal path, the security is applied
+            self.security.token_expiry = 0
+            with httmock.HTTMock(*_all_auth_mock_):
+                char_location = self.client.request(
+                    operation(character_id=123456789)
+                )
+            self.assertEqual(char_location.data.station_id, 60004756)
+            self.assertEqual(base_request.call_count, 1)
+
+            # not in cache: normal path
+            with httmock.HTTMock(*_all_auth_mock_):
+                self.client.request(operation(character_id=987654321))
+            self.assertEqual(base_request.call_count, 2)
+
+    def test_client_cache_tags(self):
+        cache = TaggedCache(DictCache())
+        client = EsiClient(self.security, cache=cache)
+        operation = self.app.op['get_characters_character_id_location'](
+            character_id=123456789
+        )
+
+        with httmock.HTTMock(*_all_auth_mock_):
+            self.security.auth('let it bee')
+            client.request(operation)
+
+        cached = [
+            value for value in cache._cache._dict.values()
+            if hasattr(value, 'tags')
+        ]
+        self.assertEqual(len(cached), 1)
+        self.assertEqual(
+            sorted(tag for tag, _ in cached[0].tags),
+            ['character_id:123456789',
+             'route:get_characters_character_id_location']
+        )
+
+        cache.invalidate_tag('character_id:123456789')
+        self.assertIsNone(cache.get(make_cache_key(operation[0])))
+
     def test_client_cache_request(self):
         @httmock.all_requests
         def fail_if_request(url, request):
@@ -179,6 +267,127 @@ class TestEsiPy(unittest.TestCase):
             incursions = self.client_no_auth.request(incursion_operation())
             self.assertEqual(incursions.data[0].state, 'mobilizing')
 
+    def test_client_permanent_operations(self):
+        @httmock.all_requests
+        def fail_if_request(url, request):
+            self.fail('Permanent data is not supposed to do requests')
+
+        permanent_cache = DictCache()
+        client = EsiClient(
+            cache=self.cache,
+            permanent_operations=['get_incursions'],
+            permanent_cache=permanent_cache
+        )
+        operation = self.app.op['get_incursions']
+
+        # response has no expires, but is stored anyway
+        with httmock.HTTMock(public_incursion_no_expires):
+            incursions = client.request(operation())
+            self.assertEqual(incursions.data[0].state, 'mobilizing')
+        self.assertEqual(len(permanent_cache._dict), 1)
+        self.assertEqual(self.cache._dict, {})
+
+        with httmock.HTTMock(fail_if_request):
+            incursions = client.request(operation())
+            self.assertEqual(incursions.data[0].state, 'mobilizing')
+
+        # new version, stored responses are not used anymore
+        client.permanent_operations['get_incursions'] = 2
+        with httmock.HTTMock(public_incursion_no_expires_second):
+            incursions = client.request(operation())
+            self.assertEqual(incursions.data[0].state, 'established')
+        self.assertEqual(len(permanent_cache._dict), 2)
+
+        # other operations use the normal cache
+        with httmock.HTTMock(eve_status):
+            client.request(self.app.op['get_status']())
+        self.assertEqual(len(self.cache._dict), 1)
+
+    def test_client_permanent_operations_post(self):
+        @httmock.all_requests
+        def universe_ids(url, request):
+            return httmock.response(
+                status_code=200,
+                content={'characters': [
+                    {'id': index, 'name': name}
+                    for index, name in enumerate(json.loads(request.body))
+                ]}
+            )
+
+        permanent_cache = DictCache()
+        client = EsiClient(
+            cache=self.cache,
+            permanent_operations=['post_universe_ids'],
+            permanent_cache=permanent_cache
+        )
+        operation = self.app.op['post_universe_ids']
+
+        # the body is not in the cache key: POST are never permanent
+        with httmock.HTTMock(universe_ids):
+            alice = client.request(operation(names=['Alice']))
+            bob = client.request(operation(names=['Bob']))
+        self.assertEqual(alice.data.characters[0].name, 'Alice')
+        self.assertEqual(bob.data.characters[0].name, 'Bob')
+        self.assertEqual(permanent_cache._dict, {})
+
+    def test_client_preload(self):
+        @httmock.all_requests
+        def fail_if_request(url, request):
+            self.fail('Preloaded data is not supposed to do requests')
+
+        dump_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, dump_dir)
+        dump = os.path.join(dump_dir, 'dump.jsonl')
+        with open(dump, 'w') as jsonl:
+            jsonl.write(json.dumps({
+                'operation': 'get_incursions',
+                'body': [{
+                    "type": "Incursion",
+                    "state": "mobilizing",
+                    "staging_solar_system_id": 30003893,
+                    "constellation_id": 20000568,
+                    "infested_solar_systems": [30003888],
+                    "has_boss": True,
+                    "faction_id": 500019,
+                    "influence": 1
+                }]
+            }) + '\n\n')
+            jsonl.write(json.dumps({
+                'operation': 'get_status',
+                'params': {'datasource': 'tranquility'},
+                'body': {
+                    "players": 29597,
+                    "server_version": "1313143",
+                    "start_time": "2018-05-20T11:04:30Z"
+                },
+                'expires': 60
+            }) + '\n')
+
+        permanent_cache = DictCache()
+        client = EsiClient(
+            cache=self.cache,
+            permanent_operations=['get_incursions'],
+            permanent_cache=permanent_cache
+        )
+        count = client.preload(
+            self.app,
+            utils.iter_jsonl(dump),
+            batch_size=1
+        )
+        self.assertEqual(count, 2)
+        self.assertEqual(len(permanent_cache._dict), 1)
+        self.assertEqual(len(self.cache._dict), 1)
+
+        with httmock.HTTMock(fail_if_request):
+            incursions = client.request(self.app.op['get_incursions']())
+            self.assertEqual(incursions.status, 200)
+            self.assertEqual(incursions.data[0].state, 'mobilizing')
+
+            status = client.request(
+                self.app.op['get_status'](datasource='tranquility')
+            )
+            self.assertEqual(status.data.players, 29597)
+
     def test_client_warning_header(self):
         # deprecated warning
         warnings.simplefilter('error')
@@ -206,6 +415,31 @@ class TestEsiPy(unittest.TestCase):
             )
             self.assertIsNotNone(incursions.data)
 
+    def test_client_blob_cache(self):
+        directory = tempfile.mkdtemp()
+        client = EsiClient(cache=BlobCache(DictCache(), directory, 10))
+        operation = self.app.op['get_incursions']
+
+        with httmock.HTTMock(public_incursion):
+            incursions = client.request(operation())
+
+        self.assertEqual(len(os.listdir(directory)), 1)
+
+        @httmock.all_requests
+        def fail_if_request(url, request):
+            self.fail('Cached data is not supposed to do requests')
+
+        with httmock.HTTMock(fail_if_request):
+            cached = client.request(operation())
+            self.assertEqual(cached.data[0].faction_id, 500019)
+
+            # buffers are given as is to raw body consumers
+            raw = client.request(operation(), raw_body_only=True)
+            self.assertIsInstance(raw.raw, memoryview)
+            self.assertEqual(raw.raw, incursions.raw)
+
+        shutil.rmtree(directory, ignore_errors=True)
+
     def test_esipy_reuse_operation(self):
         operation = self.app.op['get_incursions']()
         with httmock.HTTMock(public_incursion):
@@ -229,6 +463,293 @@ class TestEsiPy(unittest.TestCase):
             # Check we made 3 requests
             self.assertEqual(count, 3)
 
+    def test_esipy_multi_request_tenant(self):
+        tenants = []
+        dispatcher = Dispatcher(max_workers=2, tenant_max_running=1)
+        real_submit = dispatcher.submit
+
+        def submit(fn, priority, tenant):
+            tenants.append(tenant)
+            return real_submit(fn, priority, tenant)
+
+        dispatcher.submit = submit
+        client = EsiClient(self.security, dispatcher=dispatcher)
+        operation = self.app.op['get_characters_character_id_location']
+
+        with httmock.HTTMock(*_all_auth_mock_):
+            self.security.auth('let it bee')
+            results = client.multi_request(
+                [operation(character_id=char_id)
+                 for char_id in (123, 123, 456)],
+                tenant=utils.get_tenant
+            )
+        self.assertEqual(len(results), 3)
+        self.assertEqual(
+            sorted(tenants),
+            ['character_id:123', 'character_id:123', 'character_id:456']
+        )
+
+    def test_esipy_concurrency_limiter(self):
+        lock = threading.Lock()
+        concurrency = {'current': 0, 'max': 0}
+
+        @httmock.all_requests
+        def slow_incursions(url, request):
+            with lock:
+                concurrency['current'] += 1
+                concurrency['max'] = max(
+                    concurrency['max'], concurrency['current']
+                )
+            time.sleep(0.05)
+            with lock:
+                concurrency['current'] -= 1
+            return public_incursion(url, request)
+
+        limiter = AdaptiveLimiter(initial=1, max_limit=2)
+        client = EsiClient(cache=DummyCache(), concurrency_limiter=limiter)
+        operation = self.app.op['get_incursions']
+
+        with httmock.HTTMock(slow_incursions):
+            client.multi_request([operation() for _ in range(6)], threads=10)
+        self.assertEqual(concurrency['max'], 2)
+        self.assertEqual(limiter.limit, 2)
+        self.assertGreater(limiter.stats['increases'], 0)
+
+        with httmock.HTTMock(public_incursion_server_error):
+            client.request(operation())
+        self.assertEqual(limiter.stats['decreases'], 1)
+        self.assertEqual(limiter.limit, 1)
+
+        self.assertIsInstance(
+            EsiClient(concurrency_limiter=True).concurrency_limiter,
+            AdaptiveLimiter
+        )
+
+    def test_esipy_submit_priority(self):
+        calls = []
+
+        @httmock.all_requests
+        def record_calls(url, request):
+            calls.append(url.path.split('/')[-2])
+            if calls[-1] == 'status':
+                return eve_status(url, request)
+            return public_incursion(url, request)
+
+        dispatcher = Dispatcher(max_workers=1, reserved=0, aging=0)
+        client = EsiClient(cache=DummyCache(), dispatcher=dispatcher)
+        self.assertIs(client.dispatcher, dispatcher)
+
+        release = threading.Event()
+        dispatcher.submit(lambda: release.wait(5))
+
+        with httmock.HTTMock(record_calls):
+            background = client.submit(self.app.op['get_incursions']())
+            self.assertFalse(background.done())
+
+            # high priority batch goes first
+            results = []
+            batch = threading.Thread(target=lambda: results.extend(
+                client.multi_request(
+                    [self.app.op['get_status']()],
+                    priority=PRIORITY_HIGH
+                )
+            ))
+            batch.start()
+            time.sleep(0.1)
+            release.set()
+            batch.join(5)
+            incursions = background.result(timeout=5)
+
+        self.assertEqual(calls, ['status', 'incursions'])
+        self.assertEqual(results[0][1].data.players, 29597)
+        self.assertEqual(incursions.data[0].faction_id, 500019)
+
+    def test_esipy_multi_request_retry(self):
+        calls = []
+
+        @httmock.all_requests
+        def flaky_incursions(url, request):
+            calls.append(url.path)
+            if url.path.endswith('/incursions/'):
+                if calls.count(url.path) < 3:
+                    return httmock.response(
+                        status_code=502,
+                        content={'error': 'bad gateway'}
+                    )
+                return public_incursion(url, request)
+            return eve_status(url, request)
+
+        client = EsiClient(
+            retry_requests=RetryPolicy(backoff=0.2, jitter=False),
+            cache=DummyCache()
+        )
+        incursions = self.app.op['get_incursions']()
+        statuses = [self.app.op['get_status']() for _ in range(3)]
+
+        start = time.time()
+        with httmock.HTTMock(flaky_incursions):
+            results = client.multi_request([incursions] + statuses, threads=1)
+        duration = time.time() - start
+
+        # the single worker served other requests during the backoff
+        self.assertEqual(
+            [path.split('/')[-2] for path in calls],
+            ['incursions', 'status', 'status', 'status',
+             'incursions', 'incursions']
+        )
+        # 0.2 + 0.4s backoff
+        self.assertTrue(0.6 <= duration < 1.5)
+
+        # results are in the same order as the requests
+        self.assertEqual(len(results), 4)
+        self.assertIs(results[0][0], incursions[0])
+        self.assertEqual(results[0][1].status, 200)
+        self.assertEqual(results[0][1].data[0].faction_id, 500019)
+        for (req, res), status in zip(results[1:], statuses):
+            self.assertIs(req, status[0])
+            self.assertEqual(res.data.players, 29597)
+
+    def test_esipy_circuit_breaker(self):
+        @httmock.all_requests
+        def fail_if_request(url, request):
+            self.fail('Open circuit is not supposed to do requests')
+
+        client = EsiClient(
+            cache=DummyCache(),
+            circuit_breaker={'failure_threshold': 2, 'reset_timeout': 0.3}
+        )
+        operation = self.app.op['get_incursions']
+
+        with httmock.HTTMock(public_incursion_server_error):
+            self.assertEqual(client.request(operation()).status, 500)
+            self.assertEqual(client.request(operation()).status, 500)
+
+        with httmock.HTTMock(fail_if_request):
+            with self.assertRaises(CircuitOpenException) as context:
+                client.request(operation())
+            self.assertEqual(context.exception.status_code, 503)
+            self.assertEqual(
+                context.exception.operation_id,
+                'get_incursions'
+            )
+
+        # other routes are not affected
+        with httmock.HTTMock(eve_status):
+            status = client.request(self.app.op['get_status']())
+            self.assertEqual(status.status, 200)
+        self.assertEqual(
+            client.circuit_breakers['get_incursions'].state,
+            CircuitBreaker.OPEN
+        )
+
+        # half-open: one probe, closed on success
+        time.sleep(0.3)
+        with httmock.HTTMock(public_incursion):
+            self.assertEqual(client.request(operation()).status, 200)
+        self.assertEqual(
+            client.circuit_breakers['get_incursions'].state,
+            CircuitBreaker.CLOSED
+        )
+
+    def test_esipy_circuit_breaker_prepare_error(self):
+        @httmock.all_requests
+        def status_error(url, request):
+            return httmock.response(
+                status_code=502,
+                content={'error': 'bad gateway'}
+            )
+
+        client = EsiClient(
+            cache=DummyCache(),
+            circuit_breaker={'failure_threshold': 1, 'reset_timeout': 0}
+        )
+        operation = self.app.op['get_status']
+        with httmock.HTTMock(status_error):
+            client.request(operation())
+        breaker = client.circuit_breakers['get_status']
+        self.assertEqual(breaker.state, CircuitBreaker.HALF_OPEN)
+
+        # the half open trial fails before sending the request
+        prepare_request = client._session.prepare_request
+        client._session.prepare_request = mock.MagicMock(
+            side_effect=ValueError('invalid request')
+        )
+        with self.assertRaises(ValueError):
+            client.request(operation())
+
+        # the trial is not lost, the route can be called again
+        client._session.prepare_request = prepare_request
+        with httmock.HTTMock(eve_status):
+            status = client.request(operation())
+        self.assertEqual(status.status, 200)
+        self.assertEqual(breaker.state, CircuitBreaker.CLOSED)
+
+    def test_esipy_circuit_breaker_stale(self):
+        @httmock.all_requests
+        def status_error(url, request):
+            return httmock.response(
+                status_code=502,
+                content={'error': 'bad gateway'}
+            )
+
+        @httmock.all_requests
+        def fail_if_request(url, request):
+            self.fail('Open circuit is not supposed to do requests')
+
+        client = EsiClient(
+            cache=self.cache,
+            circuit_breaker={'failure_threshold': 2}
+        )
+        operation = self.app.op['get_status']
+
+        with httmock.HTTMock(eve_status):
+            client.request(operation())
+        time.sleep(2)
+
+        with httmock.HTTMock(status_error):
+            self.assertEqual(client.request(operation()).status, 502)
+            self.assertEqual(client.request(operation()).status, 502)
+
+        # expired data is returned instead of calling the broken route
+        with httmock.HTTMock(fail_if_request):
+            status = client.request(operation())
+            self.assertEqual(status.status, 200)
+            self.assertEqual(status.data.players, 29597)
+
+            client.circuit_breaker_stale = False
+            with self.assertRaises(CircuitOpenException):
+                client.request(operation())
+
+    def test_esipy_circuit_breaker_multi_request(self):
+        @httmock.all_requests
+        def status_error(url, request):
+            if url.path.endswith('/status/'):
+                return httmock.response(
+                    status_code=502,
+                    content={'error': 'bad gateway'}
+                )
+            return public_incursion(url, request)
+
+        client = EsiClient(
+            cache=DummyCache(),
+            circuit_breaker={'failure_threshold': 1}
+        )
+        with httmock.HTTMock(status_error):
+            client.request(self.app.op['get_status']())
+
+            # the open route does not abort the batch
+            results = client.multi_request([
+                self.app.op['get_status'](),
+                self.app.op['get_incursions'](),
+            ])
+        self.assertEqual(results[0][1].status, 503)
+        self.assertIn(
+            'Circuit open',
+            json.loads(results[0][1].raw.decode('utf-8'))['error']
+        )
+        self.assertEqual(results[1][1].status, 200)
+        self.assertEqual(results[1][1].data[0].faction_id, 500019)
+
     def test_esipy_backoff(self):
         operation = self.app.op['get_incursions']()
 
@@ -246,6 +767,171 @@ class TestEsiPy(unittest.TestCase):
         # Check that backoff slept for a sum > 2 seconds
         self.assertTrue(end_calls - start_calls > 2)
 
+    def test_esipy_retry_policy(self):
+        calls = []
+
+        @httmock.all_requests
+        def rate_limited(url, request):
+            calls.append(time.time())
+            if len(calls) < 3:
+                return httmock.response(
+                    status_code=429,
+                    headers={'Retry-After': '0'},
+                    content={'error': 'too many requests'}
+                )
+            return public_incursion(url, request)
+
+        events = []
+
+        def receiver(**kwargs):
+            events.append(kwargs)
+
+        signal = Signal()
+        signal.add_receiver(receiver)
+        client = EsiClient(
+            retry_requests=RetryPolicy(max_attempts=3),
+            signal_api_retry=signal,
+            cache=DummyCache()
+        )
+
+        with httmock.HTTMock(rate_limited):
+            incursions = client.request(self.app.op['get_incursions']())
+        self.assertEqual(incursions.status, 200)
+        self.assertEqual(len(calls), 3)
+        self.assertEqual(
+            [(e['attempt'], e['status_code'], e['delay']) for e in events],
+            [(1, 429, 0), (2, 429, 0)]
+        )
+        self.assertEqual(events[0]['operation_id'], 'get_incursions')
+
+        # last attempt, no more retry
+        del calls[:]
+        del events[:]
+        client.retry_policy.max_attempts = 2
+        with httmock.HTTMock(rate_limited):
+            incursions = client.request(self.app.op['get_incursions']())
+        self.assertEqual(incursions.status, 429)
+        self.assertEqual(len(calls), 2)
+        self.assertEqual([e['delay'] for e in events], [0, None])
+
+    def test_esipy_deadline(self):
+        calls = []
+
+        @httmock.all_requests
+        def bad_gateway(url, request):
+            calls.append(time.time())
+            return httmock.response(
+                status_code=502,
+                content={'error': 'bad gateway'}
+            )
+
+        client = EsiClient(
+            retry_requests=RetryPolicy(backoff=1, jitter=False),
+            cache=DummyCache()
+        )
+
+        # the backoff would end after the deadline: no retry
+        start = time.time()
+        with httmock.HTTMock(bad_gateway):
+            incursions = client.request(
+                self.app.op['get_incursions'](),
+                deadline=0.5
+            )
+        self.assertEqual(incursions.status, 502)
+        self.assertEqual(len(calls), 1)
+        self.assertLess(time.time() - start, 0.5)
+
+        # deadline already exceeded: no call
+        with httmock.HTTMock(bad_gateway):
+            incursions = client.request(
+                self.app.op['get_incursions'](),
+                deadline=0
+            )
+        self.assertEqual(incursions.status, 504)
+        self.assertEqual(
+            json.loads(incursions.raw.decode('utf-8')),
+            {'error': 'Deadline exceeded'}
+        )
+        self.assertEqual(len(calls), 1)
+
+        # the request timeout is reduced to the time left
+        client.timeout = (3, 10)
+        client._session.send = mock.MagicMock(
+            side_effect=ConnectionError
+        )
+        client.request(self.app.op['get_incursions'](), deadline=2)
+        _, kwargs = client._session.send.call_args_list[0]
+        connect, read = kwargs['timeout']
+        self.assertTrue(1 < connect <= 2)
+        self.assertTrue(1 < read <= 2)
+
+    def test_esipy_multi_request_deadline(self):
+        @httmock.all_requests
+        def slow_status(url, request):
+            if url.path.endswith('/status/'):
+                time.sleep(1)
+                return eve_status(url, request)
+            return public_incursion(url, request)
+
+        client = EsiClient(cache=DummyCache())
+        incursions = self.app.op['get_incursions']()
+        operations = [self.app.op['get_status'](), incursions]
+        operations += [self.app.op['get_status']() for _ in range(2)]
+
+        start = time.time()
+        with httmock.HTTMock(slow_status):
+            results = client.multi_request(
+                operations,
+                threads=2,
+                deadline=0.3
+            )
+        self.assertLess(time.time() - start, 0.8)
+
+        # running or waiting requests are cancelled
+        self.assertEqual(
+            [res.status for _, res in results],
+            [504, 200, 504, 504]
+        )
+        self.assertIs(results[1][0], incursions[0])
+        self.assertEqual(results[1][1].data[0].faction_id, 500019)
+        self.assertEqual(
+            json.loads(results[0][1].raw.decode('utf-8')),
+            {'error': 'Deadline exceeded'}
+        )
+
+    def test_esipy_hedging(self):
+        calls = []
+        lock = threading.Lock()
+
+        @httmock.all_requests
+        def slow_first(url, request):
+            with lock:
+                calls.append(url.path)
+                first = len(calls) == 1
+            if first:
+                time.sleep(1)
+            return public_incursion(url, request)
+
+        hedging = HedgePolicy(min_samples=1)
+        hedging.record('get_incursions', 0.05)
+        client = EsiClient(hedging=hedging, cache=DummyCache())
+
+        start = time.time()
+        with httmock.HTTMock(slow_first):
+            incursions = client.request(self.app.op['get_incursions']())
+        self.assertLess(time.time() - start, 0.8)
+        self.assertEqual(incursions.status, 200)
+        self.assertEqual(incursions.data[0].faction_id, 500019)
+        self.assertEqual(len(calls), 2)
+        self.assertEqual(hedging.stats['hedge_wins'], 1)
+
+        # only GET requests are hedged
+        self.assertIsInstance(EsiClient(hedging=True).hedging, HedgePolicy)
+        hedging.send = mock.MagicMock()
+        with httmock.HTTMock(public_incursion):
+            client.head(self.app.op['get_incursions']())
+        self.assertFalse(hedging.send.called)
+
     def test_esipy_timeout(self):
         def send_function(*args, **kwargs):
             """ manually create a ConnectionError to test the retry and be sure
@@ -341,6 +1027,90 @@ class TestEsiPy(unittest.TestCase):
             res = self.client.request(operation)
             self.assertEqual(res.data.server_version, "1313143")
 
+    def test_esipy_parsed_cache(self):
+        @httmock.all_requests
+        def not_modified(url, request):
+            return httmock.response(
+                headers={'Etag': '"esipy_test_etag_status"',
+                         'expires': make_expire_time_str(),
+                         'date': make_expire_time_str()},
+                status_code=304)
+
+        client = EsiClient(cache=self.cache, parsed_cache_size=1)
+        operation = self.app.op['get_status']
+
+        with httmock.HTTMock(eve_status):
+            first = client.request(operation())
+            second = client.request(operation())
+            self.assertEqual(second.data.server_version, "1313143")
+            self.assertIs(first.data, second.data)
+            self.assertEqual(second.status, 200)
+            self.assertEqual(second.raw, first.raw)
+
+            # raw_body_only responses are neither parsed nor cached
+            raw = client.request(operation(), raw_body_only=True)
+            self.assertIsNone(raw.data)
+
+        time.sleep(2)
+
+        # 304 revalidation reuses the parsed data
+        with httmock.HTTMock(not_modified):
+            third = client.request(operation())
+            self.assertIs(first.data, third.data)
+
+        # responses without ETag are not kept
+        with httmock.HTTMock(public_incursion):
+            client.request(self.app.op['get_incursions']())
+        self.assertEqual(list(client._parsed_cache.values()), [first.data])
+
+        # other keys evict the oldest entry
+        with httmock.HTTMock(eve_status):
+            fourth = client.request(operation(datasource='singularity'))
+        self.assertEqual(list(client._parsed_cache.values()), [fourth.data])
+        self.assertIsNot(first.data, fourth.data)
+
+    def test_esipy_cache_stats(self):
+        @httmock.all_requests
+        def not_modified(url, request):
+            return httmock.response(
+                headers={'Etag': '"esipy_test_etag_status"',
+                         'expires': make_expire_time_str(),
+                         'date': make_expire_time_str()},
+                status_code=304)
+
+        signal = Signal()
+        stats = CacheStats()
+        signal.add_receiver(stats)
+        client = EsiClient(cache=self.cache, signal_cache_stats=signal)
+        operation = self.app.op['get_status']()
+
+        with httmock.HTTMock(eve_status):
+            client.request(operation)
+        time.sleep(2)
+        with httmock.HTTMock(not_modified):
+            client.request(operation)
+            client.request(operation)
+        with httmock.HTTMock(post_universe_id):
+            client.request(self.app.op['post_universe_ids'](names=['Foo']))
+
+        snapshot = stats.snapshot()
+        status = snapshot[('get_status', 'DictCache')]
+        self.assertEqual(status['requests'], 3)
+        self.assertEqual(
+            dict((outcome, value['count'])
+                 for outcome, value in status['outcomes'].items()),
+            {'miss': 1, 'not_modified': 1, 'hit': 1}
+        )
+        self.assertAlmostEqual(status['hit_ratio'], 2.0 / 3)
+        self.assertGreater(status['bytes_stored'], 0)
+        # stored on miss and on 304 (updated expiry)
+        self.assertEqual(status['bytes_saved'], status['bytes_stored'])
+        self.assertIn('mean_time', status['outcomes']['hit'])
+
+        post = snapshot[('post_universe_ids', 'DictCache')]
+        self.assertEqual(list(post['outcomes']), ['uncached'])
+        self.assertEqual(post['bytes_stored'], 0)
+
     def test_esipy_expired_header_etag_no_body(self):
         # check that the response is empty with no_etag_body=True
         @httmock.all_requests
@@ -3,6 +3,7 @@
 import unittest
 
 from esipy.exceptions import APIException
+from esipy.exceptions import CircuitOpenException
 
 
 class TestApiException(unittest.TestCase):
@@ -28,3 +29,17 @@ class TestApiException(unittest.TestCase):
         self.assertIn(TestApiException.ERROR_RESPONSE['error'], str(e))
         self.assertEqual(e.request_param, TestApiException.PARAMS)
         self.assertEqual(e.response_header, TestApiException.HEADERS)
+
+    def test_circuit_open_exception(self):
+        e = CircuitOpenException(
+            TestApiException.URL,
+            'get_status',
+            request_param=TestApiException.PARAMS
+        )
+
+        self.assertIsInstance(e, APIException)
+        self.assertEqual(e.url, TestApiException.URL)
+        self.assertEqual(e.status_code, 503)
+        self.assertEqual(e.operation_id, 'get_status')
+        self.assertIn('get_status', str(e))
+        self.assertEqual(e.request_param, TestApiException.PARAMS)
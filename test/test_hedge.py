@@ -0,0 +1,130 @@
+# -*- encoding: utf-8 -*-
+# pylint: skip-file
+from __future__ import absolute_import
+
+import threading
+import time
+import unittest
+
+import mock
+
+from requests import Request
+
+from esipy.hedge import HedgePolicy
+from esipy.retry import RetryBudget
+
+
+class TestHedgePolicy(unittest.TestCase):
+
+    def setUp(self):
+        self.request = Request('GET', 'https://esi.evetech.net/').prepare()
+        self.lock = threading.Lock()
+        self.calls = []
+
+    def sender(self, *delays):
+        """ send function sleeping delays[n] for the n-th call, returning
+        a response mock named after the call number """
+        def send(request, **kwargs):
+            with self.lock:
+                number = len(self.calls)
+                self.calls.append(kwargs)
+            time.sleep(delays[number])
+            return mock.MagicMock(name='response%d' % number)
+        return send
+
+    def warm_up(self, policy, latency=0.02):
+        for _ in range(policy.min_samples):
+            policy.record('route', latency)
+
+    def test_delay_percentile(self):
+        policy = HedgePolicy(percentile=90, min_samples=5, min_delay=0.01)
+        self.assertIsNone(policy.get_delay('route'))
+
+        for latency in range(1, 11):
+            policy.record('route', latency / 10.)
+        self.assertEqual(policy.get_delay('route'), 1.0)
+        self.assertIsNone(policy.get_delay('other'))
+
+        policy.percentile = 50
+        self.assertEqual(policy.get_delay('route'), 0.6)
+
+        # only the last latencies are used
+        policy = HedgePolicy(min_samples=1, window=2, min_delay=0.5)
+        for latency in (10, 0.1, 0.2):
+            policy.record('route', latency)
+        self.assertEqual(policy.get_delay('route'), 0.5)
+
+    def test_no_hedge(self):
+        policy = HedgePolicy()
+
+        # not enough samples: sent directly, latency recorded
+        res = policy.send(self.sender(0), self.request, 'route', timeout=3)
+        self.assertEqual(res._mock_name, 'response0')
+        self.assertEqual(self.calls, [{'timeout': 3}])
+        self.assertEqual(len(policy._latencies['route']), 1)
+
+        # fast enough, no hedge
+        self.warm_up(policy, latency=0.5)
+        res = policy.send(self.sender(0, 0), self.request, 'route')
+        self.assertEqual(res._mock_name, 'response1')
+        self.assertEqual(policy.stats['hedged'], 0)
+        self.assertEqual(policy.stats['requests'], 2)
+
+    def test_hedge(self):
+        policy = HedgePolicy()
+        self.warm_up(policy)
+
+        start = time.time()
+        res = policy.send(self.sender(1, 0), self.request, 'route')
+        self.assertLess(time.time() - start, 0.5)
+        self.assertEqual(res._mock_name, 'response1')
+        self.assertEqual(len(self.calls), 2)
+        self.assertEqual(policy.stats['hedged'], 1)
+        self.assertEqual(policy.stats['hedge_wins'], 1)
+
+        # the first attempt wins if it ends first
+        del self.calls[:]
+        res = policy.send(self.sender(0.1, 1), self.request, 'route')
+        self.assertEqual(res._mock_name, 'response0')
+        self.assertEqual(policy.stats['hedged'], 2)
+        self.assertEqual(policy.stats['hedge_wins'], 1)
+
+    def test_hedge_error(self):
+        policy = HedgePolicy()
+        self.warm_up(policy)
+
+        def send(request, **kwargs):
+            with self.lock:
+                self.calls.append(kwargs)
+                first = len(self.calls) == 1
+            if first:
+                time.sleep(0.1)
+                raise ValueError('first failed')
+            time.sleep(0.2)
+            return 'second'
+
+        # the other request is used when one fails
+        self.assertEqual(policy.send(send, self.request, 'route'), 'second')
+
+        def fail(request, **kwargs):
+            time.sleep(0.1)
+            raise ValueError('failed')
+
+        with self.assertRaises(ValueError):
+            policy.send(fail, self.request, 'route')
+
+    def test_hedge_rate(self):
+        policy = HedgePolicy(
+            budget=RetryBudget(ratio=0, min_retries=1, window=10)
+        )
+        self.warm_up(policy)
+
+        policy.send(self.sender(0.2, 0), self.request, 'route')
+        self.assertEqual(len(self.calls), 2)
+
+        # budget used, the slow request is not hedged
+        del self.calls[:]
+        res = policy.send(self.sender(0.2, 0), self.request, 'route')
+        self.assertEqual(res._mock_name, 'response0')
+        self.assertEqual(len(self.calls), 1)
+        self.assertEqual(policy.stats['hedged'], 1)
@@ -0,0 +1,79 @@
+# -*- encoding: utf-8 -*-
+# pylint: skip-file
+from __future__ import absolute_import
+
+import time
+import unittest
+
+from esipy.limiter import AdaptiveLimiter
+
+
+class TestAdaptiveLimiter(unittest.TestCase):
+
+    def test_limiter_increase(self):
+        limiter = AdaptiveLimiter(initial=2, max_limit=4)
+        self.assertEqual(limiter.limit, 2)
+
+        # about +1 for each `limit` successes
+        for _ in range(3):
+            limiter.update(0.1, 200)
+        self.assertEqual(limiter.limit, 3)
+
+        for _ in range(50):
+            limiter.update(0.1, 200)
+        self.assertEqual(limiter.limit, 4)
+        self.assertEqual(limiter.snapshot()['limit'], 4)
+
+    def test_limiter_decrease_errors(self):
+        limiter = AdaptiveLimiter(initial=20, decrease=0.5, min_limit=2)
+        limiter.update(0.1, 502)
+        self.assertEqual(limiter.limit, 10)
+
+        # started before the decrease: same burst, ignored
+        limiter.update(0.5, 503)
+        self.assertEqual(limiter.limit, 10)
+
+        time.sleep(0.01)
+        limiter.update(0, 420)
+        self.assertEqual(limiter.limit, 5)
+
+        time.sleep(0.01)
+        limiter.update(0, 200, {'X-Esi-Error-Limit-Remain': '10'})
+        self.assertEqual(limiter.limit, 2)
+
+        time.sleep(0.01)
+        limiter.update(0, 500)
+        self.assertEqual(limiter.limit, 2)
+        self.assertEqual(limiter.stats['decreases'], 4)
+
+        # client errors and enough error limit are not overloads
+        limiter.update(0, 404, {'X-Esi-Error-Limit-Remain': '80'})
+        self.assertEqual(limiter.stats['decreases'], 4)
+        self.assertEqual(limiter.stats['increases'], 1)
+
+        # invalid error limit remain, ignored
+        limiter.update(0, 200, {'X-Esi-Error-Limit-Remain': 'n/a'})
+        self.assertEqual(limiter.stats['decreases'], 4)
+
+    def test_limiter_latency(self):
+        limiter = AdaptiveLimiter(initial=10, decrease=0.5,
+                                  latency_tolerance=3)
+        for _ in range(5):
+            limiter.update(0.1, 200)
+        self.assertEqual(limiter.stats['decreases'], 0)
+
+        for _ in range(10):
+            time.sleep(0.01)
+            limiter.update(0.005, 200)
+            limiter.update(1, 200)
+        self.assertGreater(limiter.stats['decreases'], 0)
+        self.assertLess(limiter.limit, 10)
+
+        snapshot = limiter.snapshot()
+        self.assertGreater(snapshot['latency'], snapshot['baseline'] * 3)
+
+        limiter = AdaptiveLimiter(initial=10, latency_tolerance=None)
+        limiter.update(0.01, 200)
+        for _ in range(10):
+            limiter.update(1, 200)
+        self.assertEqual(limiter.stats['decreases'], 0)
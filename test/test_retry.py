@@ -0,0 +1,124 @@
+# -*- encoding: utf-8 -*-
+# pylint: skip-file
+from __future__ import absolute_import
+
+import time
+import unittest
+
+from collections import namedtuple
+from email.utils import formatdate
+
+from esipy.retry import LegacyRetryPolicy
+from esipy.retry import RetryBudget
+from esipy.retry import RetryPolicy
+
+FakeResponse = namedtuple('FakeResponse', ['status', 'header'])
+
+
+def response(status, **headers):
+    return FakeResponse(
+        status,
+        dict((key.replace('_', '-'), [val]) for key, val in headers.items())
+    )
+
+
+class TestRetryPolicy(unittest.TestCase):
+
+    def test_legacy_policy(self):
+        policy = LegacyRetryPolicy()
+        delays = [policy.next_delay(i, response(502)) for i in range(1, 6)]
+        self.assertEqual(delays, [0.01, 0.16, 0.81, 2.56, None])
+        self.assertIsNone(policy.next_delay(1, response(420)))
+        self.assertIsNone(policy.next_delay(1, response(404)))
+        self.assertEqual(
+            policy.next_delay(1, response(503, Retry_After='10')),
+            0.01
+        )
+
+    def test_backoff_jitter(self):
+        policy = RetryPolicy(backoff=1, multiplier=2, max_backoff=5)
+        for attempt, limit in ((1, 1), (2, 2), (3, 4), (4, 5), (10, 5)):
+            for _ in range(20):
+                delay = policy.get_backoff(attempt)
+                self.assertTrue(0 <= delay <= limit)
+
+        policy.jitter = False
+        self.assertEqual(
+            [policy.get_backoff(i) for i in range(1, 5)],
+            [1, 2, 4, 5]
+        )
+
+    def test_retry_statuses(self):
+        policy = RetryPolicy(max_attempts=3, jitter=False)
+        self.assertEqual(policy.next_delay(1, response(500)), 0.1)
+        self.assertEqual(policy.next_delay(2, response(503)), 0.2)
+        self.assertIsNone(policy.next_delay(3, response(503)))
+        self.assertIsNone(policy.next_delay(1, response(400)))
+        self.assertIsNone(policy.next_delay(1, response(200)))
+
+        policy.retry_statuses = [404]
+        self.assertEqual(policy.next_delay(1, response(404)), 0.1)
+
+    def test_header_delay(self):
+        policy = RetryPolicy(max_retry_after=30)
+        self.assertEqual(
+            policy.next_delay(1, response(429, Retry_After='3')),
+            3
+        )
+        self.assertEqual(
+            policy.next_delay(1, response(420, X_Esi_Error_Limit_Reset='7')),
+            7
+        )
+        date = formatdate(time.time() + 10, usegmt=True)
+        delay = policy.next_delay(1, response(503, Retry_After=date))
+        self.assertTrue(8 <= delay <= 10)
+
+        # too long, no retry
+        self.assertIsNone(
+            policy.next_delay(1, response(429, Retry_After='120'))
+        )
+
+        # invalid header, backoff used
+        delay = policy.next_delay(1, response(503, Retry_After='soon'))
+        self.assertTrue(0 <= delay <= 0.1)
+        delay = policy.next_delay(
+            1, response(420, X_Esi_Error_Limit_Reset='soon')
+        )
+        self.assertTrue(0 <= delay <= 0.1)
+        self.assertIsNone(
+            policy.get_header_delay(response(420, X_Esi_Error_Limit_Reset=''))
+        )
+
+        policy.retry_after = False
+        delay = policy.next_delay(1, response(429, Retry_After='3'))
+        self.assertTrue(0 <= delay <= 0.1)
+
+
+class TestRetryBudget(unittest.TestCase):
+
+    def test_budget(self):
+        budget = RetryBudget(ratio=0.5, min_retries=1, window=0.2)
+        policy = RetryPolicy(budget=budget)
+
+        for _ in range(4):
+            policy.start()
+        # 1 + 0.5 * 4 retries allowed
+        delays = [policy.next_delay(1, response(500)) for _ in range(4)]
+        self.assertEqual([d is not None for d in delays],
+                         [True, True, True, False])
+
+        # new requests give more retries
+        policy.start()
+        policy.start()
+        self.assertIsNotNone(policy.next_delay(1, response(500)))
+
+        # window is over, only min_retries
+        time.sleep(0.3)
+        self.assertIsNotNone(policy.next_delay(1, response(500)))
+        self.assertIsNone(policy.next_delay(1, response(500)))
+
+    def test_budget_not_used(self):
+        budget = RetryBudget(ratio=0, min_retries=0)
+        policy = RetryPolicy(budget=budget)
+        self.assertIsNone(policy.next_delay(1, response(404)))
+        self.assertEqual(len(budget._retries), 0)
@@ -0,0 +1,171 @@
+# -*- encoding: utf-8 -*-
+# pylint: skip-file
+from __future__ import absolute_import
+
+import threading
+import time
+import unittest
+
+from esipy.scheduler import Dispatcher
+from esipy.scheduler import PRIORITY_HIGH
+from esipy.scheduler import PRIORITY_LOW
+from esipy.scheduler import PRIORITY_NORMAL
+
+
+class TestDispatcher(unittest.TestCase):
+
+    def setUp(self):
+        self.release = threading.Event()
+        self.started = threading.Event()
+        self.order = []
+
+    def tearDown(self):
+        self.release.set()
+
+    def blocking(self):
+        self.started.set()
+        self.release.wait(5)
+
+    def wait_started(self):
+        self.assertTrue(self.started.wait(5))
+
+    def record(self, name):
+        return lambda: self.order.append(name)
+
+    def wait_pending(self, dispatcher, count):
+        for _ in range(100):
+            if dispatcher.pending() == count:
+                return
+            time.sleep(0.01)
+        self.fail('pending tasks: %d' % dispatcher.pending())
+
+    def test_priority_order(self):
+        dispatcher = Dispatcher(max_workers=1, reserved=0, aging=0)
+        dispatcher.submit(self.blocking)
+        self.wait_started()
+
+        futures = [
+            dispatcher.submit(self.record('low1'), PRIORITY_LOW),
+            dispatcher.submit(self.record('normal'), PRIORITY_NORMAL),
+            dispatcher.submit(self.record('low2'), PRIORITY_LOW),
+            dispatcher.submit(self.record('high'), PRIORITY_HIGH),
+        ]
+        self.release.set()
+        for future in futures:
+            future.result(timeout=5)
+        self.assertEqual(self.order, ['high', 'normal', 'low1', 'low2'])
+        self.assertEqual(dispatcher.stats['submitted'], 5)
+
+    def test_reserved_workers(self):
+        # 2 workers for any task, 1 more for high priority tasks
+        dispatcher = Dispatcher(max_workers=2, reserved=1)
+        dispatcher.submit(self.blocking, PRIORITY_LOW)
+        dispatcher.submit(self.blocking, PRIORITY_NORMAL)
+        low = dispatcher.submit(self.record('low'), PRIORITY_LOW)
+        self.wait_pending(dispatcher, 1)
+        self.assertFalse(low.done())
+
+        # the reserved worker serves high priority
+        high = dispatcher.submit(self.record('high'), PRIORITY_HIGH)
+        high.result(timeout=1)
+        self.assertEqual(self.order, ['high'])
+        self.assertFalse(low.done())
+        self.assertEqual(dispatcher._workers, 3)
+
+        self.release.set()
+        low.result(timeout=5)
+        self.assertEqual(self.order, ['high', 'low'])
+
+    def test_aging(self):
+        dispatcher = Dispatcher(max_workers=1, reserved=0, aging=10)
+        dispatcher.submit(self.blocking)
+        self.wait_started()
+
+        low = dispatcher.submit(self.record('low'), PRIORITY_LOW)
+        high = dispatcher.submit(self.record('high'), PRIORITY_HIGH)
+        # the low task has been waiting for 3 aging periods
+        with dispatcher._cond:
+            for task in dispatcher._queues[PRIORITY_LOW]:
+                task.enqueued -= 30
+        self.release.set()
+        low.result(timeout=5)
+        high.result(timeout=5)
+        self.assertEqual(self.order, ['low', 'high'])
+
+    def test_exception(self):
+        dispatcher = Dispatcher(max_workers=1)
+
+        def fail():
+            raise ValueError('fail')
+
+        with self.assertRaises(ValueError):
+            dispatcher.submit(fail).result(timeout=5)
+        self.assertEqual(dispatcher.submit(lambda: 42).result(timeout=5), 42)
+
+    def test_shutdown(self):
+        dispatcher = Dispatcher(max_workers=1)
+        dispatcher.submit(self.blocking)
+        self.wait_started()
+        pending = dispatcher.submit(self.record('pending'))
+
+        threading.Timer(0.1, self.release.set).start()
+        dispatcher.shutdown()
+        self.assertTrue(pending.cancelled())
+        self.assertEqual(self.order, [])
+        self.assertEqual(dispatcher._workers, 0)
+        with self.assertRaises(RuntimeError):
+            dispatcher.submit(self.blocking)
+
+    def test_idle_workers(self):
+        dispatcher = Dispatcher(max_workers=4, idle_timeout=0.1)
+        futures = [dispatcher.submit(lambda: time.sleep(0.05))
+                   for _ in range(4)]
+        for future in futures:
+            future.result(timeout=5)
+        self.assertTrue(1 <= dispatcher._workers <= 4)
+        time.sleep(0.3)
+        self.assertEqual(dispatcher._workers, 0)
+
+        # new workers are started when required
+        self.assertEqual(dispatcher.submit(lambda: 1).result(timeout=5), 1)
+
+    def test_tenant_round_robin(self):
+        dispatcher = Dispatcher(
+            max_workers=1,
+            reserved=0,
+            tenant_weights={'big': 2}
+        )
+        dispatcher.submit(self.blocking)
+        self.wait_started()
+
+        futures = [dispatcher.submit(self.record('big'), tenant='big')
+                   for _ in range(6)]
+        futures += [dispatcher.submit(self.record('small'), tenant='small')
+                    for _ in range(3)]
+        self.release.set()
+        for future in futures:
+            future.result(timeout=5)
+
+        # small tenant is not waiting for all the big tenant requests
+        self.assertEqual(
+            self.order,
+            ['big', 'small', 'big'] * 3
+        )
+
+    def test_tenant_max_running(self):
+        dispatcher = Dispatcher(max_workers=3, reserved=0,
+                                tenant_max_running=1)
+        first = dispatcher.submit(self.blocking, tenant='big')
+        second = dispatcher.submit(self.record('big'), tenant='big')
+        self.wait_pending(dispatcher, 1)
+
+        small = dispatcher.submit(self.record('small'), tenant='small')
+        small.result(timeout=1)
+        untagged = dispatcher.submit(self.record('untagged'))
+        untagged.result(timeout=1)
+        self.assertFalse(second.done())
+
+        self.release.set()
+        first.result(timeout=5)
+        second.result(timeout=5)
+        self.assertEqual(self.order, ['small', 'untagged', 'big'])
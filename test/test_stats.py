@@ -0,0 +1,43 @@
+# -*- encoding: utf-8 -*-
+# pylint: skip-file
+from __future__ import absolute_import
+
+import unittest
+
+from esipy.stats import CacheStats
+
+
+class TestCacheStats(unittest.TestCase):
+
+    def setUp(self):
+        self.stats = CacheStats()
+
+    def test_cache_stats(self):
+        self.stats(operation_id='op', backend='DictCache', outcome='miss',
+                   elapsed_time=0.5, bytes_stored=100)
+        self.stats(operation_id='op', backend='DictCache', outcome='hit',
+                   elapsed_time=0.1, bytes_saved=100)
+        self.stats(operation_id='op', backend='DictCache', outcome='hit',
+                   elapsed_time=0.3, bytes_saved=100)
+        self.stats(operation_id='op', backend='RedisCache', outcome='miss',
+                   elapsed_time=0.5)
+
+        snapshot = self.stats.snapshot()
+        self.assertEqual(len(snapshot), 2)
+
+        stats = snapshot[('op', 'DictCache')]
+        self.assertEqual(stats['requests'], 3)
+        self.assertAlmostEqual(stats['hit_ratio'], 2.0 / 3)
+        self.assertEqual(stats['bytes_saved'], 200)
+        self.assertEqual(stats['bytes_stored'], 100)
+        self.assertEqual(stats['outcomes']['hit']['count'], 2)
+        self.assertAlmostEqual(stats['outcomes']['hit']['mean_time'], 0.2)
+        self.assertAlmostEqual(stats['outcomes']['hit']['max_time'], 0.3)
+
+        self.assertEqual(snapshot[('op', 'RedisCache')]['hit_ratio'], 0)
+
+    def test_cache_stats_reset(self):
+        self.stats(operation_id='op', backend='DictCache', outcome='miss',
+                   elapsed_time=0.5)
+        self.stats.reset()
+        self.assertEqual(self.stats.snapshot(), {})
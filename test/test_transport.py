@@ -0,0 +1,154 @@
+# -*- encoding: utf-8 -*-
+# pylint: skip-file
+from __future__ import absolute_import
+
+import json
+import mock
+import unittest
+import warnings
+
+from requests import Request
+from requests.exceptions import ConnectionError
+from requests.exceptions import ConnectTimeout
+from requests.exceptions import ReadTimeout
+
+from esipy import App
+from esipy import EsiClient
+from esipy.cache import DictCache
+from esipy.events import Signal
+from esipy.transport import Http2Adapter
+
+from .mock import make_expire_time_str
+
+try:
+    import httpx
+except ImportError:  # pragma: no cover
+    httpx = None
+
+INCURSIONS = [{
+    "type": "Incursion",
+    "state": "mobilizing",
+    "staging_solar_system_id": 30003893,
+    "constellation_id": 20000568,
+    "infested_solar_systems": [30003888],
+    "has_boss": True,
+    "faction_id": 500019,
+    "influence": 1
+}]
+
+
+@unittest.skipIf(httpx is None, 'httpx is not installed')
+class TestHttp2Adapter(unittest.TestCase):
+
+    @mock.patch('six.moves.urllib.request.urlopen')
+    def setUp(self, urlopen_mock):
+        urlopen_mock.return_value = open('test/resources/swagger.json')
+        warnings.simplefilter('ignore')
+        self.app = App.create(
+            'https://esi.evetech.net/latest/swagger.json'
+        )
+        self.requests = []
+
+    def adapter(self, handler):
+        def record(request):
+            self.requests.append(request)
+            return handler(request)
+        return Http2Adapter(
+            client=httpx.Client(transport=httpx.MockTransport(record))
+        )
+
+    def test_default_client(self):
+        adapter = Http2Adapter()
+        self.assertIsInstance(adapter.client, httpx.Client)
+        adapter.close()
+        self.assertTrue(adapter.client.is_closed)
+
+    def test_timeout(self):
+        adapter = self.adapter(None)
+        timeout = adapter._get_timeout((3, 10))
+        self.assertEqual((timeout.connect, timeout.read), (3, 10))
+        timeout = adapter._get_timeout(5)
+        self.assertEqual((timeout.connect, timeout.read), (5, 5))
+        self.assertIsNone(adapter._get_timeout(None).read)
+
+    def test_client_request(self):
+        def incursions(request):
+            if request.headers.get('If-None-Match') == '"etag"':
+                return httpx.Response(
+                    304,
+                    headers={'ETag': '"etag"',
+                             'Expires': make_expire_time_str()}
+                )
+            return httpx.Response(
+                200,
+                headers={'ETag': '"etag"',
+                         'Expires': make_expire_time_str()},
+                json=INCURSIONS
+            )
+
+        stats = []
+        signal = Signal()
+        signal.add_receiver(lambda **kwargs: stats.append(kwargs))
+        cache = DictCache()
+        client = EsiClient(
+            transport_adapter=self.adapter(incursions),
+            cache=cache,
+            signal_api_call_stats=signal,
+        )
+
+        response = client.request(self.app.op['get_incursions']())
+        self.assertEqual(response.status, 200)
+        self.assertEqual(response.data[0].faction_id, 500019)
+        self.assertEqual(response.header['ETag'], ['"etag"'])
+        self.assertEqual(
+            str(self.requests[0].url),
+            'https://esi.evetech.net/latest/incursions/?datasource=tranquility'
+        )
+        self.assertIn('EsiPy', self.requests[0].headers['User-Agent'])
+
+        # fresh: no request
+        client.request(self.app.op['get_incursions']())
+        self.assertEqual(len(self.requests), 1)
+
+        # expired: revalidated with the ETag, cached content returned
+        for cached in cache._dict.values():
+            cached.headers['Expires'] = make_expire_time_str(-60)
+        response = client.request(self.app.op['get_incursions']())
+        self.assertEqual(len(self.requests), 2)
+        self.assertEqual(self.requests[1].headers['If-None-Match'], '"etag"')
+        self.assertEqual(response.status, 200)
+        self.assertEqual(response.data[0].faction_id, 500019)
+        self.assertEqual([s['status_code'] for s in stats], [200, 304])
+
+    def test_response(self):
+        adapter = self.adapter(
+            lambda request: httpx.Response(200, json=INCURSIONS)
+        )
+        request = Request('GET', 'https://esi.evetech.net/').prepare()
+        response = adapter.send(request)
+        response.close()
+        with response:
+            self.assertEqual(response.json(), INCURSIONS)
+
+    def test_errors(self):
+        def fail(exception):
+            def handler(request):
+                raise exception('fail', request=request)
+            return handler
+
+        for exception, expected in (
+                (httpx.ConnectTimeout, ConnectTimeout),
+                (httpx.ReadTimeout, ReadTimeout),
+                (httpx.ConnectError, ConnectionError)):
+            adapter = self.adapter(fail(exception))
+            request = Request('GET', 'https://esi.evetech.net/').prepare()
+            with self.assertRaises(expected):
+                adapter.send(request)
+
+        # the client gets a fake 500 response, as with requests
+        client = EsiClient(
+            transport_adapter=self.adapter(fail(httpx.ConnectError))
+        )
+        response = client.request(self.app.op['get_incursions']())
+        self.assertEqual(response.status, 500)
+        self.assertIn('error', json.loads(response.raw.decode('utf-8')))
@@ -25,3 +25,28 @@ class TestUtils(unittest.TestCase):
 
         code_challenge = utils.generate_code_challenge(CODE_VERIFIER)
         self.assertEqual(code_challenge, EXP_CODE_CHALLENGE)
+
+    def test_get_tenant(self):
+        class FakeRequest(object):
+            def __init__(self, path):
+                self._p = {'path': path}
+
+        self.assertEqual(
+            utils.get_tenant((FakeRequest({'character_id': '123'}), None)),
+            'character_id:123'
+        )
+        self.assertEqual(
+            utils.get_tenant((FakeRequest({
+                'structure_id': '1',
+                'corporation_id': '456'
+            }), None)),
+            'corporation_id:456'
+        )
+        self.assertIsNone(utils.get_tenant((FakeRequest({}), None)))
+        self.assertEqual(
+            utils.get_tenant(
+                (FakeRequest({'structure_id': '1'}), None),
+                params=['structure_id']
+            ),
+            'structure_id:1'
+        )